@@ -3,9 +3,150 @@ Tools for common os-related tasks.
 
 Many of these can be called from the command line,
 so it is a good idea to include this directory in your path.
+
+Submodules are loaded lazily, the first time one of their names
+is used, so "import osTools" is cheap and platform-specific
+modules are only loaded if you actually use them.
 """
-from .env import *
-from .hr import *
-from .ln import *
-from .ps import *
-from .whoLockedFile import *
\ No newline at end of file
+import typing
+import sys
+import types
+import importlib
+
+if typing.TYPE_CHECKING:
+    from .env import *
+    from .hr import *
+    from .ln import *
+    from .ps import *
+    from .whoLockedFile import *
+
+
+# the names that "from submodule import *" used to give us, by submodule
+# (where a name is in more than one, the last one wins, the same
+# as the star imports this replaces)
+#
+# This is a fixed table rather than something worked out at runtime
+# so that using a name costs no more than importing its submodule.
+# tests/test_init.py checks it against the submodules themselves.
+_starNames:typing.Tuple[typing.Tuple[str,typing.Tuple[str,...]],...]=(
+    ('env',(
+        'EnvironmentDiff','EnvironmentSnapshot','EnvironmentVariables',
+        'Iterable','Mapping','PathList','benchmark','dataclass','diff','env',
+        'environmentVariables','field','which')),
+    ('hr',(
+        'hr',)),
+    ('ln',(
+        'CircularLinkError','LinkRecord','auditLinks','cmdline','linkHop',
+        'linkTarget','linkTargets','ln','replaceLinks','retargetLinks',
+        'unlink')),
+    ('ps',(
+        'AsyncPsCommand','CmdCompatible','PsDataResult','PsTableLayout',
+        'PsTableLines','benchmark','cmdline','normalizeCommand',
+        'psColonListDissect','psColonListDissectIter','psCommand',
+        'psCommandAsync','psCommandWithColonListOutput',
+        'psCommandWithColonListOutputAsync','psCommandWithColonListRecords',
+        'psCommandWithCsvOutput','psCommandWithJsonOutput',
+        'psCommandWithStructuredOutput','psCommandWithTableOutput',
+        'psCommandWithTableOutputAsync','psCsvDissectIter','psGather',
+        'psGatherAsync','psJsonDissectIter','psShellCommand',
+        'psStructuredCommand','psTableDissect','psTableDissectColumns',
+        'psTableDissectIter','psTableHeader','psTypedValue','resultCache',
+        'setResultCache','setWorkerPool','workerPool')),
+    ('whoLockedFile',(
+        'CCH_RM_MAX_APP_NAME','CCH_RM_MAX_SVC_NAME','CCH_RM_SESSION_KEY',
+        'ERROR_ACCESS_DENIED','ERROR_MORE_DATA','FILETIME','LockEvent',
+        'LockHolder','LockWatcher','ProcProcessTable','ProcessInfo',
+        'ProcessRecord','ProcessTable','RM_APP_TYPE','RM_PROCESS_INFO',
+        'RM_PROCESS_INFO_p','RM_UNIQUE_PROCESS','RestartManager',
+        'WINDOWS_TICKS','WindowsProcessTable','WindowsRestartManager',
+        'cmdline','dataclass','field','filetimeToPosix','getProcessTable',
+        'getRestartManager','getRstrtmgr','hasWindowsTools','lockedFiles',
+        'posixToFiletime','procOpenFiles','processLockingFile','processTable',
+        'setProcessTable','setRestartManager','sharedRestartManager')))
+
+_submodules=('env','envPermanent','fileIndex','fileIndexWatcher','filetime',
+    'hr','ln','misc','openEditor','progress','ps','psCache','psPool',
+    'py_everything','shellLink','whoLockedFile','windowsNamedPipes',
+    'winsensors')
+
+# {name:submodule}
+_lazyNames:typing.Dict[str,str]={name:moduleName
+    for moduleName,names in _starNames for name in names}
+
+
+class _Package(types.ModuleType):
+    """
+    Some submodules have a function (or object) of the same name
+    (eg "ln" or "hr").  Importing a submodule makes it an attribute of
+    the package, which would hide the function, so keep the function.
+    """
+
+    def __setattr__(self,name:str,value:typing.Any):
+        if isinstance(value,types.ModuleType) \
+            and value.__name__==f'{self.__name__}.{name}' \
+            and _lazyNames.get(name)==name:
+            #
+            value=getattr(value,name)
+        super().__setattr__(name,value)
+
+
+sys.modules[__name__].__class__=_Package
+
+
+def __getattr__(name:str)->typing.Any:
+    if name=='__all__':
+        return sorted(_lazyNames)
+    moduleName=_lazyNames.get(name)
+    if moduleName is not None:
+        value=getattr(importlib.import_module('.'+moduleName,__name__),name)
+        globals()[name]=value
+        return value
+    if name in _submodules:
+        return importlib.import_module('.'+name,__name__)
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
+def __dir__()->typing.List[str]:
+    return sorted(set(globals())|set(_lazyNames)|set(_submodules))
+
+
+def importTimeBenchmark(
+    repeat:int=5
+    )->typing.Tuple[float,typing.List[str]]:
+    """
+    Measure how long "import osTools" takes using "python -X importtime"
+    in a fresh interpreter
+
+    returns (best cumulative microseconds,[submodules it imported])
+    so a regression (eg somebody adding an eager import) shows up
+    as a non-empty submodule list
+    """
+    import os
+    import subprocess
+    packageDir=os.path.dirname(os.path.abspath(__file__))
+    best=None
+    submodules:typing.List[str]=[]
+    for _ in range(repeat):
+        po=subprocess.run(
+            [sys.executable,'-X','importtime','-c',f'import {__name__}'],
+            cwd=os.path.dirname(packageDir),
+            stdout=subprocess.PIPE,stderr=subprocess.PIPE,check=True)
+        submodules=[]
+        for line in po.stderr.decode('utf-8',errors='ignore').split('\n'):
+            # import time: self [us] | cumulative | imported package
+            parts=line.split('|')
+            if len(parts)!=3:
+                continue
+            imported=parts[2].strip()
+            if imported==__name__:
+                cumulative=float(parts[1])
+                if best is None or cumulative<best:
+                    best=cumulative
+            elif imported.startswith(__name__+'.'):
+                submodules.append(imported[len(__name__)+1:])
+    if best is None:
+        raise Exception(f'"{__name__}" was not in the importtime output')
+    print(f'import {__name__}: {best:.0f}us')
+    for submodule in submodules:
+        print(f'   eagerly imported {submodule}')
+    return best,submodules
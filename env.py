@@ -1,21 +1,128 @@
 """
 expands upon sys.environ to make it an object
 """
-import subprocess
 import typing
-from collections.abc import Iterable
+import types
+from collections.abc import Iterable,Mapping
+from dataclasses import dataclass,field
+import contextlib
 import os
+try:
+    from . import envPermanent
+except ImportError:
+    import envPermanent # type: ignore
+
+
+@dataclass(frozen=True)
+class EnvironmentDiff:
+    """
+    The differences between two environment snapshots
+    """
+    added:typing.Dict[str,str]=field(default_factory=dict)
+    removed:typing.Dict[str,str]=field(default_factory=dict)
+    changed:typing.Dict[str,typing.Tuple[str,str]]=\
+        field(default_factory=dict)
+
+    def __bool__(self)->bool:
+        return bool(self.added or self.removed or self.changed)
+
+
+class EnvironmentSnapshot(Mapping):
+    """
+    An immutable copy of the environment at a moment in time
+
+    Indexing returns the parsed value (same as env.get()),
+    but each value is only parsed once.
+    The raw strings are available as .raw
+    """
+
+    def __init__(self,
+        raw:typing.Optional[typing.Mapping[str,str]]=None,
+        parser:typing.Optional[typing.Callable[[str],typing.Any]]=None):
+        """
+        :raw: the raw values (default=a copy of os.environ)
+        :parser: how to parse a raw value (default=env.parseValue)
+        """
+        if raw is None:
+            raw=os.environ
+        self._raw:typing.Dict[str,str]=dict(raw)
+        if parser is None:
+            parser=EnvironmentVariables.parseValue
+        self._parser=parser
+        self._parsed:typing.Dict[str,typing.Any]={}
+
+    @property
+    def raw(self)->typing.Mapping[str,str]:
+        """
+        The raw string values (read-only)
+        """
+        return types.MappingProxyType(self._raw)
+
+    def __getitem__(self,k:str)->typing.Any:
+        try:
+            return self._parsed[k]
+        except KeyError:
+            v=self._parser(self._raw[k])
+            self._parsed[k]=v
+            return v
+
+    def __iter__(self)->typing.Iterator[str]:
+        return iter(self._raw)
+
+    def __len__(self)->int:
+        return len(self._raw)
+
+    def __eq__(self,other)->bool:
+        if isinstance(other,EnvironmentSnapshot):
+            return self._raw==other._raw
+        return Mapping.__eq__(self,other)
+
+    __hash__=None # type: ignore
+
+    def __repr__(self)->str:
+        return f'EnvironmentSnapshot({self._raw!r})'
+
+
+def diff(a:typing.Mapping[str,str],b:typing.Mapping[str,str]
+    )->EnvironmentDiff:
+    """
+    Compare two environments (snapshots or plain dicts of raw values)
+
+    returns what it would take to turn a into b
+    """
+    if isinstance(a,EnvironmentSnapshot):
+        a=a.raw
+    if isinstance(b,EnvironmentSnapshot):
+        b=b.raw
+    added={}
+    changed={}
+    for k,v in b.items():
+        old=a.get(k)
+        if old is None:
+            added[k]=v
+        elif old!=v:
+            changed[k]=(old,v)
+    removed={k:v for k,v in a.items() if k not in b}
+    return EnvironmentDiff(added,removed,changed)
 
 class _EnvironmentVariables:
     """
     expands upon sys.env to make it an object
     """
 
+    # how many distinct raw values to remember the parsed form of
+    parseCacheSize=1024
+
     def __init__(self):
         if os.name=='nt':
             self.delimiter=';'
         else:
             self.delimiter=':'
+        # {raw string:parsed values}
+        # since it is keyed on the raw value, it never goes stale
+        self._parseCache:typing.Dict[str,typing.Tuple[typing.Any,...]]={}
+        self._permanentBackend:typing.Optional[
+            envPermanent.PermanentEnvBackend]=None
 
     def __call__(self)->"_EnvironmentVariables":
         """
@@ -40,7 +147,7 @@ class _EnvironmentVariables:
         """
         Access like a dict
         """
-        return [(k,self.get(k)) for k in self.keys()]
+        return list(self.snapshot().items())
 
     def keys(self)->typing.Iterable[str]:
         """
@@ -52,7 +159,60 @@ class _EnvironmentVariables:
         """
         Access like a dict
         """
-        return [self.get(k) for k in self.keys()]
+        return list(self.snapshot().values())
+
+    def snapshot(self)->EnvironmentSnapshot:
+        """
+        Take an immutable snapshot of the current environment
+        """
+        return EnvironmentSnapshot(os.environ,self.parseValue)
+
+    def restore(self,snapshot:typing.Mapping[str,str])->EnvironmentDiff:
+        """
+        Put the environment back exactly the way it was in a snapshot,
+        only touching the variables that differ
+
+        returns the changes that were undone
+        """
+        d=diff(snapshot,os.environ)
+        for k in d.added:
+            del os.environ[k]
+        for k,v in d.removed.items():
+            os.environ[k]=v
+        for k,(v,_) in d.changed.items():
+            os.environ[k]=v
+        return d
+
+    @contextlib.contextmanager
+    def changes(self,
+        changes:typing.Optional[typing.Mapping[str,typing.Any]]=None,
+        **kwargs:typing.Any
+        )->typing.Generator[EnvironmentSnapshot,None,None]:
+        """
+        Context manager that applies a batch of changes and
+        restores the environment exactly when it exits.
+
+        A value of None removes the variable.
+        Lists are joined with the os delimiter.
+
+        Example:
+            with env.changes({'DEBUG':1,'PATH':None},LANG='C') as before:
+                ...
+
+        yields a snapshot of the environment before the changes
+        """
+        before=self.snapshot()
+        allChanges=dict(changes or {})
+        allChanges.update(kwargs)
+        try:
+            for k,v in allChanges.items():
+                if v is None:
+                    os.environ.pop(str(k),None)
+                else:
+                    self.set(k,v,append=False)
+            yield before
+        finally:
+            self.restore(before)
 
     def getStr(self,k:str,default:typing.Any=None)->str:
         """
@@ -97,26 +257,115 @@ class _EnvironmentVariables:
             return False
         return v
 
+    def _parsed(self,v:str)->typing.Tuple[typing.Any,...]:
+        """
+        Split and cast a raw value, remembering the result
+        """
+        try:
+            return self._parseCache[v]
+        except KeyError:
+            pass
+        ret=tuple(self._inferredCast(vv) for vv in v.split(self.delimiter))
+        if len(self._parseCache)>=self.parseCacheSize:
+            self._parseCache.clear()
+        self._parseCache[v]=ret
+        return ret
+
+    def parseValue(self,v:str)->typing.Any:
+        """
+        Parse a raw environment string the same way get() does
+        """
+        values=self._parsed(v)
+        if len(values)==1:
+            return values[0]
+        return list(values)
+
     def getList(self,k:str,default:typing.Any=None)->typing.List[typing.Any]:
         """
         Get the specified item as a list of mixed-type items
         """
-        return [self._inferredCast(v) for v in self.getStrList(k,default)]
+        s=self.getStr(k,default)
+        if isinstance(s,str):
+            return list(self._parsed(s))
+        return s # type: ignore
 
     def get(self,k:str,default:typing.Any=None)->typing.Any:
         """
         Get the specified item as a mixed-type item
         or a list of mixed-type items
+
+        :default: returned if the item is not set
+            (a string default is parsed the same as a value would be)
+        """
+        s=self.getStr(k)
+        if s is None:
+            if isinstance(default,str):
+                return self.parseValue(default)
+            return default
+        return self.parseValue(s)
+
+    def getInt(self,k:str,default:typing.Optional[int]=None
+        )->typing.Optional[int]:
         """
-        v=self.getList(k,default)
-        if v is not None and len(v)==1:
-            return v[0]
-        return None
+        Get the specified item as an int
+
+        raises ValueError if it is set to something that is not an int
+        """
+        s=self.getStr(k)
+        if s is None:
+            return default
+        return int(s)
+
+    def getFloat(self,k:str,default:typing.Optional[float]=None
+        )->typing.Optional[float]:
+        """
+        Get the specified item as a float
+
+        raises ValueError if it is set to something that is not a number
+        """
+        s=self.getStr(k)
+        if s is None:
+            return default
+        return float(s)
+
+    _trueValues=frozenset(('1','y','yes','t','true','on'))
+    _falseValues=frozenset(('','0','n','no','f','false','off'))
+    def getBool(self,k:str,default:typing.Optional[bool]=None
+        )->typing.Optional[bool]:
+        """
+        Get the specified item as a bool
+
+        true values are 1,y,yes,t,true,on
+        false values are 0,n,no,f,false,off or empty
+
+        raises ValueError if it is set to anything else
+        """
+        s=self.getStr(k)
+        if s is None:
+            return default
+        lv=s.strip().lower()
+        if lv in self._trueValues:
+            return True
+        if lv in self._falseValues:
+            return False
+        raise ValueError(f'Environment variable {k}="{s}" is not a bool')
+
+    def getPath(self,k:str,default:typing.Optional[str]=None
+        )->typing.Optional[str]:
+        """
+        Get the specified item as a single filesystem path,
+        with ~ and any variables within it expanded
+        """
+        s=self.getStr(k)
+        if s is None:
+            return default
+        return os.path.normpath(os.path.expanduser(os.path.expandvars(s)))
 
     def set(self,k:str,v:typing.Any,
         append:typing.Optional[bool]=None,
         permanent:bool=False,
-        allusers:bool=False):
+        allusers:bool=False,
+        unique:bool=False):
         """
         set an item
 
@@ -124,6 +373,8 @@ class _EnvironmentVariables:
             os separator, otherwise will overwrite the old value
             (if unspecified, will try to guess based upon whether
             existing value is a list)
+        :unique: when appending, skip any values that are already there
+            (see also pathList() for more complete PATH-style editing)
         :permanent: make changes to os env, not just for this session
         :allusers: if makeing changes to os env, apply to all users
             (False=just current user)
@@ -141,38 +392,72 @@ class _EnvironmentVariables:
             append=self.getStr(k,'').find(self.delimiter)>=0
         # append to existing if necessary
         if append:
-            current=self.get(k)
-            allvalues:typing.List[str]=[]
-            if current is None:
-                pass
-            elif isinstance(current,str):
-                allvalues=[current]
-            elif isinstance(current,Iterable):
-                allvalues=[str(vv) for vv in current]
+            # work with the raw strings so values are not re-formatted
+            allvalues:typing.List[str]=self.getStrList(k,[])
+            if unique:
+                existing=set(allvalues)
+                for vv in v.split(self.delimiter):
+                    if vv not in existing:
+                        existing.add(vv)
+                        allvalues.append(vv)
             else:
-                allvalues=[str(current)]
-            allvalues.append(v)
+                allvalues.append(v)
             v=self.delimiter.join(allvalues)
         # make changes permanent if requested
         if permanent:
-            if os.name=='nt':
-                cmd=['setx'] # run "setx /?" from command line for more info
-                if allusers:
-                    cmd.append('/M')
-                cmd.append('"%s"'%k)
-                cmd.append('"%s"'%v)
-                # TODO: must be elevated to work?
-                po=subprocess.Popen(cmd,
-                    stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-                _,errb=po.communicate()
-                err=errb.decode('utf-8',errors='ignore').strip()
-                if err:
-                    raise Exception(err)
-            else:
-                raise NotImplementedError()
+            self.permanentBackend.setMany({k:v},allusers)
         # set the global environment value for the running app
         os.environ[k]=v
 
+    def setMany(self,values:typing.Mapping[str,typing.Any],
+        permanent:bool=False,
+        allusers:bool=False):
+        """
+        set many items at once (overwriting any old values)
+
+        If permanent, they are all saved in a single write.
+
+        :values: {name:value} where a value of None removes the variable
+        :permanent: make changes to os env, not just for this session
+        :allusers: if makeing changes to os env, apply to all users
+            (False=just current user)
+        """
+        strValues:typing.Dict[str,typing.Optional[str]]={}
+        for k,v in values.items():
+            if v is not None and not isinstance(v,str):
+                if isinstance(v,Iterable):
+                    v=self.delimiter.join([str(vv) for vv in v])
+                else:
+                    v=str(v)
+            strValues[str(k)]=v
+        if permanent:
+            self.permanentBackend.setMany(strValues,allusers)
+        for k,v in strValues.items():
+            if v is None:
+                os.environ.pop(k,None)
+            else:
+                os.environ[k]=v
+
+    @property
+    def permanentBackend(self)->"envPermanent.PermanentEnvBackend":
+        """
+        How permanent changes are saved
+        (can be assigned any envPermanent.PermanentEnvBackend)
+        """
+        if self._permanentBackend is None:
+            self._permanentBackend=envPermanent.defaultBackend()
+        return self._permanentBackend
+
+    @permanentBackend.setter
+    def permanentBackend(self,backend:"envPermanent.PermanentEnvBackend"):
+        self._permanentBackend=backend
+
+    def pathList(self,k:str='PATH')->"PathList":
+        """
+        Get a PATH-style variable as an editable PathList
+        """
+        return PathList(k,self.delimiter)
+
     # no need to be this specific, but for parity with get() functions...
     setList=set
     setStr=set
@@ -182,3 +467,261 @@ class _EnvironmentVariables:
 EnvironmentVariables=_EnvironmentVariables()
 environmentVariables=EnvironmentVariables
 env=EnvironmentVariables
+
+
+class PathList:
+    """
+    A PATH-style environment variable as an ordered list of entries,
+    with a hashed index for fast membership tests.
+
+    Edits are made in memory and written to os.environ all at once
+    by save(), or automatically when used as a context manager:
+
+        with env.pathList('PATH') as path:
+            path.prepend('/opt/tool/bin')
+            path.remove('/old/bin')
+            path.dedupe()
+    """
+
+    def __init__(self,k:str='PATH',delimiter:typing.Optional[str]=None):
+        self.k=k
+        if delimiter is None:
+            delimiter=os.pathsep
+        self.delimiter=delimiter
+        # entries are kept by position, with positions below the first
+        # used for prepends and above the last for appends, so adding
+        # or removing an entry never has to shift the others along
+        self._entries:typing.Dict[int,str]={} # {position:entry}
+        self._index:typing.Dict[str,typing.List[int]]={} # {key:[position]}
+        self._first=0
+        self._last=-1
+        self._order:typing.Optional[typing.List[str]]=[]
+        self.reload()
+
+    @staticmethod
+    def key(entry:str)->str:
+        """
+        The form of an entry used to decide whether two are the same
+        """
+        return os.path.normcase(os.path.normpath(entry)) if entry else ''
+
+    def reload(self)->None:
+        """
+        Re-read the value from os.environ, discarding unsaved edits
+        """
+        value=os.environ.get(self.k,'')
+        self._setEntries(value.split(self.delimiter) if value else [])
+
+    def _setEntries(self,entries:typing.Iterable[str])->None:
+        self._order=list(entries)
+        self._entries=dict(enumerate(self._order))
+        self._index={}
+        for position,entry in self._entries.items():
+            self._index.setdefault(self.key(entry),[]).append(position)
+        self._first=0
+        self._last=len(self._order)-1
+
+    def _ordered(self)->typing.List[str]:
+        """
+        The entries in order
+        (worked out again only after an edit that moved things around)
+        """
+        if self._order is None:
+            self._order=[self._entries[p] for p in sorted(self._entries)]
+        return self._order
+
+    def save(self)->None:
+        """
+        Write the value back to os.environ (one write for all the edits)
+        """
+        value=str(self)
+        if os.environ.get(self.k)!=value:
+            os.environ[self.k]=value
+
+    def __enter__(self)->"PathList":
+        return self
+
+    def __exit__(self,excType,*_):
+        if excType is None:
+            self.save()
+
+    def __str__(self)->str:
+        return self.delimiter.join(self._ordered())
+
+    def __repr__(self)->str:
+        return f'PathList({self.k!r},{self._ordered()!r})'
+
+    def __iter__(self)->typing.Iterator[str]:
+        return iter(self._ordered())
+
+    def __len__(self)->int:
+        return len(self._entries)
+
+    def __getitem__(self,i:int)->str:
+        return self._ordered()[i]
+
+    def __contains__(self,entry:str)->bool:
+        return self.key(entry) in self._index
+
+    def _removeKey(self,key:str)->None:
+        for position in self._index.pop(key,()):
+            del self._entries[position]
+        self._order=None
+
+    def append(self,entry:str,move:bool=False)->None:
+        """
+        Add an entry to the end
+
+        :move: if it is already there, move it to the end
+            (otherwise it is left where it is)
+        """
+        key=self.key(entry)
+        if key in self._index:
+            if not move:
+                return
+            self._removeKey(key)
+        self._last+=1
+        self._entries[self._last]=entry
+        self._index[key]=[self._last]
+        if self._order is not None:
+            self._order.append(entry)
+
+    def prepend(self,entry:str)->None:
+        """
+        Add an entry to the front
+        (if it is already there, it is moved to the front)
+        """
+        key=self.key(entry)
+        self._removeKey(key)
+        self._first-=1
+        self._entries[self._first]=entry
+        self._index[key]=[self._first]
+
+    def extend(self,entries:typing.Iterable[str])->None:
+        """
+        Append several entries
+        """
+        for entry in entries:
+            self.append(entry)
+
+    def remove(self,entry:str)->bool:
+        """
+        Remove all copies of an entry
+
+        returns whether anything was removed
+        """
+        key=self.key(entry)
+        if key not in self._index:
+            return False
+        self._removeKey(key)
+        return True
+
+    def dedupe(self)->int:
+        """
+        Remove repeated entries, keeping the first of each
+
+        returns how many were removed
+        """
+        removed=0
+        for positions in self._index.values():
+            for position in positions[1:]:
+                del self._entries[position]
+            removed+=len(positions)-1
+            del positions[1:]
+        if removed:
+            self._order=None
+        return removed
+
+    def normalize(self)->None:
+        """
+        Expand ~ and variables, normalize the path form, and
+        remove empty and repeated entries
+        """
+        self._setEntries(
+            os.path.normpath(os.path.expanduser(os.path.expandvars(e)))
+            for e in self._ordered() if e.strip())
+        self.dedupe()
+
+
+# {directory:(mtime,names in the directory)}
+_whichDirCache:typing.Dict[str,typing.Tuple[int,typing.FrozenSet[str]]]={}
+def _dirListing(directory:str)->typing.FrozenSet[str]:
+    """
+    List a directory, reusing the last listing if its mtime is unchanged
+    """
+    try:
+        mtime=os.stat(directory).st_mtime_ns
+    except OSError:
+        _whichDirCache.pop(directory,None)
+        return frozenset()
+    cached=_whichDirCache.get(directory)
+    if cached is not None and cached[0]==mtime:
+        return cached[1]
+    try:
+        names=frozenset(os.path.normcase(n) for n in os.listdir(directory))
+    except OSError:
+        names=frozenset()
+    _whichDirCache[directory]=(mtime,names)
+    return names
+
+
+def which(name:str,path:typing.Optional[typing.Iterable[str]]=None
+    )->typing.Optional[str]:
+    """
+    Find an executable on the PATH (like the shell "which" command)
+
+    Directory listings are cached, and only re-read when
+    a directory's mtime changes.
+
+    :path: directories to search (default=the PATH variable)
+
+    returns the full path, or None if not found
+    """
+    if path is None:
+        path=PathList('PATH')
+    candidates=[name]
+    if os.name=='nt' and not os.path.splitext(name)[1]:
+        exts=os.environ.get('PATHEXT','.COM;.EXE;.BAT;.CMD').split(';')
+        candidates=[name+ext for ext in exts if ext]
+    for directory in path:
+        if not directory:
+            continue
+        names=_dirListing(directory)
+        for candidate in candidates:
+            if os.path.normcase(candidate) in names:
+                filename=os.path.join(directory,candidate)
+                if os.path.isfile(filename) and os.access(filename,os.X_OK):
+                    return filename
+    return None
+
+
+def benchmark(numCalls:int=100000)->typing.Dict[str,float]:
+    """
+    Time the per-call cost of reading an environment variable
+
+    returns {method:microseconds per call}
+    """
+    import timeit
+    k='_OSTOOLS_ENV_BENCHMARK'
+    ret={}
+    with env.changes({k:'12345'}):
+        for name,fn in (
+            ('uncached get',
+                lambda:[env._inferredCast(v)
+                    for v in env.getStr(k).split(env.delimiter)]),
+            ('get',lambda:env.get(k)),
+            ('getInt',lambda:env.getInt(k)),
+            ('getStr',lambda:env.getStr(k))):
+            #
+            ret[name]=timeit.timeit(fn,number=numCalls)*1e6/numCalls
+            print('%-14s %.3fus per call'%(name,ret[name]))
+    return ret
+
+
+if __name__=='__main__':
+    import sys
+    if '--benchmark' in sys.argv[1:]:
+        benchmark()
+    else:
+        for key,value in sorted(env.items()):
+            print(f'{key}={value!r}')
@@ -0,0 +1,280 @@
+"""
+Backends to make environment variable changes permanent
+(that is, visible to future sessions, not just this process)
+
+Every backend takes a whole batch of changes at once, so setting
+many variables is a single write.
+"""
+import typing
+import os
+import re
+import shlex
+import tempfile
+import subprocess
+
+
+EnvChanges=typing.Mapping[str,typing.Optional[str]]
+
+
+class PermanentEnvBackend:
+    """
+    Base class for a way of making environment changes permanent
+    """
+
+    def setMany(self,values:EnvChanges,allusers:bool=False)->None:
+        """
+        Permanently set a batch of variables
+
+        :values: {name:value} where a value of None removes the variable
+        :allusers: apply to all users (False=just current user)
+        """
+        raise NotImplementedError()
+
+    def getAll(self,allusers:bool=False)->typing.Dict[str,str]:
+        """
+        Get all of the variables this backend has permanently set
+        """
+        raise NotImplementedError()
+
+
+class SetxBackend(PermanentEnvBackend):
+    """
+    Windows backend using the "setx" command
+    (one process per variable, and cannot remove variables)
+    """
+
+    def setMany(self,values:EnvChanges,allusers:bool=False)->None:
+        for k,v in values.items():
+            if v is None:
+                raise NotImplementedError('setx cannot remove "%s"'%k)
+            cmd=['setx'] # run "setx /?" from command line for more info
+            if allusers:
+                cmd.append('/M')
+            cmd.append('"%s"'%k)
+            cmd.append('"%s"'%v)
+            # TODO: must be elevated to work?
+            po=subprocess.Popen(cmd,
+                stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+            _,errb=po.communicate()
+            err=errb.decode('utf-8',errors='ignore').strip()
+            if err:
+                raise Exception(err)
+
+
+class WindowsRegistryBackend(PermanentEnvBackend):
+    """
+    Windows backend that writes the registry directly
+    (which is what setx does) and then tells everybody
+    about it with a single WM_SETTINGCHANGE broadcast.
+    """
+
+    USER_KEY='Environment'
+    MACHINE_KEY=r'SYSTEM\CurrentControlSet\Control\Session Manager\Environment' # noqa: E501 # pylint: disable=line-too-long
+
+    def _open(self,allusers:bool,write:bool):
+        import winreg # type: ignore
+        if allusers:
+            root,path=winreg.HKEY_LOCAL_MACHINE,self.MACHINE_KEY
+        else:
+            root,path=winreg.HKEY_CURRENT_USER,self.USER_KEY
+        access=winreg.KEY_READ
+        if write:
+            access|=winreg.KEY_SET_VALUE
+        return winreg.OpenKey(root,path,0,access)
+
+    def getAll(self,allusers:bool=False)->typing.Dict[str,str]:
+        import winreg # type: ignore
+        ret={}
+        with self._open(allusers,False) as key:
+            i=0
+            while True:
+                try:
+                    k,v,_=winreg.EnumValue(key,i)
+                except OSError:
+                    break
+                ret[k]=v
+                i+=1
+        return ret
+
+    def setMany(self,values:EnvChanges,allusers:bool=False)->None:
+        import winreg # type: ignore
+        import ctypes
+        with self._open(allusers,True) as key:
+            for k,v in values.items():
+                if v is None:
+                    try:
+                        winreg.DeleteValue(key,k)
+                    except FileNotFoundError:
+                        pass
+                    continue
+                regType=winreg.REG_EXPAND_SZ if '%' in v else winreg.REG_SZ
+                winreg.SetValueEx(key,k,0,regType,v)
+        HWND_BROADCAST=0xFFFF
+        WM_SETTINGCHANGE=0x001A
+        SMTO_ABORTIFHUNG=0x0002
+        result=ctypes.c_ulong()
+        ctypes.windll.user32.SendMessageTimeoutW(
+            HWND_BROADCAST,WM_SETTINGCHANGE,0,'Environment',
+            SMTO_ABORTIFHUNG,5000,ctypes.byref(result))
+
+
+class PosixProfileBackend(PermanentEnvBackend):
+    """
+    Posix backend that keeps the variables in a managed block
+    of a shell profile (or systemd environment.d file).
+
+    Everything outside the block is left alone.  The file is written
+    to a temporary file and renamed into place, so it is never
+    seen half-written.  The file is only re-read when its mtime changes.
+    """
+
+    BEGIN_MARKER='# >>> osTools environment >>>'
+    END_MARKER='# <<< osTools environment <<<'
+
+    def __init__(self,
+        filename:typing.Optional[str]=None,
+        allusersFilename:typing.Optional[str]=None,
+        fileFormat:str='sh'):
+        """
+        :filename: the current user's file (default=~/.profile)
+        :allusersFilename: the all users file
+            (default=/etc/profile.d/osTools.sh)
+        :fileFormat: 'sh' for "export K='v'" lines
+            or 'environment.d' for "K=v" lines
+        """
+        if fileFormat not in ('sh','environment.d'):
+            raise ValueError(f'Unknown file format "{fileFormat}"')
+        self.fileFormat=fileFormat
+        if filename is None:
+            if fileFormat=='sh':
+                filename='~/.profile'
+            else:
+                filename='~/.config/environment.d/50-osTools.conf'
+        if allusersFilename is None:
+            if fileFormat=='sh':
+                allusersFilename='/etc/profile.d/osTools.sh'
+            else:
+                allusersFilename='/etc/environment.d/50-osTools.conf'
+        self.filename=filename
+        self.allusersFilename=allusersFilename
+        # {filename:(mtime,text)}
+        self._cache:typing.Dict[str,typing.Tuple[int,str]]={}
+
+    def _filename(self,allusers:bool)->str:
+        """
+        The file to use, with symlinks resolved
+        (so a ~/.profile linked into a dotfiles repo gets
+        its target updated rather than replaced)
+        """
+        filename=self.allusersFilename if allusers else self.filename
+        return os.path.realpath(os.path.expanduser(filename))
+
+    def _read(self,filename:str)->str:
+        """
+        Read a file, reusing the last read if the mtime has not changed
+        """
+        try:
+            mtime=os.stat(filename).st_mtime_ns
+        except FileNotFoundError:
+            self._cache.pop(filename,None)
+            return ''
+        cached=self._cache.get(filename)
+        if cached is not None and cached[0]==mtime:
+            return cached[1]
+        with open(filename,'r',encoding='utf-8') as f:
+            text=f.read()
+        self._cache[filename]=(mtime,text)
+        return text
+
+    def _split(self,text:str)->typing.Tuple[str,str,str]:
+        """
+        Split file text into (before,block,after)
+        """
+        start=text.find(self.BEGIN_MARKER)
+        if start<0:
+            return text,'',''
+        end=text.find(self.END_MARKER,start)
+        if end<0:
+            return text[:start],text[start+len(self.BEGIN_MARKER):],''
+        return text[:start],\
+            text[start+len(self.BEGIN_MARKER):end],\
+            text[end+len(self.END_MARKER):].lstrip('\n')
+
+    _shLine=re.compile(r'^\s*(?:export\s+)?([A-Za-z_][A-Za-z0-9_]*)=(.*)$')
+    def _parseBlock(self,block:str)->typing.Dict[str,str]:
+        ret={}
+        for line in block.split('\n'):
+            m=self._shLine.match(line)
+            if m is None:
+                continue
+            v=m.group(2)
+            if self.fileFormat=='sh':
+                words=shlex.split(v) if v else ['']
+                v=words[0] if words else ''
+            ret[m.group(1)]=v
+        return ret
+
+    def _formatBlock(self,values:typing.Mapping[str,str])->str:
+        lines=[self.BEGIN_MARKER]
+        for k,v in values.items():
+            if self.fileFormat=='sh':
+                lines.append(f'export {k}={shlex.quote(v)}')
+            else:
+                lines.append(f'{k}={v}')
+        lines.append(self.END_MARKER)
+        return '\n'.join(lines)+'\n'
+
+    def getAll(self,allusers:bool=False)->typing.Dict[str,str]:
+        _,block,_=self._split(self._read(self._filename(allusers)))
+        return self._parseBlock(block)
+
+    def setMany(self,values:EnvChanges,allusers:bool=False)->None:
+        filename=self._filename(allusers)
+        before,block,after=self._split(self._read(filename))
+        current=self._parseBlock(block)
+        for k,v in values.items():
+            if v is None:
+                current.pop(k,None)
+            else:
+                current[k]=v
+        if before and not before.endswith('\n'):
+            before+='\n'
+        text=before+(self._formatBlock(current) if current else '')+after
+        self._atomicWrite(filename,text)
+
+    def _atomicWrite(self,filename:str,text:str)->None:
+        """
+        Write a file by writing a temp file and renaming it into place
+        """
+        filename=os.path.realpath(filename)
+        directory=os.path.dirname(filename) or '.'
+        os.makedirs(directory,exist_ok=True)
+        try:
+            mode=os.stat(filename).st_mode&0o7777
+        except FileNotFoundError:
+            mode=0o644
+        fd,tmp=tempfile.mkstemp(
+            prefix='.'+os.path.basename(filename)+'.',dir=directory)
+        try:
+            with os.fdopen(fd,'w',encoding='utf-8') as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp,mode)
+            os.replace(tmp,filename)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self._cache[filename]=(os.stat(filename).st_mtime_ns,text)
+
+
+def defaultBackend()->PermanentEnvBackend:
+    """
+    The appropriate backend for this os
+    """
+    if os.name=='nt':
+        return WindowsRegistryBackend()
+    return PosixProfileBackend()
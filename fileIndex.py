@@ -0,0 +1,523 @@
+"""
+A local filesystem index, for fast file name searches
+on systems that do not have voidtools everything
+
+Names, sizes and mtimes are kept in an sqlite database.
+If sqlite has the fts5 trigram tokenizer, substring and glob
+searches are answered from the full-text index instead of
+scanning every name.
+"""
+import typing
+import os
+import re
+import fnmatch
+import stat
+import sqlite3
+import threading
+from dataclasses import dataclass
+
+
+# search flags (same meanings as the everything sdk's settings)
+SEARCH_MATCH_CASE=0x00000001
+SEARCH_MATCH_PATH=0x00000002
+SEARCH_REGEX=0x00000004
+
+# {sort name:sql columns}
+SORT_FIELDS={
+    'name':('files.name COLLATE NOCASE',),
+    'path':('dirs.path COLLATE NOCASE','files.name COLLATE NOCASE'),
+    'size':('files.size',),
+    'dateModified':('files.mtime',)}
+
+
+@dataclass
+class SearchResult:
+    """
+    A single file found by a search
+    """
+    path:str
+    size:int=0
+    dateModified:float=0.0 # posix timestamp
+    isDir:bool=False
+
+    @property
+    def name(self)->str:
+        """
+        The filename without the directory
+        """
+        return os.path.basename(self.path)
+
+
+def defaultIndexFilename()->str:
+    """
+    Where the index is kept unless told otherwise
+    """
+    cache=os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(cache,'osTools','fileIndex.sqlite')
+
+
+_SCHEMA='''
+CREATE TABLE IF NOT EXISTS roots(
+    path TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS dirs(
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE,
+    mtime REAL);
+CREATE TABLE IF NOT EXISTS files(
+    id INTEGER PRIMARY KEY,
+    dir INTEGER,
+    name TEXT,
+    size INTEGER,
+    mtime REAL,
+    isDir INTEGER);
+CREATE INDEX IF NOT EXISTS files_dir ON files(dir,name);
+'''
+
+_FTS_SCHEMA='''
+CREATE VIRTUAL TABLE IF NOT EXISTS names USING fts5(
+    name,content='files',content_rowid='id',tokenize='trigram');
+CREATE TRIGGER IF NOT EXISTS files_ai AFTER INSERT ON files BEGIN
+    INSERT INTO names(rowid,name) VALUES (new.id,new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS files_ad AFTER DELETE ON files BEGIN
+    INSERT INTO names(names,rowid,name) VALUES ('delete',old.id,old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS files_au AFTER UPDATE OF name ON files BEGIN
+    INSERT INTO names(names,rowid,name) VALUES ('delete',old.id,old.name);
+    INSERT INTO names(rowid,name) VALUES (new.id,new.name);
+END;
+'''
+
+
+def _likeEscape(s:str)->str:
+    return s.replace('\\','\\\\').replace('%','\\%').replace('_','\\_')
+
+
+def _globToLike(glob:str)->str:
+    """
+    Convert a glob to an sqlite LIKE pattern that matches
+    at least everything the glob does
+    (character classes become single wildcards)
+    """
+    like=re.sub(r'\[[^\]]*\]','?',glob)
+    like=_likeEscape(like)
+    return like.replace('*','%').replace('?','_')
+
+
+class FileIndex:
+    """
+    An sqlite index of the files under some root directories
+    """
+
+    def __init__(self,
+        filename:typing.Optional[str]=None,
+        roots:typing.Optional[typing.Iterable[str]]=None):
+        """
+        :filename: the database file (default=defaultIndexFilename())
+            or ':memory:'
+        :roots: directories to index (added to any already configured)
+        """
+        if filename is None:
+            filename=defaultIndexFilename()
+        if filename!=':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(filename)),
+                exist_ok=True)
+        self.filename=filename
+        self.lock=threading.RLock()
+        self.db=sqlite3.connect(filename,check_same_thread=False)
+        self.db.executescript(_SCHEMA)
+        try:
+            self.db.executescript(_FTS_SCHEMA)
+            self.hasFts=True
+        except sqlite3.OperationalError:
+            # sqlite too old for the trigram tokenizer
+            self.hasFts=False
+        self.db.create_function('regexp',2,_regexp,deterministic=True)
+        if roots is not None:
+            self.addRoots(roots)
+
+    def close(self)->None:
+        """
+        Close the database
+        """
+        with self.lock:
+            self.db.close()
+
+    def __enter__(self)->"FileIndex":
+        return self
+
+    def __exit__(self,*_):
+        self.close()
+
+    @property
+    def roots(self)->typing.List[str]:
+        """
+        The directories being indexed
+        """
+        with self.lock:
+            return [r[0] for r in self.db.execute('SELECT path FROM roots')]
+
+    def addRoots(self,roots:typing.Iterable[str])->None:
+        """
+        Add directories to be indexed
+        (they are not scanned until rebuild() is called)
+        """
+        with self.lock,self.db:
+            self.db.executemany('INSERT OR IGNORE INTO roots VALUES (?)',
+                [(os.path.abspath(r),) for r in roots])
+
+    def __len__(self)->int:
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def _forget(self,directory:str)->None:
+        """
+        Remove a directory and everything beneath it from the index
+        """
+        # a range rather than LIKE, because LIKE ignores case
+        # and would take /Build along with /build
+        prefix=directory.rstrip(os.sep)+os.sep
+        end=prefix[:-1]+chr(ord(os.sep)+1)
+        ids=[r[0] for r in self.db.execute(
+            'SELECT id FROM dirs WHERE path=? OR (path>=? AND path<?)',
+            (directory,prefix,end))]
+        self.db.executemany('DELETE FROM files WHERE dir=?',
+            [(i,) for i in ids])
+        self.db.executemany('DELETE FROM dirs WHERE id=?',[(i,) for i in ids])
+
+    def _scanDir(self,directory:str)->typing.List[str]:
+        """
+        Add the contents of a single directory to the index
+
+        returns the subdirectories
+        """
+        try:
+            st=os.stat(directory)
+            entries=list(os.scandir(directory))
+        except OSError:
+            return []
+        dirId=self.db.execute(
+            'INSERT OR REPLACE INTO dirs(path,mtime) VALUES (?,?)',
+            (directory,st.st_mtime)).lastrowid
+        rows=[]
+        subdirs=[]
+        for entry in entries:
+            try:
+                isDir=entry.is_dir(follow_symlinks=False)
+                est=entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            rows.append((dirId,entry.name,0 if isDir else est.st_size,
+                est.st_mtime,int(isDir)))
+            if isDir:
+                subdirs.append(entry.path)
+        self.db.executemany(
+            'INSERT INTO files(dir,name,size,mtime,isDir) VALUES (?,?,?,?,?)',
+            rows)
+        return subdirs
+
+    def rebuild(self,roots:typing.Optional[typing.Iterable[str]]=None
+        )->int:
+        """
+        Walk the root directories and (re)build the index for them
+
+        :roots: only rebuild these (default=all configured roots)
+
+        returns the number of files in the index
+        """
+        if roots is None:
+            roots=self.roots
+        else:
+            roots=[os.path.abspath(r) for r in roots]
+            self.addRoots(roots)
+        with self.lock,self.db:
+            for root in roots:
+                self._forget(root)
+                stack=[root]
+                while stack:
+                    stack.extend(self._scanDir(stack.pop()))
+        return len(self)
+
+    def _dirId(self,directory:str)->typing.Optional[int]:
+        row=self.db.execute('SELECT id FROM dirs WHERE path=?',
+            (directory,)).fetchone()
+        return None if row is None else row[0]
+
+    def _addTree(self,directory:str)->None:
+        """
+        Add a directory tree that is not in the index yet
+        """
+        self._forget(directory)
+        stack=[directory]
+        while stack:
+            stack.extend(self._scanDir(stack.pop()))
+
+    def _updatePath(self,path:str)->None:
+        parent,name=os.path.split(path)
+        dirId=self._dirId(parent)
+        if dirId is None:
+            # not somewhere we are indexing
+            return
+        row=self.db.execute(
+            'SELECT id,isDir FROM files WHERE dir=? AND name=?',
+            (dirId,name)).fetchone()
+        try:
+            st=os.lstat(path)
+        except OSError:
+            if row is not None:
+                self.db.execute('DELETE FROM files WHERE id=?',(row[0],))
+                if row[1]:
+                    self._forget(path)
+            return
+        isDir=stat.S_ISDIR(st.st_mode)
+        values=(0 if isDir else st.st_size,st.st_mtime,int(isDir))
+        if row is None:
+            self.db.execute(
+                'INSERT INTO files(dir,name,size,mtime,isDir) '
+                'VALUES (?,?,?,?,?)',(dirId,name)+values)
+        else:
+            self.db.execute(
+                'UPDATE files SET size=?,mtime=?,isDir=? WHERE id=?',
+                values+(row[0],))
+            if row[1] and not isDir:
+                self._forget(path)
+        if isDir and (row is None or not row[1] or self._dirId(path) is None):
+            self._addTree(path)
+
+    def updatePaths(self,paths:typing.Iterable[str])->None:
+        """
+        Bring individual entries up to date after they were
+        created, modified, or deleted (all in one transaction)
+
+        A new directory is scanned along with everything in it.
+        Paths outside of the indexed directories are ignored.
+        """
+        with self.lock,self.db:
+            for path in paths:
+                self._updatePath(os.path.abspath(path))
+
+    def _rescanDir(self,directory:str)->None:
+        dirId=self._dirId(directory)
+        if dirId is None:
+            self._updatePath(directory)
+            return
+        try:
+            st=os.stat(directory)
+            names=set(os.listdir(directory))
+        except OSError:
+            self._updatePath(directory)
+            self._forget(directory)
+            return
+        indexed={r[0]:r[1] for r in self.db.execute(
+            'SELECT name,isDir FROM files WHERE dir=?',(dirId,))}
+        for name,isDir in indexed.items():
+            if name not in names:
+                self.db.execute('DELETE FROM files WHERE dir=? AND name=?',
+                    (dirId,name))
+                if isDir:
+                    self._forget(os.path.join(directory,name))
+        for name in names:
+            self._updatePath(os.path.join(directory,name))
+        self.db.execute('UPDATE dirs SET mtime=? WHERE id=?',
+            (st.st_mtime,dirId))
+
+    def reconcile(self)->int:
+        """
+        Compare every indexed directory's mtime against the filesystem
+        and rescan the ones that changed.
+
+        This catches anything that was created, deleted or renamed
+        without a full rebuild (changes to the contents of
+        existing files do not change the directory mtime, though).
+
+        returns how many directories were rescanned
+        """
+        with self.lock:
+            dirs=self.db.execute('SELECT path,mtime FROM dirs').fetchall()
+        changed=[]
+        for directory,mtime in dirs:
+            try:
+                if os.stat(directory).st_mtime==mtime:
+                    continue
+            except OSError:
+                pass
+            changed.append(directory)
+        # parents first, so deleted trees are only forgotten once
+        changed.sort(key=len)
+        with self.lock,self.db:
+            for directory in changed:
+                if self._dirId(directory) is not None:
+                    self._rescanDir(directory)
+        return len(changed)
+
+    def directories(self)->typing.List[str]:
+        """
+        All of the directories in the index
+        """
+        with self.lock:
+            return [r[0] for r in self.db.execute('SELECT path FROM dirs')]
+
+    def _whereClauses(self,query:str,flags:int
+        )->typing.Tuple[str,typing.List[typing.Any],
+            typing.Optional[typing.Callable[[str],bool]]]:
+        """
+        Turn a query into sql conditions plus an optional exact
+        python filter on the name (or path) for things sql can't do
+
+        returns (sql,params,filter)
+        """
+        matchCase=bool(flags&SEARCH_MATCH_CASE)
+        field='files.name'
+        if flags&SEARCH_MATCH_PATH:
+            field="(dirs.path||'"+os.sep+"'||files.name)"
+        if flags&SEARCH_REGEX:
+            if not matchCase:
+                query='(?i)'+query
+            re.compile(query) # fail early on a bad expression
+            return f'regexp(?,{field})',[query],None
+        clauses=[]
+        params:typing.List[typing.Any]=[]
+        checks:typing.List[typing.Callable[[str],bool]]=[]
+        for term in query.split():
+            isGlob=any(c in term for c in '*?[')
+            like=_globToLike(term) if isGlob else '%'+_likeEscape(term)+'%'
+            # only say ESCAPE when we need it, because it stops
+            # sqlite from using the trigram index for LIKE
+            escape=" ESCAPE '\\'" if like!=like.replace('\\','') else ''
+            if field=='files.name' and self.hasFts and len(term)>=3:
+                # let the trigram index do the work
+                if isGlob:
+                    clauses.append("names.name LIKE ?"+escape)
+                    params.append(like)
+                else:
+                    # a trigram phrase is a case-insensitive substring
+                    clauses.append('names MATCH ?')
+                    params.append('"'+term.replace('"','""')+'"')
+            else:
+                clauses.append(f"{field} LIKE ?"+escape)
+                params.append(like)
+            if isGlob:
+                pattern=term if matchCase else term.lower()
+                if matchCase:
+                    checks.append(
+                        lambda s,p=pattern:fnmatch.fnmatchcase(s,p))
+                else:
+                    checks.append(
+                        lambda s,p=pattern:fnmatch.fnmatchcase(s.lower(),p))
+            elif matchCase:
+                checks.append(lambda s,t=term:t in s)
+        check=None
+        if checks:
+            check=lambda s:all(c(s) for c in checks) # noqa: E731
+        return ' AND '.join(clauses) or '1',params,check
+
+    def _searchSql(self,query:str,flags:int=0,
+        sort:typing.Optional[str]=None,
+        descending:bool=False
+        )->typing.Tuple[typing.List[str],typing.List[typing.Any],
+            typing.Optional[typing.Callable[[str],bool]]]:
+        """
+        Build the select for a search
+
+        returns ([sql parts],params,filter)
+        """
+        where,params,check=self._whereClauses(query,flags)
+        sql=['SELECT dirs.path,files.name,files.size,files.mtime,files.isDir',
+            'FROM files JOIN dirs ON dirs.id=files.dir']
+        if 'names' in where:
+            sql.append('JOIN names ON names.rowid=files.id')
+        sql.append('WHERE '+where)
+        if sort is not None:
+            if sort not in SORT_FIELDS:
+                raise ValueError(f'Unknown sort field "{sort}"')
+            direction=' DESC' if descending else ''
+            sql.append('ORDER BY '+', '.join(
+                column+direction for column in SORT_FIELDS[sort]))
+        return sql,params,check
+
+    def explain(self,query:str,flags:int=0)->typing.List[str]:
+        """
+        How sqlite plans to run a search
+        (eg to check that the trigram index is being used)
+
+        returns the EXPLAIN QUERY PLAN details
+        """
+        sql,params,_=self._searchSql(query,flags)
+        with self.lock:
+            return [row[3] for row in self.db.execute(
+                'EXPLAIN QUERY PLAN '+' '.join(sql),params)]
+
+    def searchIter(self,query:str,flags:int=0,
+        offset:int=0,
+        limit:typing.Optional[int]=None,
+        sort:typing.Optional[str]=None,
+        descending:bool=False,
+        chunkSize:int=500
+        )->typing.Generator[SearchResult,None,None]:
+        """
+        Search for files, yielding results as they are read
+
+        :query: space-separated terms that must all match the name.
+            A term containing * ? or [ is a glob matched against
+            the whole name, otherwise it is a substring.
+        :flags: SEARCH_MATCH_CASE, SEARCH_MATCH_PATH, SEARCH_REGEX
+            (with SEARCH_REGEX the whole query is one regular expression)
+        :offset: skip this many results
+        :limit: stop after this many results
+        :sort: one of SORT_FIELDS (default=unsorted)
+        :descending: reverse the sort
+        :chunkSize: how many rows to read from the database at once
+        """
+        sql,params,check=self._searchSql(query,flags,sort,descending)
+        if check is None:
+            # every row is a result, so let the database do the paging
+            sql.append('LIMIT ? OFFSET ?')
+            params=params+[-1 if limit is None else limit,offset]
+            offset=0
+            limit=None
+        with self.lock:
+            cursor=self.db.execute(' '.join(sql),params)
+        count=0
+        while limit is None or count<limit:
+            with self.lock:
+                rows=cursor.fetchmany(chunkSize)
+            if not rows:
+                break
+            for directory,name,size,mtime,isDir in rows:
+                path=os.path.join(directory,name)
+                if check is not None and not check(
+                    path if flags&SEARCH_MATCH_PATH else name):
+                    #
+                    continue
+                if offset>0:
+                    offset-=1
+                    continue
+                yield SearchResult(path,size,mtime,bool(isDir))
+                count+=1
+                if limit is not None and count>=limit:
+                    break
+        cursor.close()
+
+    def search(self,query:str,flags:int=0,
+        maxResults:typing.Optional[int]=None)->typing.List[SearchResult]:
+        """
+        Search for files
+
+        :maxResults: stop after this many
+
+        See also:
+            searchIter() for paging, sorting, and streaming results
+        """
+        return list(self.searchIter(query,flags,limit=maxResults))
+
+
+_regexCache:typing.Dict[str,typing.Pattern]={}
+def _regexp(pattern:str,value:str)->bool:
+    """
+    sqlite regexp() function
+    """
+    regex=_regexCache.get(pattern)
+    if regex is None:
+        regex=re.compile(pattern)
+        _regexCache[pattern]=regex
+    return regex.search(value) is not None
@@ -0,0 +1,278 @@
+"""
+Keep a FileIndex up to date as the filesystem changes,
+without having to do a full rescan.
+
+On linux, changes are picked up with inotify (through ctypes).
+Anywhere else, or if inotify runs out of watches, directories
+are polled for mtime changes instead.
+
+Bursts of events are coalesced, so a path that changes a hundred
+times in quick succession is only re-read once.
+"""
+import typing
+import os
+import sys
+import time
+import errno
+import struct
+import select
+import ctypes
+import ctypes.util
+import threading
+try:
+    from .fileIndex import FileIndex
+except ImportError:
+    from fileIndex import FileIndex # type: ignore
+
+
+# inotify event masks (from <sys/inotify.h>)
+IN_MODIFY=0x00000002
+IN_ATTRIB=0x00000004
+IN_CLOSE_WRITE=0x00000008
+IN_MOVED_FROM=0x00000040
+IN_MOVED_TO=0x00000080
+IN_CREATE=0x00000100
+IN_DELETE=0x00000200
+IN_DELETE_SELF=0x00000400
+IN_MOVE_SELF=0x00000800
+IN_Q_OVERFLOW=0x00004000
+IN_IGNORED=0x00008000
+IN_ONLYDIR=0x01000000
+IN_DONT_FOLLOW=0x02000000
+IN_ISDIR=0x40000000
+IN_CLOEXEC=0o2000000
+IN_NONBLOCK=0o4000
+
+WATCH_MASK=IN_MODIFY|IN_ATTRIB|IN_CLOSE_WRITE|IN_MOVED_FROM|IN_MOVED_TO|\
+    IN_CREATE|IN_DELETE|IN_DELETE_SELF|IN_MOVE_SELF|IN_ONLYDIR|IN_DONT_FOLLOW
+
+_eventHeader=struct.Struct('iIII')
+
+
+class Inotify:
+    """
+    Minimal ctypes wrapper around linux inotify
+    """
+
+    def __init__(self):
+        libcName=ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc=ctypes.CDLL(libcName,use_errno=True)
+        self._libc.inotify_add_watch.argtypes=[
+            ctypes.c_int,ctypes.c_char_p,ctypes.c_uint32]
+        self.fd=self._libc.inotify_init1(IN_NONBLOCK|IN_CLOEXEC)
+        if self.fd<0:
+            e=ctypes.get_errno()
+            raise OSError(e,os.strerror(e))
+        self.paths:typing.Dict[int,str]={} # {watch descriptor:directory}
+
+    def close(self)->None:
+        """
+        Stop watching everything
+        """
+        if self.fd>=0:
+            os.close(self.fd)
+            self.fd=-1
+
+    def addWatch(self,directory:str)->int:
+        """
+        Watch a directory (not including subdirectories)
+
+        raises OSError (eg ENOSPC when out of watches)
+        """
+        wd=self._libc.inotify_add_watch(
+            self.fd,os.fsencode(directory),WATCH_MASK)
+        if wd<0:
+            e=ctypes.get_errno()
+            raise OSError(e,os.strerror(e),directory)
+        # watching the same directory again returns the same descriptor,
+        # which conveniently updates the path of a moved directory
+        self.paths[wd]=directory
+        return wd
+
+    def read(self,timeout:typing.Optional[float]
+        )->typing.List[typing.Tuple[str,int]]:
+        """
+        Wait for events
+
+        returns [(path,mask)]
+        (an overflow is reported as ('',IN_Q_OVERFLOW))
+        """
+        ready,_,_=select.select([self.fd],[],[],timeout)
+        if not ready:
+            return []
+        try:
+            data=os.read(self.fd,1024*1024)
+        except BlockingIOError:
+            return []
+        ret=[]
+        offset=0
+        while offset+_eventHeader.size<=len(data):
+            wd,mask,_,nameLen=_eventHeader.unpack_from(data,offset)
+            offset+=_eventHeader.size
+            name=data[offset:offset+nameLen].rstrip(b'\0')
+            offset+=nameLen
+            if mask&IN_Q_OVERFLOW:
+                ret.append(('',IN_Q_OVERFLOW))
+                continue
+            directory=self.paths.get(wd)
+            if directory is None:
+                continue
+            if mask&IN_IGNORED:
+                del self.paths[wd]
+                continue
+            if name:
+                ret.append((os.path.join(directory,os.fsdecode(name)),mask))
+            else:
+                # the watched directory itself
+                ret.append((directory,mask))
+        return ret
+
+
+class IndexWatcher:
+    """
+    Daemon thread that applies filesystem changes to a FileIndex
+    """
+
+    def __init__(self,
+        index:FileIndex,
+        batchDelay:float=0.5,
+        maxBatch:int=10000,
+        reconcileInterval:float=300.0,
+        pollInterval:float=5.0,
+        useInotify:typing.Optional[bool]=None):
+        """
+        :batchDelay: seconds to wait for a burst of events to settle
+            before applying them
+        :maxBatch: apply changes early if this many paths are waiting
+        :reconcileInterval: seconds between full directory mtime checks
+            (catches anything that events missed)
+        :pollInterval: seconds between directory mtime checks
+            when inotify is not available
+        :useInotify: force inotify on or off (default=use if available)
+        """
+        self.index=index
+        self.batchDelay=batchDelay
+        self.maxBatch=maxBatch
+        self.reconcileInterval=reconcileInterval
+        self.pollInterval=pollInterval
+        if useInotify is None:
+            useInotify=sys.platform.startswith('linux')
+        self.useInotify=useInotify
+        self.inotify:typing.Optional[Inotify]=None
+        self._stop=threading.Event()
+        self._thread:typing.Optional[threading.Thread]=None
+        self.batchesApplied=0
+
+    def start(self)->None:
+        """
+        Start watching in a background thread
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread=threading.Thread(target=self.run,daemon=True,
+            name='IndexWatcher')
+        self._thread.start()
+
+    def stop(self)->None:
+        """
+        Stop watching (waits for the thread to finish)
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread=None
+
+    def __enter__(self)->"IndexWatcher":
+        self.start()
+        return self
+
+    def __exit__(self,*_):
+        self.stop()
+
+    def _watchTree(self,directories:typing.Iterable[str])->None:
+        """
+        Add inotify watches, falling back to polling if we run out
+        """
+        if self.inotify is None:
+            return
+        for directory in directories:
+            try:
+                self.inotify.addWatch(directory)
+            except OSError as e:
+                if e.errno==errno.ENOSPC:
+                    # out of watches, so polling will have to catch the rest
+                    self.reconcileInterval=min(
+                        self.reconcileInterval,self.pollInterval)
+                    return
+                # probably deleted already
+
+    def _apply(self,paths:typing.Set[str])->None:
+        """
+        Apply a batch of changed paths to the index
+        """
+        self.index.updatePaths(sorted(paths,key=len))
+        self.batchesApplied+=1
+        if self.inotify is not None:
+            watched=set(self.inotify.paths.values())
+            for path in paths:
+                if path not in watched and os.path.isdir(path):
+                    tree=[path]
+                    for root,dirs,_ in os.walk(path):
+                        tree.extend(os.path.join(root,d) for d in dirs)
+                    self._watchTree(tree)
+
+    def run(self)->None:
+        """
+        Watch until stop() is called
+        """
+        if self.useInotify:
+            try:
+                self.inotify=Inotify()
+            except (OSError,AttributeError):
+                self.inotify=None
+        if self.inotify is None:
+            self._runPolling()
+            return
+        try:
+            self._watchTree(self.index.directories())
+            self._runInotify()
+        finally:
+            self.inotify.close()
+            self.inotify=None
+
+    def _runPolling(self)->None:
+        while not self._stop.wait(self.pollInterval):
+            if self.index.reconcile():
+                self.batchesApplied+=1
+
+    def _runInotify(self)->None:
+        assert self.inotify is not None
+        pending:typing.Set[str]=set()
+        firstPending=0.0
+        nextReconcile=time.monotonic()+self.reconcileInterval
+        while not self._stop.is_set():
+            now=time.monotonic()
+            timeout=min(nextReconcile-now,0.5)
+            if pending:
+                timeout=min(timeout,firstPending+self.batchDelay-now)
+            for path,mask in self.inotify.read(max(0.0,timeout)):
+                if mask&IN_Q_OVERFLOW:
+                    # lost events, so check everything
+                    nextReconcile=0.0
+                    continue
+                if not pending:
+                    firstPending=time.monotonic()
+                pending.add(path)
+            now=time.monotonic()
+            if pending and (now-firstPending>=self.batchDelay
+                or len(pending)>=self.maxBatch):
+                #
+                self._apply(pending)
+                pending=set()
+            if now>=nextReconcile:
+                if self.index.reconcile():
+                    self._watchTree(self.index.directories())
+                nextReconcile=time.monotonic()+self.reconcileInterval
+        if pending:
+            self._apply(pending)
@@ -0,0 +1,158 @@
+"""
+Convert windows FILETIME values (100ns ticks since 1601-01-01 UTC)
+to and from posix timestamps
+
+This is plain data conversion, so it works on any os.
+"""
+import typing
+import sys
+import array
+import ctypes
+import datetime
+
+WINDOWS_TICKS=10000000 # 100 nanoseconds or .1 microseconds
+WINDOWS_TICKS_TO_POSIX_EPOCH=116444736000000000 # 11644473600 seconds
+
+try:
+    import numpy # type: ignore
+    hasNumpy=True
+except ImportError:
+    hasNumpy=False
+
+
+class FILETIME(ctypes.Structure):
+    """
+    Windows FILETIME structure
+    """
+    _fields_=[
+        ("dwLowDateTime",ctypes.c_uint32),
+        ("dwHighDateTime",ctypes.c_uint32)]
+
+    @property
+    def value(self)->int:
+        """
+        The whole 64-bit tick count
+        """
+        return (self.dwHighDateTime<<32)|self.dwLowDateTime
+
+    @value.setter
+    def value(self,value:int):
+        self.dwLowDateTime=value&0xFFFFFFFF
+        self.dwHighDateTime=(value>>32)&0xFFFFFFFF
+
+    def __int__(self)->int:
+        return self.value
+
+
+FiletimeCompatible=typing.Union[int,bytes,bytearray,FILETIME,
+    ctypes.c_ulonglong,ctypes.c_uint64]
+
+
+def filetimeValue(filetime:FiletimeCompatible)->int:
+    """
+    Get the tick count from any of the ways a FILETIME turns up
+
+    :filetime: an int, 8 little-endian bytes, a FILETIME structure,
+        or a ctypes integer
+    """
+    if isinstance(filetime,int):
+        return filetime
+    if isinstance(filetime,(bytes,bytearray,memoryview)):
+        return int.from_bytes(filetime,'little')
+    return int(filetime.value) # type: ignore
+
+
+def filetimeToPosix(filetime:FiletimeCompatible)->float:
+    """
+    Convert a FILETIME to a posix timestamp
+    """
+    return (filetimeValue(filetime)-WINDOWS_TICKS_TO_POSIX_EPOCH)\
+        /WINDOWS_TICKS
+
+
+def posixToFiletime(timestamp:float)->int:
+    """
+    Convert a posix timestamp to FILETIME ticks
+    """
+    return int(round(timestamp*WINDOWS_TICKS))+WINDOWS_TICKS_TO_POSIX_EPOCH
+
+
+def filetimeToDatetime(filetime:FiletimeCompatible,
+    tz:typing.Optional[datetime.tzinfo]=None)->datetime.datetime:
+    """
+    Convert a FILETIME to a datetime
+
+    :tz: timezone to convert to (default=local time, naive)
+    """
+    ticks=filetimeValue(filetime)-WINDOWS_TICKS_TO_POSIX_EPOCH
+    # do it in whole microseconds to avoid float rounding
+    ret=datetime.datetime(1970,1,1,tzinfo=datetime.timezone.utc)\
+        +datetime.timedelta(microseconds=ticks//10)
+    if tz is None:
+        return ret.astimezone().replace(tzinfo=None)
+    return ret.astimezone(tz)
+
+
+def filetimesToPosix(
+    buffer:typing.Union[bytes,bytearray,memoryview,array.array],
+    useNumpy:typing.Optional[bool]=None
+    )->typing.Any:
+    """
+    Convert a contiguous buffer of little-endian 64-bit FILETIMEs
+    to posix timestamps all in one go
+
+    :useNumpy: use numpy (default=if it is installed)
+
+    returns a numpy float64 array if using numpy,
+    otherwise an array.array('d')
+
+    raises ValueError if the buffer is not a whole number of FILETIMEs
+    """
+    if memoryview(buffer).nbytes%8:
+        raise ValueError('FILETIME buffer length must be a multiple of 8')
+    if useNumpy is None:
+        useNumpy=hasNumpy
+    if useNumpy:
+        ticks=numpy.frombuffer(buffer,dtype='<i8')
+        return (ticks-WINDOWS_TICKS_TO_POSIX_EPOCH)/float(WINDOWS_TICKS)
+    ticks=array.array('Q')
+    ticks.frombytes(memoryview(buffer).cast('B'))
+    if sys.byteorder!='little':
+        ticks.byteswap()
+    epoch=WINDOWS_TICKS_TO_POSIX_EPOCH
+    scale=1.0/WINDOWS_TICKS
+    return array.array('d',[(t-epoch)*scale for t in ticks])
+
+
+def benchmark(numValues:int=1000000)->typing.Dict[str,float]:
+    """
+    Time converting FILETIMEs one at a time vs in bulk
+
+    returns {method:seconds}
+    """
+    import time
+    start=posixToFiletime(time.time())
+    ticks=array.array('Q',range(start,start+numValues*WINDOWS_TICKS,
+        WINDOWS_TICKS))
+    if sys.byteorder!='little':
+        ticks.byteswap()
+    buffer=ticks.tobytes()
+    methods=[
+        ('filetimeToPosix',
+            lambda:[filetimeToPosix(t) for t in ticks]),
+        ('filetimesToPosix',
+            lambda:filetimesToPosix(buffer,False))]
+    if hasNumpy:
+        methods.append(('filetimesToPosix(numpy)',
+            lambda:filetimesToPosix(buffer,True)))
+    ret={}
+    for name,fn in methods:
+        t=time.perf_counter()
+        fn()
+        ret[name]=time.perf_counter()-t
+        print('%-24s %d values in %.3fs'%(name,numValues,ret[name]))
+    return ret
+
+
+if __name__=='__main__':
+    benchmark()
@@ -8,29 +8,91 @@ Works great from the command line too!
 import typing
 import os
 import sys
-import subprocess
+import uuid
+import json
+import concurrent.futures
+try:
+    from . import shellLink
+except ImportError:
+    import shellLink # type: ignore
+
+def _removeLink(path:str)->None:
+    """
+    Remove a link that is known to exist
+    (on windows, directory links have to be removed with rmdir)
+    """
+    if os.name=='nt' and os.path.isdir(path):
+        os.rmdir(path)
+    else:
+        os.unlink(path)
+
 
 def unlink(path:str)->None:
     """
     Remove a symlink if it exists
     fail silently if it does not
     """
-    cmd='rmdir "%s"'%path
-    po=subprocess.Popen(
-        cmd,shell=True,
-        stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-    _,errb=po.communicate()
-    err=errb.decode('utf-8',errors='ignore').strip()
-    if err:
-        if err.startswith('The system cannot find the file specified'):
-            # if it doesn't exist, then it's already "unlinked"!
-            return
-        if err.startswith('The directory name is invalid'):
-            # if it doesn't exist, then it's already "unlinked"!
-            return
-        raise Exception(err)
-
-def linkTarget(path:str)->str:
+    if os.path.islink(path) or _isJunction(path):
+        _removeLink(path)
+    elif os.path.isdir(path):
+        # same as the old "rmdir", which only removes empty directories
+        os.rmdir(path)
+    # if it doesn't exist (or is a regular file),
+    # then it's already "unlinked"!
+
+def _stripExtendedPrefix(path:str)->str:
+    """
+    Remove the windows \\\\?\\ prefix that readlink() sometimes returns
+    """
+    if path.startswith('\\\\?\\UNC\\'):
+        return '\\\\'+path[8:]
+    if path.startswith('\\\\?\\') or path.startswith('\\??\\'):
+        return path[4:]
+    return path
+
+
+def linkHop(path:str)->typing.Optional[str]:
+    """
+    Follow a single symbolic link, junction, or .lnk shortcut
+
+    returns where it points, or None if it is not a link
+    """
+    if os.path.islink(path) or _isJunction(path):
+        target=_stripExtendedPrefix(os.readlink(path))
+        if not os.path.isabs(target):
+            target=os.path.join(os.path.dirname(path),target)
+        return os.path.normpath(target)
+    if path.lower().endswith('.lnk') and os.path.isfile(path):
+        try:
+            shortcut=shellLink.readShellLink(path)
+        except shellLink.ShellLinkError:
+            return None
+        target=shortcut.target
+        if not target:
+            return None
+        if not shortcut.localBasePath and not shortcut.networkPath:
+            # only a relative path was stored
+            target=os.path.join(os.path.dirname(path),
+                target.replace('\\',os.sep))
+        return os.path.normpath(target)
+    return None
+
+
+def _isJunction(path:str)->bool:
+    isjunction=getattr(os.path,'isjunction',None)
+    if isjunction is None:
+        return False
+    return isjunction(path)
+
+
+class CircularLinkError(Exception):
+    """
+    Following a link led back around to itself
+    """
+
+
+def linkTarget(path:str,
+    memo:typing.Optional[typing.Dict[str,str]]=None)->str:
     """
     get the end target of a symbolic link or shorcut
 
@@ -43,61 +105,331 @@ def linkTarget(path:str)->str:
             given: "linkname" links to "filename"
             linkTarget(linkname)=>filename
             linkTarget(filename)=>filename
+
+    :memo: {path:end target} shared between calls
+        so that common hops are only followed once
+        (see also linkTargets())
+
+    raises CircularLinkError if the links go round in a loop
     """
-    visited=set()
+    visited:typing.List[str]=[]
     ret=path
     while True: # keep following links as long as they keep changing
+        if memo is not None and ret in memo:
+            ret=memo[ret]
+            break
         if ret in visited:
-            raise Exception(f'Circular link "{ret}"')
-        visited.add(ret)
-        cmd=['powershell','-command','(Get-Item',ret,').Target']
-        po=subprocess.Popen(cmd,shell=True,
-            stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-        #print('$>',' '.join(cmd))
-        out,err=po.communicate()
-        err=err.strip()
-        if err:
-            raise Exception(err)
-        changed=out.strip().decode('utf-8',errors='ignore')
-        #print(changed)
+            raise CircularLinkError(f'Circular link "{ret}"')
+        visited.append(ret)
+        changed=linkHop(ret)
         if not changed or changed==ret: # no change
-            if ret.endswith('.lnk'):
-                # check .lnk shortcut
-                cmd2=['powershell','-command',
-                    '(New-Object',
-                    '-ComObject',
-                    f"WScript.Shell).CreateShortcut('{ret}').TargetPath"]
-                po=subprocess.Popen(
-                    cmd2,shell=True,
-                    stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-                #print('$>',' '.join(cmd2))
-                out,err=po.communicate()
-                err=err.strip()
-                if err:
-                    raise Exception(err)
-                changed=out.strip().decode('utf-8',errors='ignore')
-            #print(changed)
-            if not changed or changed==ret: # still no change
-                break
+            break
         ret=changed
+    if memo is not None:
+        for hop in visited:
+            memo[hop]=ret
     return ret
 
+
+def linkTargets(paths:typing.Iterable[str],
+    returnExceptions:bool=False,
+    memo:typing.Optional[typing.Dict[str,str]]=None
+    )->typing.Dict[str,typing.Any]:
+    """
+    get the end targets of many links at once,
+    sharing what is learned about intermediate hops
+
+    :returnExceptions: if True, failures (eg circular links)
+        are returned in place of the target rather than raised
+    :memo: {path:end target} to share between calls
+
+    returns {path:target}
+    """
+    if memo is None:
+        memo={}
+    ret:typing.Dict[str,typing.Any]={}
+    for path in paths:
+        try:
+            ret[path]=linkTarget(path,memo)
+        except Exception as e: # pylint: disable=broad-except
+            if not returnExceptions:
+                raise
+            ret[path]=e
+    return ret
+
+
 def ln(fromPath:str,toPath:str)->None:
     """
     Create a symbolic link (even works on windows!)
+
+    :fromPath: what the link should point to
+    :toPath: the link to create
     """
     if os.sep!='/':
         fromPath=fromPath.replace('/',os.sep)
         toPath=toPath.replace('/',os.sep)
-    cmd=['mklink']
-    if os.path.isdir(fromPath):
-        cmd.append('/D')
-    cmd.append(toPath)
-    cmd.append(fromPath)
-    po=subprocess.Popen(cmd,shell=True,
-        stdout=subprocess.PIPE,stderr=subprocess.STDOUT)
-    out,_=po.communicate()
-    print(out.decode('utf-8'))
+    # a relative target is relative to where the link lives
+    isDir=os.path.isdir(os.path.join(os.path.dirname(toPath),fromPath))
+    try:
+        os.symlink(fromPath,toPath,target_is_directory=isDir)
+    except OSError as e:
+        # without symlink privilege on windows, fall back to a junction
+        # (ERROR_PRIVILEGE_NOT_HELD=1314)
+        if os.name!='nt' or not isDir or getattr(e,'winerror',0)!=1314:
+            raise
+        import _winapi # type: ignore
+        _winapi.CreateJunction(
+            os.path.abspath(os.path.join(os.path.dirname(toPath),fromPath)),
+            toPath)
+
+
+def _tempLinkName(path:str)->str:
+    """
+    A unique name for a temporary link next to the given one
+    """
+    directory,name=os.path.split(path)
+    return os.path.join(directory,f'.{name}.{uuid.uuid4().hex[:12]}.tmp')
+
+
+def _readLinkOrNone(path:str)->typing.Optional[str]:
+    """
+    Where an existing link points, or None if there is nothing there
+
+    raises FileExistsError if there is something there
+    that is not a link
+    """
+    if os.path.islink(path) or _isJunction(path):
+        return _stripExtendedPrefix(os.readlink(path))
+    if os.path.lexists(path):
+        raise FileExistsError(f'"{path}" exists and is not a link')
+    return None
+
+
+def _renameLink(src:str,dst:str)->None:
+    """
+    Atomically rename a link over the top of another
+    """
+    try:
+        os.replace(src,dst)
+    except PermissionError:
+        # windows will not replace a directory link, so move the old one
+        # out of the way, and put it back if the new one still won't go
+        if os.name!='nt' or not os.path.lexists(dst):
+            raise
+        backup=_tempLinkName(dst)
+        os.rename(dst,backup)
+        try:
+            os.replace(src,dst)
+        except BaseException:
+            os.rename(backup,dst)
+            raise
+        _removeLink(backup)
+
+
+def replaceLinks(links:typing.Mapping[str,str])->None:
+    """
+    Create or replace many links as a single all-or-nothing operation
+
+    Every new link is first created under a temporary name, then
+    they are all renamed into place.  If anything fails,
+    links that were already switched are put back the way they were.
+
+    :links: {link path:target}  (NOTE: the reverse order of ln())
+
+    raises FileExistsError if a path exists but is not a link
+    """
+    old:typing.Dict[str,typing.Optional[str]]={}
+    temps:typing.Dict[str,str]={}
+    try:
+        for path in links:
+            old[path]=_readLinkOrNone(path)
+        for path,target in links.items():
+            temp=_tempLinkName(path)
+            ln(target,temp)
+            temps[path]=temp
+    except BaseException:
+        for temp in temps.values():
+            unlink(temp)
+        raise
+    switched:typing.List[str]=[]
+    try:
+        for path,temp in temps.items():
+            _renameLink(temp,path)
+            switched.append(path)
+    except BaseException:
+        for path in temps:
+            if path not in switched:
+                unlink(temps[path])
+        for path in reversed(switched):
+            previous=old[path]
+            if previous is None:
+                unlink(path)
+            else:
+                temp=_tempLinkName(path)
+                ln(previous,temp)
+                _renameLink(temp,path)
+        raise
+
+
+LinkRecord=typing.Dict[str,typing.Any]
+def _scanTree(
+    roots:typing.Iterable[str],
+    visit:typing.Callable[[os.DirEntry],typing.Optional[LinkRecord]],
+    threads:int=8
+    )->typing.Generator[LinkRecord,None,None]:
+    """
+    Walk directory trees with os.scandir, spread across a thread pool,
+    calling visit() on every link-like entry
+    (symlinks, junctions, and .lnk files).
+
+    Linked directories are not descended into.
+
+    yields whatever visit() returns (skipping None), plus
+    {'path':directory,'status':'error','error':msg}
+    for directories that could not be read
+    """
+    def scanDir(directory:str
+        )->typing.Tuple[typing.List[LinkRecord],typing.List[str]]:
+        records:typing.List[LinkRecord]=[]
+        subdirs:typing.List[str]=[]
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_symlink() \
+                        or entry.name.lower().endswith('.lnk') \
+                        or _isJunction(entry.path):
+                        #
+                        record=visit(entry)
+                        if record is not None:
+                            records.append(record)
+                    elif entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+        except OSError as e:
+            records.append({'path':directory,'status':'error','error':str(e)})
+        return records,subdirs
+    with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+        pending={pool.submit(scanDir,root) for root in roots}
+        while pending:
+            done,pending=concurrent.futures.wait(
+                pending,return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                records,subdirs=future.result()
+                for subdir in subdirs:
+                    pending.add(pool.submit(scanDir,subdir))
+                yield from records
+
+
+def auditLinks(
+    roots:typing.Union[str,typing.Iterable[str]],
+    threads:int=8
+    )->typing.Generator[LinkRecord,None,None]:
+    """
+    Find every link under some directory trees and where it ends up
+
+    yields {
+        'path':the link,
+        'target':what it points to directly,
+        'final':where it ends up after following all links,
+        'status':'ok'|'broken'|'circular'|'missing'|'error',
+        'error':message (if status is 'circular', 'missing' or 'error')
+        }
+
+    'missing' means the link itself went away while it was being read
+    (as opposed to 'broken', where the link is there but what it
+    points to is not)
+    """
+    if isinstance(roots,str):
+        roots=[roots]
+    memo:typing.Dict[str,str]={}
+    def visit(entry:os.DirEntry)->LinkRecord:
+        record:LinkRecord={'path':entry.path}
+        try:
+            record['target']=linkHop(entry.path)
+            record['final']=linkTarget(entry.path,memo)
+        except CircularLinkError as e:
+            record['status']='circular'
+            record['error']=str(e)
+            return record
+        except FileNotFoundError as e:
+            record['status']='missing'
+            record['error']=str(e)
+            return record
+        except OSError as e:
+            record['status']='error'
+            record['error']=str(e)
+            return record
+        if record['target'] is None:
+            # eg a .lnk file that is not really a shortcut
+            return None # type: ignore
+        if os.path.exists(record['final']):
+            record['status']='ok'
+        else:
+            record['status']='broken'
+        return record
+    yield from _scanTree(roots,visit,threads)
+
+
+def _replaceLink(path:str,target:str)->None:
+    """
+    Point an existing symlink somewhere else
+    """
+    replaceLinks({path:target})
+
+
+def retargetLinks(
+    roots:typing.Union[str,typing.Iterable[str]],
+    oldPrefix:str,
+    newPrefix:str,
+    dryRun:bool=False,
+    threads:int=8
+    )->typing.Generator[LinkRecord,None,None]:
+    """
+    Re-point every symlink under some directory trees whose target
+    starts with oldPrefix so that it starts with newPrefix instead
+    (oldPrefix only matches whole path components)
+
+    :dryRun: only report what would be changed
+
+    yields {
+        'path':the link,
+        'old':the old target,
+        'new':the new target,
+        'status':'retargeted'|'dryRun'|'error',
+        'error':message (if status is 'error')
+        }
+    """
+    if isinstance(roots,str):
+        roots=[roots]
+    seps=os.sep+(os.altsep or '')
+    oldBase=oldPrefix.rstrip(seps)
+    def visit(entry:os.DirEntry)->typing.Optional[LinkRecord]:
+        if not (entry.is_symlink() or _isJunction(entry.path)):
+            return None
+        try:
+            old=_stripExtendedPrefix(os.readlink(entry.path))
+        except OSError as e:
+            return {'path':entry.path,'status':'error','error':str(e)}
+        # only match whole path components, so v1 does not match v10
+        if old==oldPrefix:
+            rest=''
+        elif old.startswith(oldBase) and old[len(oldBase):][:1] in seps:
+            rest=old[len(oldBase):]
+        else:
+            return None
+        new=(newPrefix.rstrip(seps)+rest) if rest else newPrefix
+        record:LinkRecord={'path':entry.path,'old':old,'new':new}
+        if dryRun:
+            record['status']='dryRun'
+            return record
+        try:
+            _replaceLink(entry.path,new)
+            record['status']='retargeted'
+        except Exception as e: # pylint: disable=broad-except
+            record['status']='error'
+            record['error']=str(e)
+        return record
+    yield from _scanTree(roots,visit,threads)
+
 
 def cmdline(args:typing.Iterable[str])->int:
     """
@@ -106,6 +438,8 @@ def cmdline(args:typing.Iterable[str])->int:
     printhelp=False
     fromTo=[]
     behaviour='link'
+    dryRun=False
+    threads=8
     for arg in args:
         if arg.startswith('-'):
             av=arg.split('=',1)
@@ -124,6 +458,22 @@ def cmdline(args:typing.Iterable[str])->int:
                 if len(av)>1:
                     fromTo.append(av[1])
                 behaviour='target'
+            elif av[0]=='--audit':
+                if len(av)>1:
+                    fromTo.append(av[1])
+                behaviour='audit'
+            elif av[0]=='--retarget':
+                if len(av)>1:
+                    fromTo.append(av[1])
+                behaviour='retarget'
+            elif av[0] in ('-n','--dry-run'):
+                dryRun=True
+            elif av[0]=='--threads':
+                if len(av)>1 and av[1].isdigit() and int(av[1])>0:
+                    threads=int(av[1])
+                else:
+                    print('ERR: --threads needs a number, eg --threads=4')
+                    printhelp=True
             else:
                 print('ERR: Unknown Argument "%s"'%arg)
                 printhelp=True
@@ -142,20 +492,45 @@ def cmdline(args:typing.Iterable[str])->int:
         else:
             unlink(fromTo[0])
     elif behaviour=='target':
-        if len(fromTo)!=1:
+        if not fromTo:
             print('Unknown useage')
             printhelp=True
-        else:
+        elif len(fromTo)==1:
             print(linkTarget(fromTo[0]))
+        else:
+            for path,target in linkTargets(fromTo,True).items():
+                print(f'{path} -> {target}')
+    elif behaviour=='audit':
+        if not fromTo:
+            print('Unknown useage')
+            printhelp=True
+        else:
+            for record in auditLinks(fromTo,threads):
+                print(json.dumps(record),flush=True)
+    elif behaviour=='retarget':
+        if len(fromTo)<3:
+            print('Unknown useage')
+            printhelp=True
+        else:
+            for record in retargetLinks(
+                fromTo[:-2],fromTo[-2],fromTo[-1],dryRun,threads):
+                #
+                print(json.dumps(record),flush=True)
     if printhelp:
         print('Implementation of linux symbolic link command "ln" on windows')
         print('Useage:')
         print('   ln.py [options] [fromFile] [toLinkName]')
+        print('   ln.py --audit [directory ...]')
+        print('   ln.py --retarget [directory ...] [oldPrefix] [newPrefix]')
         print('Options:')
         print('   --help ......... show this help')
         print('   -s ............. symbolic flag (ignored)')
         print('   -u,--unlink .... unlink')
-        print('   -t,--target .... get the target instead')
+        print('   -t,--target .... get the target(s) instead')
+        print('   --audit ........ list every link in a tree as json lines')
+        print('   --retarget ..... re-point links in a tree to a new prefix')
+        print('   -n,--dry-run ... with --retarget, only show changes')
+        print('   --threads=n .... how many threads to scan with (default=8)')
         return -1
     return 0
 
@@ -3,50 +3,287 @@ Tools to run powershell commands and interperet the results in a pythonic way
 """
 import typing
 import re
-import k_runner.osrun as osrun
+import collections
+import operator
+import array
+import asyncio
+import json
+import csv
+import time
+try:
+    from .psCache import normalizeCommand
+except ImportError:
+    from psCache import normalizeCommand
 
 CmdCompatible=typing.Union[str,typing.Iterable[str]]
 PsDataResult=typing.Dict[str,str]
 
+# how to launch a shell to run a single command
+psShellCommand=['powershell','-c']
+
 
 psTableHeader = re.compile(r'[^\s]+')
-def psTableDissect(
-    lines:typing.Union[typing.List[str],str]
-    )->typing.Iterable[PsDataResult]:
-    """
-    convert a powershell-formatted table into something useable
+PsTableLines=typing.Union[str,typing.Iterable[str],typing.TextIO]
 
-    :lines: either a list of lines or a string to split using '\n'
 
-    returns json-compatible [{k:v},...]
+def _iterLines(lines:PsTableLines)->typing.Iterator[str]:
+    """
+    Iterate over lines from a string, a list of lines,
+    or any file-like object, without line endings
     """
     if isinstance(lines,str):
         lines=lines.split('\n')
-    ret:typing.List[typing.Dict]=[]
-    header:typing.List[str]=[]
-    colIndices:typing.List[int]=[]
-    separator=None
     for line in lines:
+        yield line.rstrip('\r\n')
+
+
+class PsTableLayout:
+    """
+    The column layout of a powershell-formatted table,
+    worked out once from the header line and then used to
+    split every row with a single precompiled slicer.
+    """
+
+    def __init__(self,headerLine:str):
+        self.header:typing.List[str]=[]
+        starts:typing.List[int]=[]
+        for m in psTableHeader.finditer(headerLine):
+            self.header.append(m.group(0))
+            starts.append(m.start(0))
+        ends:typing.List[typing.Optional[int]]=starts[1:]
+        ends.append(None)
+        self.slices=[slice(a,b) for a,b in zip(starts,ends)]
+        self.indices={k:i for i,k in enumerate(self.header)}
+        self._getter=operator.itemgetter(*self.slices) \
+            if len(self.slices)>1 else None
+
+    def __len__(self)->int:
+        return len(self.header)
+
+    def split(self,line:str)->typing.Tuple[str,...]:
+        """
+        Split a row into a tuple of stripped values
+        """
+        if self._getter is None:
+            return (line[self.slices[0]].strip(),) if self.slices else ()
+        return tuple(map(str.strip,self._getter(line)))
+
+    def column(self,k:typing.Union[str,int])->typing.Callable[[str],str]:
+        """
+        Get a function that pulls a single column value out of a row
+        """
+        if isinstance(k,str):
+            k=self.indices[k]
+        s=self.slices[k]
+        return lambda line:line[s].strip()
+
+
+def _iterTableRows(lines:PsTableLines
+    )->typing.Generator[typing.Union[PsTableLayout,str],None,None]:
+    """
+    Yield the table layout, followed by each row line
+    """
+    layout=None
+    separator=None
+    for line in _iterLines(lines):
         if not line:
             continue
-        if not header:
-            for m in psTableHeader.finditer(line):
-                header.append(m.group(0))
-                colIndices.append(m.start(0))
-            if colIndices:
-                colIndices.append(-1)
+        if layout is None:
+            layout=PsTableLayout(line)
+            yield layout
         elif separator is None:
             # Consume separator row
             separator=line
         else:
-            row={}
-            for i,k in enumerate(header):
-                v=line[colIndices[i]:colIndices[i+1]]
-                row[k]=v.strip()
-            ret.append(row)
+            yield line
+
+
+def psTableDissectIter(
+    lines:PsTableLines,
+    rowType:str='dict'
+    )->typing.Generator[typing.Any,None,None]:
+    """
+    Streaming version of psTableDissect()
+
+    Rows are yielded as soon as they are read, so memory stays flat
+    no matter how large the table is.
+
+    :lines: a string, an iterable of lines, or a file-like stream
+    :rowType: what to yield for each row
+        'dict' - {k:v} (same as psTableDissect)
+        'namedtuple' - a namedtuple built from the header
+            (no per-row key dict, but still accessible by name)
+        'tuple' - a plain tuple in header order
+    """
+    if rowType not in ('dict','namedtuple','tuple'):
+        raise ValueError(f'Unknown rowType "{rowType}"')
+    rows=_iterTableRows(lines)
+    layout=next(rows,None)
+    if not isinstance(layout,PsTableLayout):
+        return
+    split=layout.split
+    if rowType=='dict':
+        header=layout.header
+        for line in rows:
+            yield dict(zip(header,split(line))) # type: ignore
+    elif rowType=='namedtuple':
+        make=collections.namedtuple( # type: ignore
+            'PsTableRow',layout.header,rename=True)._make
+        for line in rows:
+            yield make(split(line)) # type: ignore
+    else:
+        for line in rows:
+            yield split(line) # type: ignore
+
+
+def _arrayCast(typecode:str)->typing.Callable[[str],typing.Any]:
+    """
+    A function to convert a table cell for an array.array(typecode)
+    (blank cells become 0, or NaN for floating point)
+    """
+    if typecode in 'fd':
+        convert:typing.Callable[[str],typing.Any]=float
+        blank:typing.Any=float('nan')
+    else:
+        convert=int
+        blank=0
+    def cast(v:str)->typing.Any:
+        try:
+            return convert(v)
+        except ValueError:
+            if v.strip():
+                raise
+            return blank
+    return cast
+
+
+def psTableDissectColumns(
+    lines:PsTableLines,
+    columns:typing.Optional[typing.Iterable[str]]=None,
+    arrayTypes:typing.Optional[typing.Dict[str,str]]=None
+    )->typing.Dict[str,typing.Any]:
+    """
+    Columnar version of psTableDissect()
+
+    Rather than a dict per row, returns one list per column,
+    so aggregating a column does not create a dict for every row.
+
+    :lines: a string, an iterable of lines, or a file-like stream
+    :columns: only collect these columns (default=all of them)
+    :arrayTypes: {column:typecode} to collect into an array.array
+        rather than a list, eg {'WS(K)':'q'}.
+        Values will be cast with int() or float() as appropriate.
+        Blank cells (eg the CPU(s) of system processes) become 0
+        for integer typecodes and NaN for 'f' and 'd'.
+
+    returns {column:[values]}
+    """
+    rows=_iterTableRows(lines)
+    layout=next(rows,None)
+    if not isinstance(layout,PsTableLayout):
+        return {}
+    if columns is None:
+        columns=layout.header
+    arrayTypes=arrayTypes or {}
+    ret:typing.Dict[str,typing.Any]={}
+    collectors=[]
+    for k in columns:
+        if k in arrayTypes:
+            typecode=arrayTypes[k]
+            ret[k]=array.array(typecode)
+            cast=_arrayCast(typecode)
+        else:
+            ret[k]=[]
+            cast=None
+        collectors.append((layout.slices[layout.indices[k]],
+            ret[k].append,cast))
+    if len(collectors)==1:
+        # the common case of aggregating a single column
+        s,append,cast=collectors[0]
+        if cast is None:
+            for line in rows:
+                append(line[s].strip()) # type: ignore
+        else:
+            for line in rows:
+                append(cast(line[s])) # type: ignore
+        return ret
+    for line in rows:
+        for s,append,cast in collectors:
+            v=line[s].strip() # type: ignore
+            append(v if cast is None else cast(v))
     return ret
 
 
+def psTableDissect(
+    lines:typing.Union[typing.List[str],str]
+    )->typing.Iterable[PsDataResult]:
+    """
+    convert a powershell-formatted table into something useable
+
+    :lines: either a list of lines or a string to split using '\n'
+
+    returns json-compatible [{k:v},...]
+
+    See also:
+        psTableDissectIter() to stream very large tables
+    """
+    return list(psTableDissectIter(lines))
+
+
+def psColonListDissectIter(lines:PsTableLines,
+    wrapWidth:int=0
+    )->typing.Generator[PsDataResult,None,None]:
+    """
+    convert powershell Format-List output into a series of records,
+    yielding each one as soon as it is complete
+
+    eg
+        thisitem    : 1
+        anotheritem : a value that is long enough
+                      to wrap onto another line
+
+        thisitem    : 2
+        anotheritem : 3
+
+    Records are separated by blank lines.  Lines that start with
+    whitespace (or have no colon) continue the previous value,
+    and are joined on with a space.
+
+    Powershell wraps at the console width even in the middle of a word
+    (eg a long path).  If you know that width, pass it as wrapWidth and
+    a continuation is joined on without a space whenever the line
+    before it filled the width.
+
+    :lines: a string, an iterable of lines, or a file-like stream
+    :wrapWidth: the console width the output was wrapped at
+        (default=0, unknown, so always join with a space)
+    """
+    record:PsDataResult={}
+    k=None
+    previousLength=0
+    for line in _iterLines(lines):
+        if not line or line.isspace():
+            if record:
+                yield record
+                record={}
+                k=None
+            continue
+        if k is not None and (line[0] in ' \t' or ':' not in line):
+            # continuation of the previous value
+            sep=' '
+            if wrapWidth>0 and previousLength>=wrapWidth:
+                sep=''
+            record[k]=f'{record[k]}{sep}{line.strip()}'.strip()
+            previousLength=len(line)
+            continue
+        kv=line.split(':',1)
+        k=kv[0].strip()
+        record[k]=kv[1].strip() if len(kv)>1 else ''
+        previousLength=len(line)
+    if record:
+        yield record
+
+
 def psColonListDissect(lines:typing.Union[typing.List[str],str])->PsDataResult:
     """
     convert a powershell-formatted key:value list into something useable
@@ -58,17 +295,55 @@ def psColonListDissect(lines:typing.Union[typing.List[str],str])->PsDataResult:
 
     :lines: either a list of lines or a string to split using '\n'
 
-    returns json-compatible {k:v}
+    returns json-compatible {k:v} for the first record
+
+    See also:
+        psColonListDissectIter() for output with many records
     """
-    ret={}
-    if isinstance(lines,str):
-        lines='\n'.split(lines)
-    for line in lines:
-        if not line:
-            continue
-        kv=line.split(':',1)
-        ret[kv[0].strip()]=kv[1].strip()
-    return ret
+    for record in psColonListDissectIter(lines):
+        return record
+    return {}
+
+
+workerPool:typing.Optional[typing.Any]=None
+def setWorkerPool(pool:typing.Optional[typing.Any])->None:
+    """
+    Send all psCommand*() calls through a pool of long-lived shells
+    (see psPool.ShellWorkerPool) instead of starting a new
+    powershell every time.
+
+    :pool: the pool to use, or None to go back to one process per command
+    """
+    global workerPool
+    workerPool=pool
+
+
+resultCache:typing.Optional[typing.Any]=None
+def setResultCache(cache:typing.Optional[typing.Any])->None:
+    """
+    Memoize the results of all psCommand*() calls
+    (see psCache.ResultCache)
+
+    Only do this when the commands being run are read-only queries!
+
+    :cache: the cache to use, or None to stop caching
+    """
+    global resultCache
+    resultCache=cache
+
+
+def _psRun(cmd:str)->str:
+    """
+    Actually run a powershell command
+    """
+    if workerPool is not None:
+        return workerPool.run(cmd)
+    # imported here so the parsers (and the worker pool) do not need it
+    import k_runner.osrun as osrun
+    result=osrun.osrun(psShellCommand+[cmd])
+    if result.err:
+        raise Exception(result.err)
+    return result.out
 
 
 def psCommand(cmd:CmdCompatible)->str:
@@ -77,10 +352,12 @@ def psCommand(cmd:CmdCompatible)->str:
     """
     if not isinstance(cmd,str):
         cmd=' '.join(cmd)
-    result=osrun.osrun(['powershell','-c',cmd])
-    if result.err:
-        raise Exception(result.err)
-    return result.out
+    if resultCache is not None:
+        # the cache key is normalized, so run what the caller gave us
+        original=cmd
+        return resultCache.get(
+            normalizeCommand(cmd),lambda _:_psRun(original))
+    return _psRun(cmd)
 
 
 def psCommandWithTableOutput(cmd:CmdCompatible)->typing.Iterable[PsDataResult]:
@@ -105,6 +382,271 @@ def psCommandWithColonListOutput(cmd:CmdCompatible)->PsDataResult:
     return psColonListDissect(psCommand(cmd))
 
 
+def psCommandWithColonListRecords(cmd:CmdCompatible
+    )->typing.List[PsDataResult]:
+    """
+    Run a powershell command that outputs many colon-list records
+    (eg anything piped to Format-List)
+
+    result will be converted to [{k:v}] with psColonListDissectIter()
+    """
+    return list(psColonListDissectIter(psCommand(cmd)))
+
+
+# what counts as a number in structured output
+# (unlike int() and float(), no leading zeros, underscores, or spaces,
+# so that eg a zero-padded id or "1_0" stays a string)
+_psIntValue=re.compile(r'[-+]?(?:0|[1-9][0-9]*)')
+_psFloatValue=re.compile(
+    r'[-+]?(?:(?:0|[1-9][0-9]*)(?:\.[0-9]+)?|\.[0-9]+)(?:[eE][-+]?[0-9]+)?')
+
+
+def psTypedValue(v:typing.Optional[str])->typing.Any:
+    """
+    Cast a string value from structured output to int, float, or bool
+    if it looks like one.  Empty values become None.
+
+    Only plain numbers are converted, so things like "007" or "1_0"
+    are left as strings.
+    """
+    if not v:
+        return None
+    c=v[0]
+    if c.isdigit() or c in '-+.':
+        if _psIntValue.fullmatch(v):
+            return int(v)
+        if _psFloatValue.fullmatch(v):
+            return float(v)
+    elif c in 'TtFf':
+        lv=v.lower()
+        if lv=='true':
+            return True
+        if lv=='false':
+            return False
+    return v
+
+
+def psStructuredCommand(cmd:CmdCompatible,
+    outputFormat:str='json',depth:int=2)->str:
+    """
+    Wrap a powershell command so that it outputs structured data
+    instead of a formatted table
+
+    :outputFormat: 'json' - one compressed json object per line
+        'csv' - csv with a header row
+    :depth: how deep to serialize nested objects (json only)
+    """
+    if not isinstance(cmd,str):
+        cmd=' '.join(cmd)
+    if outputFormat=='json':
+        return '%s | ForEach-Object { ConvertTo-Json -InputObject $_ '\
+            '-Compress -Depth %d }'%(cmd,depth)
+    if outputFormat=='csv':
+        return '%s | ConvertTo-Csv -NoTypeInformation'%cmd
+    raise ValueError(f'Unknown output format "{outputFormat}"')
+
+
+def psJsonDissectIter(lines:PsTableLines
+    )->typing.Generator[typing.Any,None,None]:
+    """
+    Decode the output of psStructuredCommand(...,'json'),
+    one object per line, as it arrives
+
+    :lines: a string, an iterable of lines, or a file-like stream
+    """
+    decode=json.JSONDecoder().decode
+    for line in _iterLines(lines):
+        if line:
+            yield decode(line)
+
+
+def psCsvDissectIter(lines:PsTableLines,typed:bool=True
+    )->typing.Generator[typing.Dict[str,typing.Any],None,None]:
+    """
+    Decode the output of psStructuredCommand(...,'csv'),
+    one row at a time as it arrives
+
+    :lines: a string, an iterable of lines, or a file-like stream
+    :typed: convert values with psTypedValue()
+    """
+    reader=csv.reader(line for line in _iterLines(lines) if line)
+    header=next(reader,None)
+    if header is None:
+        return
+    for row in reader:
+        if typed:
+            row=[psTypedValue(v) for v in row] # type: ignore
+        yield dict(zip(header,row))
+
+
+def psCommandWithStructuredOutput(cmd:CmdCompatible,
+    outputFormat:str='json'
+    )->typing.List[typing.Dict[str,typing.Any]]:
+    """
+    Run a powershell command, having it return structured data
+    rather than a formatted table
+
+    :outputFormat: 'json' or 'csv'
+
+    returns [{k:v}] with typed values
+    """
+    out=psCommand(psStructuredCommand(cmd,outputFormat))
+    if outputFormat=='csv':
+        return list(psCsvDissectIter(out))
+    return list(psJsonDissectIter(out))
+
+
+def psCommandWithJsonOutput(cmd:CmdCompatible
+    )->typing.List[typing.Dict[str,typing.Any]]:
+    """
+    Run a powershell command and get the results via ConvertTo-Json
+    """
+    return psCommandWithStructuredOutput(cmd,'json')
+
+
+def psCommandWithCsvOutput(cmd:CmdCompatible
+    )->typing.List[typing.Dict[str,typing.Any]]:
+    """
+    Run a powershell command and get the results via ConvertTo-Csv
+    """
+    return psCommandWithStructuredOutput(cmd,'csv')
+
+async def psCommandAsync(cmd:CmdCompatible)->str:
+    """
+    asyncio version of psCommand()
+    """
+    if not isinstance(cmd,str):
+        cmd=' '.join(cmd)
+    po=await asyncio.create_subprocess_exec(*psShellCommand,cmd,
+        stdout=asyncio.subprocess.PIPE,stderr=asyncio.subprocess.PIPE)
+    outb,errb=await po.communicate()
+    err=errb.decode('utf-8',errors='ignore').strip()
+    if err:
+        raise Exception(err)
+    return outb.decode('utf-8',errors='ignore')
+
+
+async def psCommandWithTableOutputAsync(cmd:CmdCompatible
+    )->typing.Iterable[PsDataResult]:
+    """
+    asyncio version of psCommandWithTableOutput()
+    """
+    return psTableDissect(await psCommandAsync(cmd))
+
+
+async def psCommandWithColonListOutputAsync(cmd:CmdCompatible
+    )->PsDataResult:
+    """
+    asyncio version of psCommandWithColonListOutput()
+    """
+    return psColonListDissect(await psCommandAsync(cmd))
+
+
+AsyncPsCommand=typing.Callable[[CmdCompatible],typing.Awaitable[typing.Any]]
+async def psGatherAsync(
+    cmds:typing.Iterable[CmdCompatible],
+    maxConcurrent:int=8,
+    command:AsyncPsCommand=psCommandAsync,
+    returnExceptions:bool=False
+    )->typing.List[typing.Any]:
+    """
+    Run many commands at once, no more than maxConcurrent at a time
+
+    :command: which async command to run each one with,
+        eg psCommandWithTableOutputAsync
+    :returnExceptions: if True, failures are returned in place of
+        their result rather than raised
+
+    returns results in the same order as cmds
+    """
+    semaphore=asyncio.Semaphore(maxConcurrent)
+    async def limited(cmd:CmdCompatible)->typing.Any:
+        async with semaphore:
+            return await command(cmd)
+    return await asyncio.gather(*[limited(cmd) for cmd in cmds],
+        return_exceptions=returnExceptions)
+
+
+def psGather(
+    cmds:typing.Iterable[CmdCompatible],
+    maxConcurrent:int=8,
+    command:AsyncPsCommand=psCommandAsync,
+    returnExceptions:bool=False
+    )->typing.List[typing.Any]:
+    """
+    Blocking wrapper around psGatherAsync() for non-async callers
+    """
+    return asyncio.run(psGatherAsync(
+        cmds,maxConcurrent,command,returnExceptions))
+
+
+def _benchmarkFixture(numRows:int)->typing.Tuple[str,str,str,str]:
+    """
+    Create the same process-like data as a formatted table,
+    json lines, csv, and a Format-List colon list
+
+    returns (table,jsonLines,csv,colonList)
+    """
+    header=('Handles','NPM(K)','PM(K)','WS(K)','CPU(s)','Id','ProcessName')
+    widths=(7,6,10,10,10,6,0)
+    rows=[]
+    for i in range(numRows):
+        rows.append((
+            100+i%900,
+            i%64,
+            4096+(i*37)%100000,
+            8192+(i*53)%200000,
+            round((i%1000)/7.0,2),
+            1000+i,
+            f'process{i%500}'))
+    def fmt(values)->str:
+        return ' '.join(str(v).ljust(w) for v,w in zip(values,widths))
+    table=[fmt(header),fmt(['-'*len(h) for h in header])]
+    table.extend(fmt(row) for row in rows)
+    jsonLines=[json.dumps(dict(zip(header,row)),separators=(',',':'))
+        for row in rows]
+    csvLines=[','.join(f'"{h}"' for h in header)]
+    csvLines.extend(','.join(f'"{v}"' for v in row) for row in rows)
+    colonList=[]
+    keyWidth=max(len(h) for h in header)
+    for row in rows:
+        colonList.append('')
+        colonList.extend(f'{h.ljust(keyWidth)} : {v}'
+            for h,v in zip(header,row))
+        colonList.append(' '*(keyWidth+3)+'(wrapped continuation)')
+    return '\n'.join(table),'\n'.join(jsonLines),'\n'.join(csvLines),\
+        '\n'.join(colonList)
+
+
+def benchmark(numRows:int=100000)->typing.Dict[str,float]:
+    """
+    Compare the throughput of the table dissector,
+    the structured decoders, and the colon list dissector
+
+    The fixture is generated (deterministically) rather than
+    shipped, since 100k rows is several megabytes.
+
+    returns {dissector:seconds}
+    """
+    table,jsonLines,csvText,colonList=_benchmarkFixture(numRows)
+    ret={}
+    for name,fn,data in (
+        ('psTableDissect',psTableDissect,table),
+        ('psTableDissectColumns',
+            lambda x:psTableDissectColumns(x,['WS(K)'],{'WS(K)':'q'}),
+            table),
+        ('psJsonDissectIter',lambda x:list(psJsonDissectIter(x)),jsonLines),
+        ('psCsvDissectIter',lambda x:list(psCsvDissectIter(x)),csvText),
+        ('psColonListDissectIter',
+            lambda x:sum(1 for _ in psColonListDissectIter(x)),colonList)):
+        #
+        start=time.perf_counter()
+        fn(data)
+        ret[name]=time.perf_counter()-start
+        print('%-24s %d rows in %.3fs'%(name,numRows,ret[name]))
+    return ret
+
+
 def cmdline(args:typing.Iterable[str])->int:
     """
     Run the command line
@@ -122,6 +664,9 @@ def cmdline(args:typing.Iterable[str])->int:
             av[0]=av[0].lower()
             if av[0] in ('-h','--help'):
                 printhelp=True
+            elif av[0]=='--benchmark':
+                benchmark()
+                didSomething=True
             elif av[0]=='--output':
                 if len(av)>1:
                     output=av[1]
@@ -135,6 +680,8 @@ def cmdline(args:typing.Iterable[str])->int:
                 print(psCommandWithTableOutput(args[i:]))
             elif output=='list':
                 print(psCommandWithColonListOutput(args[i:]))
+            elif output in ('json','csv'):
+                print(psCommandWithStructuredOutput(args[i:],output))
             else:
                 print(psCommand(args[i:]))
             break
@@ -144,8 +691,9 @@ def cmdline(args:typing.Iterable[str])->int:
         print('  ps [options] [commands]')
         print('OPTIONS:')
         print('  -h ................................. this help')
-        print('  --output=list|table ................ specify output type ')
+        print('  --output=list|table|json|csv ....... specify output type ')
         print('                                  to dissect (default=none)')
+        print('  --benchmark ........................ time the dissectors')
         return 1
     return 0
 
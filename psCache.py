@@ -0,0 +1,167 @@
+"""
+A memoizing cache for the results of shell commands
+
+Install it behind the ps module's psCommand functions with
+ps.setResultCache() so that repeated read-only queries
+(service lists, installed programs, etc) only run once
+every so often.
+"""
+import typing
+import re
+import time
+import threading
+import collections
+
+
+_cmdToken=re.compile(r"'[^']*'|\"[^\"]*\"|\S+")
+def normalizeCommand(cmd:typing.Union[str,typing.Iterable[str]])->str:
+    """
+    Normalize a command for use as a cache key
+    (whitespace outside of quotes is collapsed)
+    """
+    if not isinstance(cmd,str):
+        cmd=' '.join(cmd)
+    return ' '.join(_cmdToken.findall(cmd))
+
+
+class _Entry:
+    """
+    A cached value
+    """
+    __slots__=('value','expires')
+
+    def __init__(self,value:typing.Any,expires:float):
+        self.value=value
+        self.expires=expires
+
+
+class _Pending:
+    """
+    A value that some thread is busy computing
+    """
+    __slots__=('done','value','error')
+
+    def __init__(self):
+        self.done=threading.Event()
+        self.value:typing.Any=None
+        self.error:typing.Optional[BaseException]=None
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with time-to-live
+
+    Concurrent callers asking for the same key share
+    a single execution rather than all running it at once.
+    Failures are passed on to everyone waiting, but never cached.
+    """
+
+    def __init__(self,ttl:float=5.0,maxSize:int=256):
+        """
+        :ttl: default seconds a result stays good
+        :maxSize: maximum number of results to keep
+            (least recently used are dropped first)
+        """
+        self.ttl=ttl
+        self.maxSize=maxSize
+        self.hits=0
+        self.misses=0
+        self._entries:"collections.OrderedDict[str,_Entry]"=\
+            collections.OrderedDict()
+        self._pending:typing.Dict[str,_Pending]={}
+        self._lock=threading.Lock()
+
+    def __len__(self)->int:
+        return len(self._entries)
+
+    def __contains__(self,key:str)->bool:
+        with self._lock:
+            entry=self._entries.get(key)
+            return entry is not None and entry.expires>time.monotonic()
+
+    def get(self,
+        key:str,
+        compute:typing.Callable[[str],typing.Any],
+        ttl:typing.Optional[float]=None
+        )->typing.Any:
+        """
+        Get a cached value, calling compute(key) if it is
+        missing or expired
+
+        :ttl: seconds to keep this value (default=self.ttl)
+        """
+        with self._lock:
+            entry=self._entries.get(key)
+            if entry is not None:
+                if entry.expires>time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits+=1
+                    return entry.value
+                del self._entries[key]
+            self.misses+=1
+            pending=self._pending.get(key)
+            owner=pending is None
+            if owner:
+                pending=_Pending()
+                self._pending[key]=pending
+        assert pending is not None
+        if not owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+        try:
+            pending.value=compute(key)
+        except BaseException as e:
+            pending.error=e
+            raise
+        else:
+            if ttl is None:
+                ttl=self.ttl
+            with self._lock:
+                self._entries[key]=_Entry(
+                    pending.value,time.monotonic()+ttl)
+                self._entries.move_to_end(key)
+                while len(self._entries)>self.maxSize:
+                    self._entries.popitem(last=False)
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.done.set()
+        return pending.value
+
+    def invalidate(self,key:typing.Optional[str]=None)->None:
+        """
+        Forget a cached value
+
+        :key: what to forget (None=forget everything)
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key,None)
+
+    def invalidateMatching(self,pattern:typing.Union[str,typing.Pattern]
+        )->int:
+        """
+        Forget all cached values whose key matches a regex
+
+        returns how many were forgotten
+        """
+        if isinstance(pattern,str):
+            pattern=re.compile(pattern)
+        with self._lock:
+            keys=[k for k in self._entries if pattern.search(k)]
+            for k in keys:
+                del self._entries[k]
+        return len(keys)
+
+    def stats(self)->typing.Dict[str,int]:
+        """
+        Get the hit/miss counters
+
+        returns {'hits':n,'misses':n,'size':n}
+        """
+        return {'hits':self.hits,'misses':self.misses,
+            'size':len(self._entries)}
@@ -0,0 +1,320 @@
+"""
+A pool of long-lived shell processes to run commands on
+
+Starting a new powershell for every command is most of the cost of
+a small query.  This keeps a few shells running and feeds them commands
+over stdin, using a unique sentinel line to know where each command's
+output ends.
+
+The shell itself is pluggable, so the same pool can drive
+windows powershell, pwsh, or bash (or a fake shell for testing).
+"""
+import typing
+import os
+import time
+import uuid
+import base64
+import queue
+import threading
+import subprocess
+try:
+    from .ps import CmdCompatible,PsDataResult, \
+        psTableDissect,psColonListDissect
+except ImportError:
+    from ps import CmdCompatible,PsDataResult, \
+        psTableDissect,psColonListDissect
+
+
+class ShellBackend:
+    """
+    Describes how to start a shell and how to frame a command
+    so that its output ends with a sentinel line
+    on both stdout and stderr.
+
+    Override frameCommand() to support other shells.
+    """
+
+    # frameCommand() puts a newline before the sentinel, so that it is
+    # on a line of its own even when the output did not end with one
+    # (_readUntil() drops the extra empty line this leaves)
+    newlineBeforeSentinel:bool=False
+
+    def __init__(self,
+        command:typing.List[str],
+        startup:typing.Optional[typing.Iterable[str]]=None):
+        """
+        :command: the command line to start the shell with
+        :startup: commands to send the shell once it is started
+        """
+        self.command=command
+        self.startup:typing.List[str]=list(startup or [])
+
+    def frameCommand(self,cmd:str,sentinel:str)->str:
+        """
+        Create the text to send to the shell's stdin
+        """
+        raise NotImplementedError()
+
+
+class PowershellBackend(ShellBackend):
+    """
+    Windows powershell (or pwsh) reading commands from stdin
+    """
+
+    def __init__(self,exe:str='powershell'):
+        ShellBackend.__init__(self,
+            [exe,'-NoLogo','-NoProfile','-NonInteractive','-Command','-'],
+            ['[Console]::OutputEncoding=[Text.Encoding]::UTF8'])
+
+    def frameCommand(self,cmd:str,sentinel:str)->str:
+        # base64 the command so that quotes and newlines survive
+        encoded=base64.b64encode(cmd.encode('utf-8')).decode('ascii')
+        return ''.join((
+            'Invoke-Expression ([Text.Encoding]::UTF8.GetString(',
+            f"[Convert]::FromBase64String('{encoded}')))",
+            ' | Out-String -Stream -Width 4096;',
+            f"[Console]::Out.WriteLine('{sentinel}');",
+            f"[Console]::Error.WriteLine('{sentinel}')\n"))
+
+
+class PwshBackend(PowershellBackend):
+    """
+    Cross-platform powershell core
+    """
+
+    def __init__(self,exe:str='pwsh'):
+        PowershellBackend.__init__(self,exe)
+
+
+class BashBackend(ShellBackend):
+    """
+    A bash (or other posix sh) shell
+    """
+
+    newlineBeforeSentinel=True
+
+    def __init__(self,exe:str='bash'):
+        ShellBackend.__init__(self,[exe,'--noprofile','--norc'])
+
+    def frameCommand(self,cmd:str,sentinel:str)->str:
+        # printf rather than echo so that the sentinel gets a line of
+        # its own even if cmd's output did not end with a newline
+        return ''.join((
+            f"{cmd}\n",
+            f"printf '\\n%s\\n' '{sentinel}'\n",
+            f"printf '\\n%s\\n' '{sentinel}' >&2\n"))
+
+
+def defaultBackend()->ShellBackend:
+    """
+    The backend used when none is specified
+    """
+    if os.name=='nt':
+        return PowershellBackend()
+    return PwshBackend()
+
+
+class ShellWorker:
+    """
+    A single long-lived shell process
+    """
+
+    def __init__(self,backend:ShellBackend):
+        self.backend=backend
+        self._process:typing.Optional[subprocess.Popen]=None
+        self._out:"queue.Queue[typing.Optional[str]]"=queue.Queue()
+        self._err:"queue.Queue[typing.Optional[str]]"=queue.Queue()
+
+    @property
+    def alive(self)->bool:
+        """
+        Is the shell process running
+        """
+        return self._process is not None and self._process.poll() is None
+
+    def start(self)->None:
+        """
+        Start (or restart) the shell process
+        """
+        self.stop()
+        self._out=queue.Queue()
+        self._err=queue.Queue()
+        self._process=subprocess.Popen(self.backend.command,
+            stdin=subprocess.PIPE,stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            encoding='utf-8',errors='ignore',bufsize=1)
+        for stream,q in ((self._process.stdout,self._out),
+            (self._process.stderr,self._err)):
+            threading.Thread(target=self._pump,args=(stream,q),
+                daemon=True).start()
+        for cmd in self.backend.startup:
+            self.run(cmd)
+
+    def stop(self)->None:
+        """
+        Stop the shell process
+        """
+        if self._process is None:
+            return
+        process=self._process
+        self._process=None
+        try:
+            process.kill()
+            process.wait()
+        except OSError:
+            pass
+        for stream in (process.stdin,process.stdout,process.stderr):
+            try:
+                stream.close() # type: ignore
+            except (OSError,AttributeError):
+                pass
+
+    @staticmethod
+    def _pump(stream:typing.IO[str],q:"queue.Queue[typing.Optional[str]]"):
+        """
+        Thread that copies lines from a stream into a queue
+        (None marks the end of the stream)
+        """
+        try:
+            for line in stream:
+                q.put(line)
+        except (OSError,ValueError):
+            pass
+        q.put(None)
+
+    def _readUntil(self,
+        q:"queue.Queue[typing.Optional[str]]",
+        sentinel:str,
+        deadline:typing.Optional[float]
+        )->typing.List[str]:
+        """
+        Collect lines from a queue until the sentinel shows up
+        """
+        ret:typing.List[str]=[]
+        while True:
+            timeout=None
+            if deadline is not None:
+                timeout=max(0.0,deadline-time.monotonic())
+            try:
+                line=q.get(timeout=timeout)
+            except queue.Empty as e:
+                self.stop()
+                raise TimeoutError('Shell command timed out') from e
+            if line is None:
+                self.stop()
+                raise Exception('Shell process died')
+            line=line.rstrip('\r\n')
+            if line==sentinel:
+                if self.backend.newlineBeforeSentinel and ret and not ret[-1]:
+                    ret.pop()
+                return ret
+            ret.append(line)
+
+    def run(self,cmd:str,timeout:typing.Optional[float]=None
+        )->typing.Tuple[str,str]:
+        """
+        Run a command in the shell
+
+        :timeout: seconds to wait before giving up (and killing the shell)
+
+        returns (out,err)
+        """
+        if not self.alive:
+            self.start()
+        sentinel=f'__osTools_{uuid.uuid4().hex}__'
+        deadline=None
+        if timeout is not None:
+            deadline=time.monotonic()+timeout
+        try:
+            self._process.stdin.write( # type: ignore
+                self.backend.frameCommand(cmd,sentinel))
+            self._process.stdin.flush() # type: ignore
+        except OSError as e:
+            self.stop()
+            raise Exception('Shell process died') from e
+        out=self._readUntil(self._out,sentinel,deadline)
+        err=self._readUntil(self._err,sentinel,deadline)
+        return '\n'.join(out),'\n'.join(err).strip()
+
+
+class ShellWorkerPool:
+    """
+    A pool of long-lived shell workers
+
+    Can be used as a drop-in for the ps module's psCommand functions,
+    or installed behind them with ps.setWorkerPool()
+    """
+
+    def __init__(self,
+        size:int=2,
+        backend:typing.Optional[ShellBackend]=None,
+        timeout:typing.Optional[float]=None):
+        """
+        :size: maximum number of shell processes
+        :backend: what shell to run (default is powershell)
+        :timeout: default per-command timeout in seconds (None=forever)
+        """
+        if backend is None:
+            backend=defaultBackend()
+        self.backend=backend
+        self.size=size
+        self.timeout=timeout
+        self._idle:"queue.LifoQueue[ShellWorker]"=queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(ShellWorker(backend))
+        self._workers:typing.List[ShellWorker]=list(self._idle.queue)
+
+    def __enter__(self)->"ShellWorkerPool":
+        return self
+
+    def __exit__(self,*_):
+        self.close()
+
+    def close(self)->None:
+        """
+        Stop all shell processes
+        (the pool can still be used, they will simply restart)
+        """
+        for worker in self._workers:
+            worker.stop()
+
+    def run(self,cmd:CmdCompatible,timeout:typing.Optional[float]=None
+        )->str:
+        """
+        Run a command on the next free worker
+
+        returns the output
+        raises an Exception with the error text if there was any
+        """
+        if not isinstance(cmd,str):
+            cmd=' '.join(cmd)
+        if timeout is None:
+            timeout=self.timeout
+        worker=self._idle.get()
+        try:
+            out,err=worker.run(cmd,timeout)
+        finally:
+            self._idle.put(worker)
+        if err:
+            raise Exception(err)
+        return out
+
+    psCommand=run
+
+    def psCommandWithTableOutput(self,cmd:CmdCompatible,
+        timeout:typing.Optional[float]=None
+        )->typing.Iterable[PsDataResult]:
+        """
+        Run a command that expects a table as output
+        result will be converted to [{k:v}] with psTableDissect()
+        """
+        return psTableDissect(self.run(cmd,timeout))
+
+    def psCommandWithColonListOutput(self,cmd:CmdCompatible,
+        timeout:typing.Optional[float]=None
+        )->PsDataResult:
+        """
+        Run a command that expects a colon list as output
+        result will be converted to {k:v} with psColonListDissect()
+        """
+        return psColonListDissect(self.run(cmd,timeout))
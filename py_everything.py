@@ -4,10 +4,46 @@ this comes from the officimal example at:
       https://www.voidtools.com/support/everything/sdk/python/
 and may or may not require their sdk
       https://www.voidtools.com/support/everything/sdk/
+
+Where everything is not available (eg linux), searches are
+answered by a local file index instead (see fileIndex.py)
 """
+import typing
+import os
+import sys
 import ctypes
 import datetime
-import struct
+try:
+    from .fileIndex import FileIndex,SearchResult, \
+        SEARCH_MATCH_CASE,SEARCH_MATCH_PATH,SEARCH_REGEX
+    from .fileIndexWatcher import IndexWatcher
+    from .filetime import FiletimeCompatible,filetimeToPosix, \
+        filetimeToDatetime,WINDOWS_TICKS,WINDOWS_TICKS_TO_POSIX_EPOCH
+except ImportError:
+    from fileIndex import FileIndex,SearchResult, \
+        SEARCH_MATCH_CASE,SEARCH_MATCH_PATH,SEARCH_REGEX
+    from fileIndexWatcher import IndexWatcher
+    from filetime import FiletimeCompatible,filetimeToPosix, \
+        filetimeToDatetime,WINDOWS_TICKS,WINDOWS_TICKS_TO_POSIX_EPOCH
+
+# WINDOWS_TICKS and WINDOWS_TICKS_TO_POSIX_EPOCH used to be defined here,
+# so they are re-exported from filetime for code that still uses them
+__all__=['ALL_FIELDS','EVERYTHING_SDK_DIR','EVERYTHING_SORTS',
+    'EverythingBackend','FileIndex','FiletimeCompatible','IndexWatcher',
+    'LocalIndexBackend','SEARCH_MATCH_CASE','SEARCH_MATCH_PATH',
+    'SEARCH_REGEX','SearchBackend','SearchResult','WINDOWS_TICKS',
+    'WINDOWS_TICKS_TO_POSIX_EPOCH','cmdline','defaultBackend',
+    'filetimeToDatetime','filetimeToPosix','get_time','search','searchIter',
+    'EVERYTHING_REQUEST_FILE_NAME','EVERYTHING_REQUEST_PATH',
+    'EVERYTHING_REQUEST_FULL_PATH_AND_FILE_NAME',
+    'EVERYTHING_REQUEST_EXTENSION','EVERYTHING_REQUEST_SIZE',
+    'EVERYTHING_REQUEST_DATE_CREATED','EVERYTHING_REQUEST_DATE_MODIFIED',
+    'EVERYTHING_REQUEST_DATE_ACCESSED','EVERYTHING_REQUEST_ATTRIBUTES',
+    'EVERYTHING_REQUEST_FILE_LIST_FILE_NAME','EVERYTHING_REQUEST_RUN_COUNT',
+    'EVERYTHING_REQUEST_DATE_RUN','EVERYTHING_REQUEST_DATE_RECENTLY_CHANGED',
+    'EVERYTHING_REQUEST_HIGHLIGHTED_FILE_NAME',
+    'EVERYTHING_REQUEST_HIGHLIGHTED_PATH',
+    'EVERYTHING_REQUEST_HIGHLIGHTED_FULL_PATH_AND_FILE_NAME']
 
 #defines
 EVERYTHING_REQUEST_FILE_NAME=0x00000001
@@ -27,62 +63,363 @@ EVERYTHING_REQUEST_HIGHLIGHTED_FILE_NAME=0x00002000
 EVERYTHING_REQUEST_HIGHLIGHTED_PATH=0x00004000
 EVERYTHING_REQUEST_HIGHLIGHTED_FULL_PATH_AND_FILE_NAME=0x00008000
 
-#dll imports
-everything_dll=ctypes.WinDLL("C:\\EverythingSDK\\DLL\\Everything32.dll")
-everything_dll.Everything_GetResultDateModified.argtypes=[
-    ctypes.c_int,ctypes.POINTER(ctypes.c_ulonglong)]
-everything_dll.Everything_GetResultSize.argtypes=[
-    ctypes.c_int,ctypes.POINTER(ctypes.c_ulonglong)]
-everything_dll.Everything_GetResultFileNameW.argtypes=[
-    ctypes.c_int]
-everything_dll.Everything_GetResultFileNameW.restype=ctypes.c_wchar_p
-
-#setup search
-everything_dll.Everything_SetSearchW("test.py")
-everything_dll.Everything_SetRequestFlags(
-    EVERYTHING_REQUEST_FILE_NAME |
-    EVERYTHING_REQUEST_PATH |
-    EVERYTHING_REQUEST_SIZE |
-    EVERYTHING_REQUEST_DATE_MODIFIED)
-
-#execute the query
-everything_dll.Everything_QueryW(1)
-
-#get the number of results
-num_results=everything_dll.Everything_GetNumResults()
-
-#show the number of results
-print("Result Count: {}".format(num_results))
-
-#convert a windows FILETIME to a python datetime
-# https://stackoverflow.com/questions/39481221/convert-datetime-back-to-windows-64-bit-filetime
-WINDOWS_TICKS=int(1/10**-7)  # 10,000,000 (100 nanoseconds or .1 microseconds)
-WINDOWS_EPOCH=datetime.datetime.strptime(
-    '1601-01-01 00:00:00','%Y-%m-%d %H:%M:%S')
-POSIX_EPOCH=datetime.datetime.strptime(
-    '1970-01-01 00:00:00','%Y-%m-%d %H:%M:%S')
-EPOCH_DIFF=(POSIX_EPOCH - WINDOWS_EPOCH).total_seconds()  # 11644473600.0
-WINDOWS_TICKS_TO_POSIX_EPOCH=EPOCH_DIFF * WINDOWS_TICKS  # 116444736000000000.0
-
-def get_time(filetime):
+def get_time(filetime:FiletimeCompatible)->datetime.datetime:
     """
     Convert windows filetime winticks to python datetime.datetime.
+
+    :filetime: an int, 8 little-endian bytes, or a ctypes value
+        (such as the c_ulonglong filled in by everything)
+    """
+    return filetimeToDatetime(filetime)
+
+
+EVERYTHING_SDK_DIR='C:\\EverythingSDK\\DLL'
+
+
+# what can be asked for in a search result
+ALL_FIELDS=('path','size','dateModified','isDir')
+
+# {(sort field,descending):everything sort type}
+EVERYTHING_SORTS={
+    ('name',False):1,('name',True):2,
+    ('path',False):3,('path',True):4,
+    ('size',False):5,('size',True):6,
+    ('dateModified',False):13,('dateModified',True):14}
+
+
+class SearchBackend:
+    """
+    Something that can answer file searches
+    """
+
+    def searchIter(self,query:str,flags:int=0,
+        offset:int=0,
+        limit:typing.Optional[int]=None,
+        sort:typing.Optional[str]=None,
+        descending:bool=False,
+        fields:typing.Iterable[str]=ALL_FIELDS
+        )->typing.Iterator[SearchResult]:
+        """
+        Search for files, yielding results lazily
+
+        :flags: SEARCH_MATCH_CASE, SEARCH_MATCH_PATH, SEARCH_REGEX
+        :offset: skip this many results
+        :limit: stop after this many results
+        :sort: 'name', 'path', 'size', or 'dateModified'
+            (default=whatever order is fastest)
+        :descending: reverse the sort
+        :fields: which SearchResult fields are needed
+            (others may be left empty if that is cheaper)
+        """
+        raise NotImplementedError()
+
+    def search(self,query:str,flags:int=0,
+        maxResults:typing.Optional[int]=None)->typing.List[SearchResult]:
+        """
+        Search for files
+
+        :flags: SEARCH_MATCH_CASE, SEARCH_MATCH_PATH, SEARCH_REGEX
+        :maxResults: stop after this many
+        """
+        return list(self.searchIter(query,flags,limit=maxResults))
+
+
+class EverythingBackend(SearchBackend):
+    """
+    Search using the voidtools everything sdk
+    (requires everything to be installed and running)
+
+    NOTE: the sdk keeps a single query per process, so do not
+        interleave iterating two searches on the same thread
+    """
+
+    def __init__(self,dllFilename:typing.Optional[str]=None,
+        pageSize:int=1000):
+        """
+        :dllFilename: the sdk dll to use (default=the one matching
+            this python in EVERYTHING_SDK_DIR)
+        :pageSize: how many results to ask everything for at a time
+        """
+        if dllFilename is None:
+            bits=8*ctypes.sizeof(ctypes.c_void_p)
+            dllFilename=os.path.join(
+                EVERYTHING_SDK_DIR,f'Everything{bits}.dll')
+        dll=ctypes.WinDLL(dllFilename) # type: ignore
+        dll.Everything_GetResultDateModified.argtypes=[
+            ctypes.c_uint,ctypes.POINTER(ctypes.c_ulonglong)]
+        dll.Everything_GetResultSize.argtypes=[
+            ctypes.c_uint,ctypes.POINTER(ctypes.c_ulonglong)]
+        dll.Everything_GetResultFullPathNameW.argtypes=[
+            ctypes.c_uint,ctypes.c_wchar_p,ctypes.c_uint]
+        dll.Everything_GetResultFullPathNameW.restype=ctypes.c_uint
+        dll.Everything_SetSearchW.argtypes=[ctypes.c_wchar_p]
+        self.dll=dll
+        self.pageSize=pageSize
+
+    def searchIter(self,query:str,flags:int=0,
+        offset:int=0,
+        limit:typing.Optional[int]=None,
+        sort:typing.Optional[str]=None,
+        descending:bool=False,
+        fields:typing.Iterable[str]=ALL_FIELDS
+        )->typing.Iterator[SearchResult]:
+        dll=self.dll
+        fields=set(fields)
+        requestFlags=0
+        if 'path' in fields:
+            requestFlags|=EVERYTHING_REQUEST_FULL_PATH_AND_FILE_NAME
+        if 'size' in fields:
+            requestFlags|=EVERYTHING_REQUEST_SIZE
+        if 'dateModified' in fields:
+            requestFlags|=EVERYTHING_REQUEST_DATE_MODIFIED
+        if 'isDir' in fields:
+            requestFlags|=EVERYTHING_REQUEST_ATTRIBUTES
+        if sort is not None and (sort,descending) not in EVERYTHING_SORTS:
+            raise ValueError(f'Unknown sort field "{sort}"')
+        filename=ctypes.create_unicode_buffer(260)
+        dateModified=ctypes.c_ulonglong(0)
+        fileSize=ctypes.c_ulonglong(0)
+        remaining=limit
+        while remaining is None or remaining>0:
+            page=self.pageSize if remaining is None \
+                else min(self.pageSize,remaining)
+            dll.Everything_SetSearchW(query)
+            dll.Everything_SetMatchCase(bool(flags&SEARCH_MATCH_CASE))
+            dll.Everything_SetMatchPath(bool(flags&SEARCH_MATCH_PATH))
+            dll.Everything_SetRegex(bool(flags&SEARCH_REGEX))
+            dll.Everything_SetRequestFlags(requestFlags)
+            if sort is not None:
+                dll.Everything_SetSort(EVERYTHING_SORTS[(sort,descending)])
+            dll.Everything_SetOffset(offset)
+            dll.Everything_SetMax(page)
+            dll.Everything_QueryW(1)
+            numResults=dll.Everything_GetNumResults()
+            for i in range(numResults):
+                result=SearchResult('')
+                if 'path' in fields:
+                    # ask how long the path is, so long paths fit
+                    needed=dll.Everything_GetResultFullPathNameW(i,None,0)+1
+                    if needed>len(filename):
+                        filename=ctypes.create_unicode_buffer(needed)
+                    dll.Everything_GetResultFullPathNameW(
+                        i,filename,len(filename))
+                    result.path=filename.value
+                if 'size' in fields \
+                    and dll.Everything_GetResultSize(i,fileSize):
+                    #
+                    result.size=fileSize.value
+                if 'dateModified' in fields \
+                    and dll.Everything_GetResultDateModified(i,dateModified):
+                    #
+                    result.dateModified=filetimeToPosix(dateModified)
+                if 'isDir' in fields:
+                    result.isDir=bool(dll.Everything_IsFolderResult(i))
+                yield result
+            if numResults<page:
+                break
+            offset+=numResults
+            if remaining is not None:
+                remaining-=numResults
+
+
+class LocalIndexBackend(SearchBackend):
     """
-    winticks=struct.unpack('<Q',filetime)[0]
-    microsecs=(winticks-WINDOWS_TICKS_TO_POSIX_EPOCH)/WINDOWS_TICKS
-    return datetime.datetime.fromtimestamp(microsecs)
-
-#create buffers
-filename=ctypes.create_unicode_buffer(260)
-date_modified_filetime=ctypes.c_ulonglong(1)
-file_size=ctypes.c_ulonglong(1)
-
-#show results
-for i in range(num_results):
-    everything_dll.Everything_GetResultFullPathNameW(i,filename,260)
-    everything_dll.Everything_GetResultDateModified(i,date_modified_filetime)
-    everything_dll.Everything_GetResultSize(i,file_size)
-    print("Filename: {}\nDate Modified: {}\nSize: {} bytes\n".format(
-        ctypes.wstring_at(filename),
-        get_time(date_modified_filetime),
-        file_size.value))
+    Search using a local FileIndex
+    """
+
+    def __init__(self,index:typing.Optional[FileIndex]=None):
+        if index is None:
+            index=FileIndex()
+        self.index=index
+
+    def searchIter(self,query:str,flags:int=0,
+        offset:int=0,
+        limit:typing.Optional[int]=None,
+        sort:typing.Optional[str]=None,
+        descending:bool=False,
+        fields:typing.Iterable[str]=ALL_FIELDS
+        )->typing.Iterator[SearchResult]:
+        # the index stores every field, so there is no saving in fields
+        return self.index.searchIter(query,flags,offset,limit,
+            sort,descending)
+
+
+_defaultBackend:typing.Optional[SearchBackend]=None
+def defaultBackend()->SearchBackend:
+    """
+    Use the everything sdk if it is available, otherwise the local index
+    """
+    global _defaultBackend
+    if _defaultBackend is None:
+        if os.name=='nt':
+            try:
+                _defaultBackend=EverythingBackend()
+            except OSError:
+                pass
+        if _defaultBackend is None:
+            _defaultBackend=LocalIndexBackend()
+    return _defaultBackend
+
+
+def searchIter(query:str,flags:int=0,
+    offset:int=0,
+    limit:typing.Optional[int]=None,
+    sort:typing.Optional[str]=None,
+    descending:bool=False,
+    fields:typing.Iterable[str]=ALL_FIELDS,
+    backend:typing.Optional[SearchBackend]=None
+    )->typing.Iterator[SearchResult]:
+    """
+    Search for files by name, yielding results lazily
+    so that stopping early costs little
+
+    :query: what to search for (substrings, or globs with * and ?)
+    :flags: SEARCH_MATCH_CASE, SEARCH_MATCH_PATH, SEARCH_REGEX
+    :offset: skip this many results
+    :limit: stop after this many results
+    :sort: 'name', 'path', 'size', or 'dateModified'
+    :descending: reverse the sort
+    :fields: which SearchResult fields are needed (see ALL_FIELDS)
+    :backend: what to search with (default=defaultBackend())
+    """
+    if backend is None:
+        backend=defaultBackend()
+    return backend.searchIter(query,flags,offset,limit,
+        sort,descending,fields)
+
+
+def search(query:str,flags:int=0,
+    maxResults:typing.Optional[int]=None,
+    backend:typing.Optional[SearchBackend]=None
+    )->typing.List[SearchResult]:
+    """
+    Search for files by name
+
+    :query: what to search for (substrings, or globs with * and ?)
+    :flags: SEARCH_MATCH_CASE, SEARCH_MATCH_PATH, SEARCH_REGEX
+    :maxResults: stop after this many
+    :backend: what to search with (default=defaultBackend())
+
+    See also:
+        searchIter() for paging, sorting, and streaming results
+    """
+    if backend is None:
+        backend=defaultBackend()
+    return backend.search(query,flags,maxResults)
+
+
+def cmdline(args:typing.Iterable[str])->int:
+    """
+    Run the command line
+
+    :param args: command line arguments (WITHOUT the filename)
+    """
+    printhelp=False
+    flags=0
+    index:typing.Optional[FileIndex]=None
+    indexFilename=None
+    rebuildRoots:typing.List[str]=[]
+    query=[]
+    watch=False
+    offset=0
+    limit=None
+    sort=None
+    descending=False
+    badArgs=False
+    sorts={field for field,_ in EVERYTHING_SORTS}
+    for arg in args:
+        if arg.startswith('-'):
+            av=arg.split('=',1)
+            av[0]=av[0].lower()
+            if av[0] in ('--db','--index','--offset','--limit','--sort') \
+                and (len(av)<2 or not av[1]):
+                #
+                print(f'ERR: {av[0]} needs a value, eg {av[0]}=...')
+                badArgs=True
+            elif av[0] in ('--offset','--limit') and not av[1].isdigit():
+                print(f'ERR: {av[0]} needs a whole number, not "{av[1]}"')
+                badArgs=True
+            elif av[0]=='--sort' \
+                and av[1][av[1].startswith('-'):] not in sorts:
+                #
+                print(f'ERR: unknown sort field "{av[1]}"')
+                badArgs=True
+            elif av[0] in ('-h','--help'):
+                printhelp=True
+            elif av[0] in ('-c','--case'):
+                flags|=SEARCH_MATCH_CASE
+            elif av[0] in ('-p','--path'):
+                flags|=SEARCH_MATCH_PATH
+            elif av[0] in ('-r','--regex'):
+                flags|=SEARCH_REGEX
+            elif av[0]=='--db':
+                indexFilename=av[1]
+            elif av[0]=='--index':
+                rebuildRoots.append(av[1])
+            elif av[0]=='--watch':
+                watch=True
+            elif av[0]=='--offset':
+                offset=int(av[1])
+            elif av[0]=='--limit':
+                limit=int(av[1])
+            elif av[0]=='--sort':
+                sort=av[1]
+                if sort.startswith('-'):
+                    sort=sort[1:]
+                    descending=True
+            else:
+                printhelp=True
+        else:
+            query.append(arg)
+    backend=None
+    if badArgs:
+        # do nothing rather than guess what was meant
+        query=[]
+        printhelp=True
+    elif indexFilename is not None or rebuildRoots or watch:
+        index=FileIndex(indexFilename)
+        if rebuildRoots:
+            print(f'{index.rebuild(rebuildRoots)} files indexed')
+        backend=LocalIndexBackend(index)
+        if watch:
+            print('Watching for changes (ctrl+c to stop)')
+            try:
+                IndexWatcher(index).run()
+            except KeyboardInterrupt:
+                pass
+            return 0
+    if query:
+        count=0
+        for result in searchIter(' '.join(query),flags,offset,limit,
+            sort,descending,backend=backend):
+            #
+            count+=1
+            print("Filename: {}\nDate Modified: {}\nSize: {} bytes\n".format(
+                result.path,
+                datetime.datetime.fromtimestamp(result.dateModified),
+                result.size))
+        print("Result Count: {}".format(count))
+    elif not rebuildRoots:
+        printhelp=True
+    if printhelp:
+        print('USEAGE:')
+        print('  py_everything [options] [query]')
+        print('OPTIONS:')
+        print('  -h,--help ...................... this help')
+        print('  -c,--case ...................... match case')
+        print('  -p,--path ...................... match the full path')
+        print('  -r,--regex ..................... query is a regex')
+        print('  --index=dir .................... (re)build the local index')
+        print('  --db=filename .................. local index file to use')
+        print('  --offset=n ..................... skip the first n results')
+        print('  --limit=n ...................... show at most n results')
+        print('  --sort=[-]name|path|size|dateModified')
+        print('                                   sort (- for descending)')
+        print('  --watch ........................ keep the local index up')
+        print('                                   to date until stopped')
+        return 1
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(cmdline(sys.argv[1:]))
@@ -0,0 +1,219 @@
+"""
+Read windows .lnk shortcut files without needing windows
+
+The format is documented in [MS-SHLLINK]:
+    https://learn.microsoft.com/en-us/openspecs/windows_protocols/ms-shllink/
+""" # noqa: E501 # pylint: disable=line-too-long
+import struct
+from dataclasses import dataclass
+
+# LinkFlags
+HAS_LINK_TARGET_ID_LIST=0x00000001
+HAS_LINK_INFO=0x00000002
+HAS_NAME=0x00000004
+HAS_RELATIVE_PATH=0x00000008
+HAS_WORKING_DIR=0x00000010
+HAS_ARGUMENTS=0x00000020
+HAS_ICON_LOCATION=0x00000040
+IS_UNICODE=0x00000080
+
+# LinkInfoFlags
+VOLUME_ID_AND_LOCAL_BASE_PATH=0x00000001
+COMMON_NETWORK_RELATIVE_LINK_AND_PATH_SUFFIX=0x00000002
+
+HEADER_SIZE=0x4C
+LINK_CLSID=b'\x01\x14\x02\x00\x00\x00\x00\x00\xc0\x00\x00\x00\x00\x00\x00\x46' # noqa: E501 # pylint: disable=line-too-long
+
+
+class ShellLinkError(ValueError):
+    """
+    The data is not a valid shell link
+    """
+
+
+@dataclass
+class ShellLink:
+    """
+    The useful parts of a .lnk shortcut file
+    """
+    linkFlags:int=0
+    fileAttributes:int=0
+    localBasePath:str=''
+    networkPath:str=''
+    commonPathSuffix:str=''
+    name:str=''
+    relativePath:str=''
+    workingDir:str=''
+    arguments:str=''
+    iconLocation:str=''
+
+    @property
+    def target(self)->str:
+        """
+        The best guess at the path the shortcut points to
+        (may be relative to the .lnk file if only
+        relativePath was available)
+        """
+        if self.localBasePath:
+            return _joinSuffix(self.localBasePath,self.commonPathSuffix)
+        if self.networkPath:
+            return _joinSuffix(self.networkPath,self.commonPathSuffix)
+        return self.relativePath
+
+
+def _joinSuffix(base:str,suffix:str)->str:
+    if not suffix:
+        return base
+    if base.endswith('\\'):
+        return base+suffix
+    return base+'\\'+suffix
+
+
+try:
+    b''.decode('mbcs')
+    _hasMbcs=True
+except LookupError:
+    _hasMbcs=False
+
+
+def _cString(data:bytes,offset:int,unicode:bool=False)->str:
+    """
+    Read a null-terminated string
+    """
+    if unicode:
+        end=offset
+        while end+1<len(data) and data[end:end+2]!=b'\0\0':
+            end+=2
+        return data[offset:end].decode('utf-16-le',errors='replace')
+    end=data.find(b'\0',offset)
+    if end<0:
+        end=len(data)
+    return data[offset:end].decode('mbcs' if _hasMbcs else 'latin-1',
+        errors='replace')
+
+
+def _parseLinkInfo(link:ShellLink,data:bytes,offset:int)->int:
+    """
+    Parse the LinkInfo structure
+
+    returns the offset just past it
+    """
+    size,headerSize,flags,_,localBasePathOffset,\
+        commonNetworkRelativeLinkOffset,commonPathSuffixOffset=\
+        struct.unpack_from('<7I',data,offset)
+    localBasePathOffsetUnicode=0
+    commonPathSuffixOffsetUnicode=0
+    if headerSize>=0x24:
+        localBasePathOffsetUnicode,commonPathSuffixOffsetUnicode=\
+            struct.unpack_from('<2I',data,offset+28)
+    if flags&VOLUME_ID_AND_LOCAL_BASE_PATH:
+        if localBasePathOffsetUnicode:
+            link.localBasePath=_cString(
+                data,offset+localBasePathOffsetUnicode,True)
+        else:
+            link.localBasePath=_cString(data,offset+localBasePathOffset)
+    if flags&COMMON_NETWORK_RELATIVE_LINK_AND_PATH_SUFFIX:
+        cnrl=offset+commonNetworkRelativeLinkOffset
+        _,_,netNameOffset=struct.unpack_from('<3I',data,cnrl)
+        if netNameOffset>0x14:
+            netNameOffsetUnicode,=struct.unpack_from('<I',data,cnrl+20)
+            link.networkPath=_cString(data,cnrl+netNameOffsetUnicode,True)
+        else:
+            link.networkPath=_cString(data,cnrl+netNameOffset)
+    if commonPathSuffixOffsetUnicode:
+        link.commonPathSuffix=_cString(
+            data,offset+commonPathSuffixOffsetUnicode,True)
+    elif commonPathSuffixOffset:
+        link.commonPathSuffix=_cString(data,offset+commonPathSuffixOffset)
+    return offset+size
+
+
+def parseShellLink(data:bytes)->ShellLink:
+    """
+    Parse the contents of a .lnk file
+
+    raises ShellLinkError if it is not a shell link
+    """
+    if len(data)<HEADER_SIZE \
+        or struct.unpack_from('<I',data,0)[0]!=HEADER_SIZE \
+        or data[4:20]!=LINK_CLSID:
+        #
+        raise ShellLinkError('Not a shell link')
+    link=ShellLink()
+    link.linkFlags,link.fileAttributes=struct.unpack_from('<2I',data,20)
+    unicode=bool(link.linkFlags&IS_UNICODE)
+    offset=HEADER_SIZE
+    try:
+        if link.linkFlags&HAS_LINK_TARGET_ID_LIST:
+            idListSize,=struct.unpack_from('<H',data,offset)
+            offset+=2+idListSize
+        if link.linkFlags&HAS_LINK_INFO:
+            offset=_parseLinkInfo(link,data,offset)
+        for flag,attr in (
+            (HAS_NAME,'name'),
+            (HAS_RELATIVE_PATH,'relativePath'),
+            (HAS_WORKING_DIR,'workingDir'),
+            (HAS_ARGUMENTS,'arguments'),
+            (HAS_ICON_LOCATION,'iconLocation')):
+            #
+            if not link.linkFlags&flag:
+                continue
+            count,=struct.unpack_from('<H',data,offset)
+            offset+=2
+            if unicode:
+                s=data[offset:offset+count*2].decode(
+                    'utf-16-le',errors='replace')
+                offset+=count*2
+            else:
+                s=data[offset:offset+count].decode(
+                    'latin-1',errors='replace')
+                offset+=count
+            setattr(link,attr,s)
+    except struct.error as e:
+        raise ShellLinkError('Truncated shell link') from e
+    return link
+
+
+def readShellLink(filename:str)->ShellLink:
+    """
+    Read a .lnk file
+
+    raises ShellLinkError if it is not a shell link
+    """
+    with open(filename,'rb') as f:
+        return parseShellLink(f.read())
+
+
+def makeShellLink(target:str,relativePath:str='',
+    workingDir:str='',arguments:str='')->bytes:
+    """
+    Create the contents of a minimal unicode .lnk file pointing
+    at a local path (mostly useful for creating test fixtures)
+    """
+    flags=IS_UNICODE|HAS_LINK_INFO
+    header=struct.pack('<I16s2I3Q3IH10s',HEADER_SIZE,LINK_CLSID,0,0,
+        0,0,0,0,0,1,0,b'')
+    # LinkInfo with a unicode local base path and empty volume id
+    volumeId=struct.pack('<4I',16,3,0,16)
+    ansiPath=target.encode('latin-1',errors='replace')+b'\0'
+    unicodePath=target.encode('utf-16-le')+b'\0\0'
+    headerSize=0x24
+    volumeIdOffset=headerSize
+    localBasePathOffset=volumeIdOffset+len(volumeId)
+    commonPathSuffixOffset=localBasePathOffset+len(ansiPath)
+    localBasePathOffsetUnicode=commonPathSuffixOffset+1
+    commonPathSuffixOffsetUnicode=localBasePathOffsetUnicode+len(unicodePath)
+    body=volumeId+ansiPath+b'\0'+unicodePath+b'\0\0'
+    size=headerSize+len(body)
+    linkInfo=struct.pack('<9I',size,headerSize,
+        VOLUME_ID_AND_LOCAL_BASE_PATH,volumeIdOffset,localBasePathOffset,0,
+        commonPathSuffixOffset,localBasePathOffsetUnicode,
+        commonPathSuffixOffsetUnicode)+body
+    strings=b''
+    for flag,s in ((HAS_RELATIVE_PATH,relativePath),
+        (HAS_WORKING_DIR,workingDir),(HAS_ARGUMENTS,arguments)):
+        if s:
+            flags|=flag
+            strings+=struct.pack('<H',len(s))+s.encode('utf-16-le')
+    header=header[:20]+struct.pack('<I',flags)+header[24:]
+    return header+linkInfo+strings+b'\0\0\0\0'
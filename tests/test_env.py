@@ -0,0 +1,171 @@
+"""
+Tests for env
+"""
+import os
+import pytest
+import env as envModule
+from env import env
+
+
+def test_snapshotIsImmutable():
+    snapshot=envModule.EnvironmentSnapshot({'A':'1','B':'x'})
+    with pytest.raises(TypeError):
+        snapshot.raw['A']='2' # type: ignore
+    with pytest.raises(TypeError):
+        snapshot['A']=2 # type: ignore
+    assert snapshot.raw=={'A':'1','B':'x'}
+    assert snapshot['A']==1
+    assert envModule.diff(snapshot,{'A':'1','B':'x'})==\
+        envModule.EnvironmentDiff()
+
+
+def test_snapshotIsACopy(monkeypatch):
+    monkeypatch.setenv('OSTOOLS_TEST_SNAPSHOT','before')
+    snapshot=env.snapshot()
+    monkeypatch.setenv('OSTOOLS_TEST_SNAPSHOT','after')
+    assert snapshot.raw['OSTOOLS_TEST_SNAPSHOT']=='before'
+
+
+def test_diffAddedRemovedChanged():
+    a=envModule.EnvironmentSnapshot({'KEEP':'1','GONE':'2','EDIT':'3'})
+    b={'KEEP':'1','EDIT':'4','NEW':'5'}
+    d=envModule.diff(a,b)
+    assert d.added=={'NEW':'5'}
+    assert d.removed=={'GONE':'2'}
+    assert d.changed=={'EDIT':('3','4')}
+    assert d
+    assert not envModule.diff(b,dict(b))
+    # an empty value still counts as being there
+    assert envModule.diff({'E':''},{}).removed=={'E':''}
+    assert envModule.diff({},{'E':''}).added=={'E':''}
+
+
+def test_changesRestoresExactly(monkeypatch):
+    monkeypatch.setenv('OSTOOLS_TEST_EDIT','old')
+    monkeypatch.setenv('OSTOOLS_TEST_GONE','here')
+    monkeypatch.delenv('OSTOOLS_TEST_NEW',raising=False)
+    with env.changes({'OSTOOLS_TEST_EDIT':'new','OSTOOLS_TEST_GONE':None},
+        OSTOOLS_TEST_NEW=1) as before:
+        #
+        assert os.environ['OSTOOLS_TEST_EDIT']=='new'
+        assert 'OSTOOLS_TEST_GONE' not in os.environ
+        assert os.environ['OSTOOLS_TEST_NEW']=='1'
+        assert before.raw['OSTOOLS_TEST_EDIT']=='old'
+    assert os.environ['OSTOOLS_TEST_EDIT']=='old'
+    assert os.environ['OSTOOLS_TEST_GONE']=='here'
+    assert 'OSTOOLS_TEST_NEW' not in os.environ
+
+
+def _pathList(monkeypatch,*entries):
+    monkeypatch.setenv('OSTOOLS_TEST_PATH',':'.join(entries))
+    return envModule.PathList('OSTOOLS_TEST_PATH',':')
+
+
+def test_pathListEdits(monkeypatch):
+    path=_pathList(monkeypatch,'/a','/b','/c')
+    path.prepend('/c')
+    path.append('/d')
+    path.append('/a') # already there, so left where it is
+    path.prepend('/z')
+    assert list(path)==['/z','/c','/a','/b','/d']
+    path.append('/a',move=True)
+    assert list(path)==['/z','/c','/b','/d','/a']
+    assert path.remove('/b') and not path.remove('/b')
+    assert list(path)==['/z','/c','/d','/a']
+    assert len(path)==4 and path[1]=='/c' and path[-1]=='/a'
+    assert '/d' in path and '/b' not in path
+    # nothing is written until save()
+    assert os.environ['OSTOOLS_TEST_PATH']=='/a:/b:/c'
+    path.save()
+    assert os.environ['OSTOOLS_TEST_PATH']=='/z:/c:/d:/a'
+
+
+def test_pathListDedupe(monkeypatch):
+    path=_pathList(monkeypatch,'/a','/b','/a','/c','/b','/a')
+    assert path.dedupe()==3
+    assert list(path)==['/a','/b','/c']
+    assert path.dedupe()==0
+    path=_pathList(monkeypatch,'/a','/b','/a')
+    assert path.remove('/a')
+    assert list(path)==['/b']
+
+
+def test_pathListTrailingSeparatorsAndCase(monkeypatch):
+    path=_pathList(monkeypatch,'/opt/bin/','/usr//bin','/opt/./bin')
+    assert '/opt/bin' in path and '/usr/bin' in path
+    assert path.dedupe()==1
+    assert list(path)==['/opt/bin/','/usr//bin']
+    path.prepend('/usr/bin/')
+    assert list(path)==['/usr/bin/','/opt/bin/']
+    caseSensitive=os.path.normcase('A')=='A'
+    assert ('/OPT/BIN' in path)!=caseSensitive
+
+
+def test_pathListNormalize(monkeypatch):
+    monkeypatch.setenv('OSTOOLS_TEST_DIR','/opt')
+    path=_pathList(monkeypatch,'$OSTOOLS_TEST_DIR/bin','','/opt/bin/',' ')
+    path.normalize()
+    assert list(path)==[os.path.normpath('/opt/bin')]
+
+
+def test_pathListContextManager(monkeypatch):
+    with _pathList(monkeypatch,'/a','/b') as path:
+        path.prepend('/new')
+        path.remove('/a')
+    assert os.environ['OSTOOLS_TEST_PATH']=='/new:/b'
+    with pytest.raises(RuntimeError):
+        with _pathList(monkeypatch,'/a','/b') as path:
+            path.prepend('/new')
+            raise RuntimeError('discard the edits')
+    assert os.environ['OSTOOLS_TEST_PATH']=='/a:/b'
+
+
+def test_pathListBulkEditsAreNotQuadratic(monkeypatch):
+    entries=[f'/dir{i}' for i in range(20000)]
+    path=_pathList(monkeypatch,*entries)
+    keys=[]
+    monkeypatch.setattr(envModule.PathList,'key',
+        staticmethod(lambda entry:keys.append(entry) or entry))
+    for entry in entries[::2]:
+        path.prepend(entry)
+    for entry in entries[1::4]:
+        path.remove(entry)
+    # each edit normalises only the entry it was given
+    assert len(keys)==len(entries)//2+len(entries)//4
+    assert len(path)==len(entries)*3//4
+    assert path[0]==entries[-2]
+
+
+def test_getCastsValuesAndStringDefaults(monkeypatch):
+    monkeypatch.setenv('OSTOOLS_TEST_INT','42')
+    monkeypatch.setenv('OSTOOLS_TEST_LIST',env.delimiter.join(
+        ['1','2.5','yes','text']))
+    monkeypatch.delenv('OSTOOLS_TEST_MISSING',raising=False)
+    assert env.get('OSTOOLS_TEST_INT')==42
+    assert env.get('OSTOOLS_TEST_LIST')==[1,2.5,True,'text']
+    # the cached parse must not be shared between callers
+    env.get('OSTOOLS_TEST_LIST').append('changed')
+    assert env.get('OSTOOLS_TEST_LIST')==[1,2.5,True,'text']
+    assert env.getList('OSTOOLS_TEST_INT')==[42]
+    assert env.get('OSTOOLS_TEST_MISSING') is None
+    assert env.get('OSTOOLS_TEST_MISSING','5')==5
+    assert env.get('OSTOOLS_TEST_MISSING','no')==False # noqa: E712
+    assert env.get('OSTOOLS_TEST_MISSING',
+        env.delimiter.join(['a','3']))==['a',3]
+    assert env.get('OSTOOLS_TEST_MISSING',7)==7
+    assert env.get('OSTOOLS_TEST_MISSING',['x'])==['x']
+    assert env.getList('OSTOOLS_TEST_MISSING','5')==[5]
+
+
+def test_typedGetters(monkeypatch):
+    monkeypatch.setenv('OSTOOLS_TEST_VALUE','007')
+    assert env.getInt('OSTOOLS_TEST_VALUE')==7
+    assert env.getFloat('OSTOOLS_TEST_VALUE')==7.0
+    assert env.getStr('OSTOOLS_TEST_VALUE')=='007'
+    with pytest.raises(ValueError):
+        env.getBool('OSTOOLS_TEST_VALUE')
+    monkeypatch.setenv('OSTOOLS_TEST_VALUE',' On ')
+    assert env.getBool('OSTOOLS_TEST_VALUE') is True
+    monkeypatch.delenv('OSTOOLS_TEST_VALUE')
+    assert env.getBool('OSTOOLS_TEST_VALUE',False) is False
+    assert env.getInt('OSTOOLS_TEST_VALUE',3)==3
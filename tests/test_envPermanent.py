@@ -0,0 +1,23 @@
+"""
+Tests for envPermanent
+"""
+import os
+from envPermanent import PosixProfileBackend
+
+
+def test_symlinkedProfileKeepsLink(tmp_path):
+    target=tmp_path/'dotfiles'/'profile'
+    target.parent.mkdir()
+    target.write_text('echo hi\n')
+    link=tmp_path/'.profile'
+    os.symlink(target,link)
+    backend=PosixProfileBackend(str(link))
+    backend.setMany({'FOO':'bar baz'})
+    assert os.path.islink(link)
+    text=target.read_text()
+    assert text.startswith('echo hi\n')
+    assert "export FOO='bar baz'" in text
+    assert backend.getAll()=={'FOO':'bar baz'}
+    backend.setMany({'FOO':None})
+    assert os.path.islink(link)
+    assert target.read_text()=='echo hi\n'
@@ -0,0 +1,43 @@
+"""
+Tests for fileIndex
+"""
+import os
+import pytest
+from fileIndex import FileIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    for directory in ('Build/x','build/y','build2'):
+        os.makedirs(tmp_path/directory)
+    for filename in ('Build/x/one.txt','build/y/two.txt','build2/a_b.py'):
+        (tmp_path/filename).write_text('')
+    ret=FileIndex(':memory:',[str(tmp_path)])
+    ret.rebuild()
+    return ret
+
+
+def test_forgetIsCaseSensitive(index,tmp_path):
+    with index.lock,index.db:
+        index._forget(str(tmp_path/'Build'))
+    paths={r.path for r in index.search('')}
+    assert str(tmp_path/'Build'/'x'/'one.txt') not in paths
+    assert str(tmp_path/'build'/'y'/'two.txt') in paths
+
+
+@pytest.mark.parametrize('query',['build','two.txt','*.txt','a_b','x%y'])
+def test_searchUsesTrigramIndex(index,query):
+    if not index.hasFts:
+        pytest.skip('sqlite has no trigram tokenizer')
+    plan=index.explain(query)
+    names=[p for p in plan if 'names' in p]
+    assert names
+    # "INDEX 0:" with nothing after it is a full scan of the names table
+    assert not any(p.endswith('INDEX 0:') for p in names),plan
+
+
+def test_search(index,tmp_path):
+    assert [r.name for r in index.search('TWO')]==['two.txt']
+    assert index.search('TWO',1)==[]
+    assert {r.name for r in index.search('*.txt')}=={'one.txt','two.txt'}
+    assert [r.name for r in index.search('a_b')]==['a_b.py']
@@ -0,0 +1,108 @@
+"""
+Tests for fileIndexWatcher
+"""
+import os
+import sys
+import time
+import errno
+import pytest
+import fileIndexWatcher
+from fileIndex import FileIndex
+from fileIndexWatcher import IndexWatcher
+
+linuxOnly=pytest.mark.skipif(not sys.platform.startswith('linux'),
+    reason='inotify is linux only')
+
+
+@pytest.fixture
+def index(tmp_path):
+    (tmp_path/'sub').mkdir()
+    (tmp_path/'sub'/'old.txt').write_text('')
+    ret=FileIndex(':memory:',[str(tmp_path)])
+    ret.rebuild()
+    yield ret
+    ret.close()
+
+
+def _names(index):
+    return sorted(r.name for r in index.search(''))
+
+
+def _waitFor(index,expected,timeout=10.0):
+    deadline=time.monotonic()+timeout
+    while _names(index)!=expected and time.monotonic()<deadline:
+        time.sleep(0.02)
+    assert _names(index)==expected
+
+
+def _createRenameDelete(index,tmp_path):
+    (tmp_path/'sub'/'new.txt').write_text('')
+    _waitFor(index,['new.txt','old.txt','sub'])
+    os.rename(str(tmp_path/'sub'/'new.txt'),str(tmp_path/'sub'/'moved.txt'))
+    _waitFor(index,['moved.txt','old.txt','sub'])
+    os.remove(str(tmp_path/'sub'/'old.txt'))
+    _waitFor(index,['moved.txt','sub'])
+
+
+class _FullInotify:
+    """
+    Stands in for Inotify when the system is out of watches
+    """
+
+    def __init__(self):
+        self.paths={}
+        self.attempts=0
+
+    def addWatch(self,directory):
+        self.attempts+=1
+        raise OSError(errno.ENOSPC,'No space left on device',directory)
+
+    def read(self,timeout):
+        time.sleep(timeout or 0)
+        return []
+
+    def close(self):
+        pass
+
+
+@linuxOnly
+def test_inotifyCreateRenameDelete(index,tmp_path):
+    with IndexWatcher(index,batchDelay=0.05) as watcher:
+        # wait for the watches to go in before changing anything
+        deadline=time.monotonic()+10.0
+        while (watcher.inotify is None or len(watcher.inotify.paths)<2)\
+            and time.monotonic()<deadline:
+            #
+            time.sleep(0.01)
+        _createRenameDelete(index,tmp_path)
+    assert watcher.batchesApplied>=3
+
+
+def test_pollingCreateRenameDelete(index,tmp_path):
+    with IndexWatcher(index,pollInterval=0.05,useInotify=False) as watcher:
+        _createRenameDelete(index,tmp_path)
+    assert watcher.inotify is None
+    assert watcher.batchesApplied>=3
+
+
+def test_outOfWatchesFallsBackToPolling(index,tmp_path,monkeypatch):
+    fake=_FullInotify()
+    monkeypatch.setattr(fileIndexWatcher,'Inotify',lambda:fake)
+    watcher=IndexWatcher(index,pollInterval=0.05,useInotify=True)
+    assert watcher.reconcileInterval==300.0
+    with watcher:
+        _createRenameDelete(index,tmp_path)
+    assert fake.attempts>=1
+    assert watcher.reconcileInterval==0.05
+
+
+def test_watchTreeIgnoresVanishedDirectories(index,tmp_path):
+    class Inotify(_FullInotify):
+        def addWatch(self,directory):
+            self.attempts+=1
+            raise FileNotFoundError(errno.ENOENT,'gone',directory)
+    watcher=IndexWatcher(index,pollInterval=0.05)
+    watcher.inotify=Inotify()
+    watcher._watchTree(['a','b','c'])
+    assert watcher.inotify.attempts==3
+    assert watcher.reconcileInterval==300.0
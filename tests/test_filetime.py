@@ -0,0 +1,79 @@
+"""
+Tests for FILETIME conversions
+"""
+import sys
+import array
+import ctypes
+import datetime
+import pytest
+import filetime
+from filetime import FILETIME,WINDOWS_TICKS,WINDOWS_TICKS_TO_POSIX_EPOCH
+
+SAMPLES=[0.0,1.0,1234567890.5,1700000000.1234567,-86400.0]
+
+
+def _buffer(values):
+    ticks=array.array('q',[filetime.posixToFiletime(v) for v in values])
+    if sys.byteorder!='little':
+        ticks.byteswap()
+    return ticks.tobytes()
+
+
+def test_epoch():
+    assert filetime.filetimeToPosix(WINDOWS_TICKS_TO_POSIX_EPOCH)==0.0
+    assert filetime.posixToFiletime(0)==WINDOWS_TICKS_TO_POSIX_EPOCH
+    assert filetime.filetimeToPosix(0)==-11644473600.0
+    utc=datetime.timezone.utc
+    assert filetime.filetimeToDatetime(WINDOWS_TICKS_TO_POSIX_EPOCH,utc)\
+        ==datetime.datetime(1970,1,1,tzinfo=utc)
+    assert filetime.filetimeToDatetime(0,utc)\
+        ==datetime.datetime(1601,1,1,tzinfo=utc)
+
+
+def test_roundTrip():
+    for timestamp in SAMPLES:
+        ticks=filetime.posixToFiletime(timestamp)
+        assert filetime.filetimeToPosix(ticks)==pytest.approx(timestamp,
+            abs=1.0/WINDOWS_TICKS)
+        assert filetime.posixToFiletime(filetime.filetimeToPosix(ticks))\
+            ==ticks
+
+
+def test_inputTypes():
+    ticks=filetime.posixToFiletime(1234567890.5)
+    structure=FILETIME()
+    structure.value=ticks
+    assert structure.dwHighDateTime==ticks>>32
+    assert structure.dwLowDateTime==ticks&0xFFFFFFFF
+    raw=ticks.to_bytes(8,'little')
+    for value in (ticks,raw,bytearray(raw),memoryview(raw),structure,
+        ctypes.c_ulonglong(ticks),ctypes.c_uint64(ticks)):
+        #
+        assert filetime.filetimeValue(value)==ticks
+        assert filetime.filetimeToPosix(value)==1234567890.5
+    assert int(structure)==ticks
+    assert filetime.filetimeValue(
+        bytes(memoryview(structure).cast('B')))==ticks
+
+
+@pytest.mark.parametrize('useNumpy',[
+    False,
+    pytest.param(True,marks=pytest.mark.skipif(not filetime.hasNumpy,
+        reason='numpy is not installed'))])
+def test_bulkMatchesScalar(useNumpy):
+    buffer=_buffer(SAMPLES)
+    expected=[filetime.filetimeToPosix(buffer[i:i+8])
+        for i in range(0,len(buffer),8)]
+    for source in (buffer,bytearray(buffer),memoryview(buffer)):
+        result=filetime.filetimesToPosix(source,useNumpy)
+        assert list(result)==pytest.approx(expected,rel=0,abs=1e-6)
+    assert len(filetime.filetimesToPosix(b'',useNumpy))==0
+
+
+@pytest.mark.parametrize('useNumpy',[
+    False,
+    pytest.param(True,marks=pytest.mark.skipif(not filetime.hasNumpy,
+        reason='numpy is not installed'))])
+def test_bulkRejectsPartialValues(useNumpy):
+    with pytest.raises(ValueError):
+        filetime.filetimesToPosix(_buffer(SAMPLES)[:-3],useNumpy)
@@ -0,0 +1,62 @@
+"""
+Tests for the lazy loading in the package __init__
+"""
+import os
+import sys
+import subprocess
+import types
+import importlib
+import pytest
+
+repoDir=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+packageName=os.path.basename(repoDir)
+
+
+@pytest.fixture
+def package():
+    sys.path.insert(0,os.path.dirname(repoDir))
+    try:
+        yield importlib.import_module(packageName)
+    finally:
+        sys.path.remove(os.path.dirname(repoDir))
+
+
+def _run(code:str)->str:
+    return subprocess.run([sys.executable,'-c',code],
+        cwd=os.path.dirname(repoDir),check=True,
+        stdout=subprocess.PIPE).stdout.decode('utf-8').strip()
+
+
+def test_importLoadsNoSubmodules(package):
+    _,submodules=package.importTimeBenchmark(1)
+    assert submodules==[]
+
+
+def test_allHasEverythingStarImportsUsedTo(package):
+    names=package.__all__
+    for name in ('hr','ln','env','which','linkTarget','psCommand',
+        'processLockingFile','FILETIME','normalizeCommand',
+        'getRestartManager','setRestartManager'):
+        #
+        assert name in names
+    assert not any(name.startswith('_') for name in names)
+
+
+def test_lazyNameTableMatchesTheSubmodules(package):
+    expected={}
+    for moduleName,_ in package._starNames:
+        module=importlib.import_module(f'{packageName}.{moduleName}')
+        for name,value in vars(module).items():
+            if not name.startswith('_') \
+                and not isinstance(value,types.ModuleType):
+                #
+                expected[name]=moduleName
+    assert package._lazyNames==expected
+
+
+def test_shadowedNamesSurviveSubmoduleImport():
+    out=_run(f'import types,{packageName}.env,{packageName}.ln\n'
+        f'import {packageName} as p\n'
+        'print(isinstance(p.env,types.ModuleType),'
+        'isinstance(p.ln,types.ModuleType),callable(p.hr))')
+    assert out=='False False True'
@@ -0,0 +1,85 @@
+"""
+Tests for ln
+"""
+import os
+import sys
+import pytest
+import ln
+
+pytestmark=pytest.mark.skipif(sys.platform=='win32',
+    reason='symlinks need extra privileges on windows')
+
+
+def test_retargetMatchesWholeComponents(tmp_path):
+    for name in ('v1','v10','v2'):
+        (tmp_path/name).mkdir()
+    links=tmp_path/'links'
+    links.mkdir()
+    os.symlink(str(tmp_path/'v1'/'x'),links/'a')
+    os.symlink(str(tmp_path/'v10'/'x'),links/'b')
+    os.symlink(str(tmp_path/'v1'),links/'c')
+    records=list(ln.retargetLinks(
+        str(links),str(tmp_path/'v1'),str(tmp_path/'v2')))
+    assert sorted(r['path'] for r in records)==\
+        [str(links/'a'),str(links/'c')]
+    assert os.readlink(links/'a')==str(tmp_path/'v2'/'x')
+    assert os.readlink(links/'b')==str(tmp_path/'v10'/'x')
+    assert os.readlink(links/'c')==str(tmp_path/'v2')
+
+
+def test_replaceLinksRollsBackAFailedWindowsReplace(tmp_path,monkeypatch):
+    for name in ('old1','old2','new1','new2'):
+        (tmp_path/name).write_text(name)
+    first,second=str(tmp_path/'first'),str(tmp_path/'second')
+    os.symlink(str(tmp_path/'old1'),first)
+    os.symlink(str(tmp_path/'old2'),second)
+    realReplace=os.replace
+    attempts=[]
+    def replace(src,dst):
+        if dst==second:
+            attempts.append(src)
+            if len(attempts)==1:
+                raise PermissionError('in use') # triggers the fallback
+            raise OSError('the fallback failed too')
+        realReplace(src,dst)
+    with monkeypatch.context() as m:
+        m.setattr(os,'name','nt')
+        m.setattr(os,'replace',replace)
+        with pytest.raises(OSError,match='fallback failed'):
+            ln.replaceLinks({first:str(tmp_path/'new1'),
+                second:str(tmp_path/'new2')})
+    assert len(attempts)==2
+    # both links are back the way they were, with nothing left over
+    assert os.readlink(first)==str(tmp_path/'old1')
+    assert os.readlink(second)==str(tmp_path/'old2')
+    assert sorted(os.listdir(str(tmp_path)))==\
+        ['first','new1','new2','old1','old2','second']
+
+
+def test_auditTellsLoopsFromOtherErrors(tmp_path,monkeypatch):
+    (tmp_path/'real').write_text('x')
+    os.symlink(str(tmp_path/'real'),str(tmp_path/'ok'))
+    os.symlink(str(tmp_path/'nowhere'),str(tmp_path/'broken'))
+    os.symlink(str(tmp_path/'loopB'),str(tmp_path/'loopA'))
+    os.symlink(str(tmp_path/'loopA'),str(tmp_path/'loopB'))
+    os.symlink(str(tmp_path/'real'),str(tmp_path/'denied'))
+    os.symlink(str(tmp_path/'real'),str(tmp_path/'vanished'))
+    realLinkTarget=ln.linkTarget
+    def linkTarget(path,memo=None):
+        if path.endswith('denied'):
+            raise PermissionError(13,'Permission denied',path)
+        if path.endswith('vanished'):
+            raise FileNotFoundError(2,'No such file or directory',path)
+        return realLinkTarget(path,memo)
+    monkeypatch.setattr(ln,'linkTarget',linkTarget)
+    statuses={os.path.basename(r['path']):r['status']
+        for r in ln.auditLinks(str(tmp_path),threads=2)}
+    assert statuses=={'ok':'ok','broken':'broken','loopA':'circular',
+        'loopB':'circular','denied':'error','vanished':'missing'}
+
+
+def test_threadsNeedsANumber(capsys):
+    for arg in ('--threads','--threads=','--threads=x','--threads=0'):
+        assert ln.cmdline([arg,'--audit','/nonexistent'])==-1
+        assert 'ERR: --threads needs a number' in capsys.readouterr().out
+    assert ln.cmdline(['--threads=2','--audit','/nonexistent'])==0
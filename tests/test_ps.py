@@ -0,0 +1,68 @@
+"""
+Tests for the ps output parsers
+"""
+import math
+import ps
+
+TABLE='''Handles  CPU(s)     Id ProcessName
+-------  ------     -- -----------
+    100    1.50     10 foo
+      0              0 Idle
+    200   12.25      4 bar
+'''
+
+
+def test_blankCellsInArrayColumns():
+    columns=ps.psTableDissectColumns(TABLE,['CPU(s)','Handles'],
+        {'CPU(s)':'d','Handles':'q'})
+    cpu=list(columns['CPU(s)'])
+    assert cpu[0]==1.5 and math.isnan(cpu[1]) and cpu[2]==12.25
+    assert list(columns['Handles'])==[100,0,200]
+    single=ps.psTableDissectColumns(TABLE,['CPU(s)'],{'CPU(s)':'d'})
+    assert math.isnan(single['CPU(s)'][1])
+
+
+LIST='''Name : short
+Path : C:\\Program Files\\Some Vendor\\A Product\\bin\\tool.e
+       xe
+Note : one line
+       then another
+
+Name : second
+'''
+
+
+def test_wrappedValues():
+    width=len(LIST.split('\n')[1])
+    records=list(ps.psColonListDissectIter(LIST,width))
+    assert records[0]['Path']==\
+        'C:\\Program Files\\Some Vendor\\A Product\\bin\\tool.exe'
+    assert records[0]['Note']=='one line then another'
+    assert records[1]=={'Name':'second'}
+    records=list(ps.psColonListDissectIter(LIST))
+    assert records[0]['Path'].endswith('tool.e xe')
+    assert records[0]['Note']=='one line then another'
+
+
+def test_wrappedAtAWordBoundary():
+    lines='''thisitem    : 1
+anotheritem : a value that is long enough
+              to wrap onto another line
+'''
+    expected='a value that is long enough to wrap onto another line'
+    assert ps.psColonListDissect(lines)['anotheritem']==expected
+    assert list(ps.psColonListDissectIter(lines,80))[0]['anotheritem']\
+        ==expected
+
+
+def test_typedValues():
+    for raw,expected in (('42',42),('-7',-7),('0',0),('+3',3),
+        ('1.5',1.5),('-0.25',-0.25),('.5',0.5),('1e3',1000.0),
+        ('2.5E-1',0.25),('True',True),('false',False),('',None),(None,None)):
+        #
+        value=ps.psTypedValue(raw)
+        assert value==expected and type(value) is type(expected)
+    for raw in ('007','00','1_0','1_000.5','007.5',' 1','1 ','1.','1.2.3',
+        '0x10','-','+','.','1e','nan','inf','١٢','10.0.19045'):
+        #
+        assert ps.psTypedValue(raw)==raw
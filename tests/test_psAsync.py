@@ -0,0 +1,47 @@
+"""
+Tests for the asyncio ps functions
+"""
+import os
+import asyncio
+import pytest
+import ps
+
+
+def test_gatherRespectsTheConcurrencyBound():
+    running=[]
+    peak=[0]
+    async def command(cmd):
+        running.append(cmd)
+        peak[0]=max(peak[0],len(running))
+        await asyncio.sleep(0.01)
+        running.remove(cmd)
+        return cmd*2
+    results=ps.psGather(range(20),3,command)
+    assert results==[i*2 for i in range(20)] # in the order given
+    assert peak[0]==3
+
+
+def test_gatherExceptions():
+    async def command(cmd):
+        if cmd=='bad':
+            raise ValueError(cmd)
+        return cmd
+    with pytest.raises(ValueError):
+        ps.psGather(['ok','bad'],command=command)
+    results=ps.psGather(['ok','bad'],command=command,returnExceptions=True)
+    assert results[0]=='ok' and isinstance(results[1],ValueError)
+
+
+posixOnly=pytest.mark.skipif(os.name=='nt',reason='needs a posix shell')
+
+
+@posixOnly
+def test_commandAsyncRunsTheShell(monkeypatch):
+    monkeypatch.setattr(ps,'psShellCommand',['sh','-c'])
+    assert asyncio.run(ps.psCommandAsync(['echo','hello']))=='hello\n'
+    with pytest.raises(Exception,match='oops'):
+        asyncio.run(ps.psCommandAsync('echo oops >&2'))
+    table='printf "Id Name\\n-- ----\\n1  a\\n"'
+    assert ps.psGather([table,table],
+        command=ps.psCommandWithTableOutputAsync)==\
+        [[{'Id':'1','Name':'a'}]]*2
@@ -0,0 +1,101 @@
+"""
+Tests for the psCommand result cache
+"""
+import time
+import threading
+import pytest
+import psCache
+
+
+def test_normalizeCommand():
+    assert psCache.normalizeCommand('Get-Service   -Name  "a  b" ')==\
+        'Get-Service -Name "a  b"'
+    assert psCache.normalizeCommand(['Get-Process','-Id','1'])==\
+        'Get-Process -Id 1'
+
+
+def test_concurrentGetsRunTheLoaderOnce():
+    cache=psCache.ResultCache()
+    release=threading.Event()
+    calls=[]
+    def load(key):
+        calls.append(key)
+        release.wait(5)
+        return key.upper()
+    results=[]
+    threads=[threading.Thread(target=lambda:results.append(
+        cache.get('k',load))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    deadline=time.monotonic()+5
+    while cache.misses<8 and time.monotonic()<deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert calls==['k']
+    assert results==['K']*8
+    assert cache.get('k',load)=='K' and cache.hits==1
+
+
+def test_failuresAreSharedButNotCached():
+    cache=psCache.ResultCache()
+    def fail(key):
+        raise RuntimeError(key)
+    with pytest.raises(RuntimeError):
+        cache.get('k',fail)
+    assert 'k' not in cache
+    assert cache.get('k',lambda key:1)==1
+
+
+def test_ttl():
+    cache=psCache.ResultCache(ttl=1000)
+    values=iter(range(100))
+    load=lambda key:next(values) # noqa: E731
+    assert cache.get('a',load)==0
+    assert cache.get('a',load)==0
+    assert 'a' in cache
+    # expired as soon as it is stored
+    assert cache.get('b',load,ttl=0)==1
+    assert 'b' not in cache
+    assert cache.get('b',load,ttl=0)==2
+    cache.invalidate('a')
+    assert cache.get('a',load)==3
+
+
+def test_lruEviction():
+    cache=psCache.ResultCache(maxSize=2)
+    cache.get('a',str.upper)
+    cache.get('b',str.upper)
+    cache.get('a',str.upper) # a is now the most recently used
+    cache.get('c',str.upper) # so b is the one dropped
+    assert 'a' in cache and 'c' in cache and 'b' not in cache
+    assert len(cache)==2
+    assert cache.stats()=={'hits':1,'misses':3,'size':2}
+
+
+def test_invalidateMatching():
+    cache=psCache.ResultCache()
+    for key in ('Get-Service a','Get-Service b','Get-Process'):
+        cache.get(key,str.lower)
+    assert cache.invalidateMatching('^Get-Service')==2
+    assert len(cache)==1
+    cache.invalidate()
+    assert len(cache)==0
+
+
+def test_psCommandUsesTheCache(monkeypatch):
+    import ps
+    ran=[]
+    class Pool:
+        def run(self,cmd):
+            ran.append(cmd)
+            return f'out {len(ran)}'
+    monkeypatch.setattr(ps,'workerPool',Pool())
+    monkeypatch.setattr(ps,'resultCache',None)
+    ps.setResultCache(psCache.ResultCache())
+    assert ps.psCommand('Get-Service  x')=='out 1'
+    assert ps.psCommand(['Get-Service','x'])=='out 1'
+    assert ran==['Get-Service  x'] # what the caller gave, not the key
+    ps.setResultCache(None)
+    assert ps.psCommand('Get-Service x')=='out 2'
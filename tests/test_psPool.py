@@ -0,0 +1,21 @@
+"""
+Tests for the shell worker pool
+"""
+import shutil
+import pytest
+import psPool
+
+bashOnly=pytest.mark.skipif(shutil.which('bash') is None,
+    reason='needs bash')
+
+
+@bashOnly
+def test_outputWithoutTrailingNewline():
+    worker=psPool.ShellWorker(psPool.BashBackend())
+    try:
+        assert worker.run("printf abc")==('abc','')
+        assert worker.run("printf 'abc\\n\\n'")==('abc\n','')
+        assert worker.run("printf err >&2")==('','err')
+        assert worker.run("echo one")==('one','')
+    finally:
+        worker.stop()
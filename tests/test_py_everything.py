@@ -0,0 +1,140 @@
+"""
+Tests for py_everything
+"""
+import pytest
+import py_everything
+
+
+@pytest.mark.parametrize('arg',['--limit','--offset','--sort','--db',
+    '--index','--limit=','--limit=x','--offset=-1','--sort=size!',
+    '--sort=--name','--sort=-'])
+def test_cmdlineRejectsBadOptions(arg,capsys,monkeypatch):
+    def searchIter(*args,**kwargs):
+        raise AssertionError('should not search')
+    monkeypatch.setattr(py_everything,'searchIter',searchIter)
+    assert py_everything.cmdline([arg,'query'])==1
+    out=capsys.readouterr().out
+    assert out.startswith('ERR: ') and 'USEAGE:' in out
+
+
+def test_cmdlinePassesOptions(capsys,monkeypatch):
+    calls=[]
+    def searchIter(query,flags,offset,limit,sort,descending,backend=None):
+        calls.append((query,offset,limit,sort,descending))
+        return iter([])
+    monkeypatch.setattr(py_everything,'searchIter',searchIter)
+    assert py_everything.cmdline(['--offset=5','--limit=10',
+        '--sort=-dateModified','some','thing'])==0
+    assert calls==[('some thing',5,10,'dateModified',True)]
+    assert 'Result Count: 0' in capsys.readouterr().out
+
+
+class _FakeEverythingDll:
+    """
+    Stands in for the everything sdk, serving pages out of a list
+    """
+
+    def __init__(self,paths):
+        self.paths=paths
+        self.calls=[]
+        self.offset=0
+        self.max=0
+        self.page=[]
+
+    def __getattr__(self,name):
+        # the setters that the tests do not care about
+        return lambda *args:self.calls.append((name,)+args)
+
+    def Everything_SetOffset(self,offset):
+        self.calls.append(('offset',offset))
+        self.offset=offset
+
+    def Everything_SetMax(self,count):
+        self.calls.append(('max',count))
+        self.max=count
+
+    def Everything_QueryW(self,wait):
+        self.page=self.paths[self.offset:self.offset+self.max]
+        return True
+
+    def Everything_GetNumResults(self):
+        return len(self.page)
+
+    def Everything_GetResultFullPathNameW(self,i,buf,size):
+        path=self.page[i]
+        if buf is None:
+            return len(path)
+        assert size>len(path),'buffer too small'
+        buf.value=path
+        return len(path)
+
+    def Everything_GetResultSize(self,i,size):
+        size.value=self.offset+i
+        return True
+
+    def Everything_GetResultDateModified(self,i,dateModified):
+        dateModified.value=py_everything.WINDOWS_TICKS_TO_POSIX_EPOCH
+        return True
+
+    def Everything_IsFolderResult(self,i):
+        return self.page[i].endswith('\\')
+
+
+def _fakeBackend(paths,pageSize):
+    backend=object.__new__(py_everything.EverythingBackend)
+    backend.dll=_FakeEverythingDll(paths)
+    backend.pageSize=pageSize
+    return backend
+
+
+def _pages(backend):
+    return [c[1] for c in backend.dll.calls if c[0] in ('offset','max')]
+
+
+def test_everythingPagesThroughResults():
+    paths=[f'C:\\f{i}' for i in range(10)]
+    backend=_fakeBackend(paths,pageSize=4)
+    results=list(backend.searchIter('f'))
+    assert [r.path for r in results]==paths
+    assert [r.size for r in results]==list(range(10))
+    assert all(r.dateModified==0.0 and not r.isDir for r in results)
+    # stops on the first short page
+    assert _pages(backend)==[0,4,4,4,8,4]
+
+
+def test_everythingOffsetAndLimit():
+    paths=[f'C:\\f{i}' for i in range(10)]
+    backend=_fakeBackend(paths,pageSize=4)
+    results=list(backend.searchIter('f',offset=3,limit=5))
+    assert [r.path for r in results]==paths[3:8]
+    # the last page only asks for what is left of the limit
+    assert _pages(backend)==[3,4,7,1]
+    backend=_fakeBackend(paths,pageSize=4)
+    assert list(backend.searchIter('f',offset=20))==[]
+    assert _pages(backend)==[20,4]
+    backend=_fakeBackend(paths,pageSize=5)
+    assert len(list(backend.searchIter('f',limit=10)))==10
+    # an exact multiple of the page size does not ask again
+    assert _pages(backend)==[0,5,5,5]
+
+
+def test_everythingLongPathsAndFields():
+    paths=['C:\\short','C:\\'+'x'*1000,'C:\\dir\\']
+    backend=_fakeBackend(paths,pageSize=10)
+    results=list(backend.searchIter('x',fields=('path','isDir'),
+        sort='size',descending=True))
+    assert [r.path for r in results]==paths
+    assert [r.isDir for r in results]==[False,False,True]
+    calls=backend.dll.calls
+    assert ('Everything_SetSort',
+        py_everything.EVERYTHING_SORTS[('size',True)]) in calls
+    assert ('Everything_SetRequestFlags',
+        py_everything.EVERYTHING_REQUEST_FULL_PATH_AND_FILE_NAME|
+        py_everything.EVERYTHING_REQUEST_ATTRIBUTES) in calls
+
+
+def test_everythingRejectsUnknownSorts():
+    backend=_fakeBackend([],pageSize=10)
+    with pytest.raises(ValueError,match='Unknown sort'):
+        list(backend.searchIter('x',sort='owner'))
+    assert backend.dll.calls==[]
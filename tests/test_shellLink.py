@@ -0,0 +1,84 @@
+"""
+Tests for reading .lnk shortcuts, and following them with ln
+"""
+import os
+import pytest
+import shellLink
+import ln
+
+
+def _writeLink(path,target,relativePath=''):
+    with open(str(path),'wb') as f:
+        f.write(shellLink.makeShellLink(target,relativePath))
+    return str(path)
+
+
+def test_parseRoundTrip():
+    data=shellLink.makeShellLink('C:\\Tools\\app.exe',
+        workingDir='C:\\Tools',arguments='--fast')
+    link=shellLink.parseShellLink(data)
+    assert link.localBasePath=='C:\\Tools\\app.exe'
+    assert link.target=='C:\\Tools\\app.exe'
+    assert link.workingDir=='C:\\Tools'
+    assert link.arguments=='--fast'
+    assert link.linkFlags&shellLink.IS_UNICODE
+
+
+def test_parseUnicodePath():
+    target='C:\\Users\\Zo\u00eb\\\u65e5\u672c\u8a9e\\\u6587\u66f8.txt'
+    link=shellLink.parseShellLink(shellLink.makeShellLink(target))
+    assert link.target==target
+
+
+def test_parseRelativePathOnly():
+    link=shellLink.parseShellLink(
+        shellLink.makeShellLink('',relativePath='..\\docs\\readme.txt'))
+    assert link.localBasePath==''
+    assert link.target=='..\\docs\\readme.txt'
+
+
+def test_parseRejectsBadData():
+    with pytest.raises(shellLink.ShellLinkError):
+        shellLink.parseShellLink(b'not a shortcut at all'*10)
+    data=shellLink.makeShellLink('C:\\x',arguments='abc')
+    with pytest.raises(shellLink.ShellLinkError):
+        shellLink.parseShellLink(data[:shellLink.HEADER_SIZE+2])
+
+
+def test_linkHopFollowsShortcuts(tmp_path):
+    target=tmp_path/'\u65e5\u672c'/'file.txt'
+    target.parent.mkdir()
+    target.write_text('x')
+    absolute=_writeLink(tmp_path/'absolute.lnk',str(target))
+    assert ln.linkHop(absolute)==str(target)
+    relative=_writeLink(tmp_path/'sub.lnk','',
+        '.\\\u65e5\u672c\\file.txt')
+    assert ln.linkHop(relative)==str(target)
+    # not a link at all
+    assert ln.linkHop(str(target)) is None
+    notAShortcut=tmp_path/'broken.lnk'
+    notAShortcut.write_bytes(b'garbage')
+    assert ln.linkHop(str(notAShortcut)) is None
+
+
+def test_linkTargetsChainsLoopsAndMissing(tmp_path):
+    target=tmp_path/'real.txt'
+    target.write_text('x')
+    second=_writeLink(tmp_path/'second.lnk',str(target))
+    first=_writeLink(tmp_path/'first.lnk',second)
+    loopA=str(tmp_path/'loopA.lnk')
+    loopB=_writeLink(tmp_path/'loopB.lnk',loopA)
+    _writeLink(loopA,loopB)
+    missing=_writeLink(tmp_path/'missing.lnk',
+        str(tmp_path/'gone'/'nothing.txt'))
+    memo={}
+    results=ln.linkTargets([first,second,loopA,missing],True,memo)
+    assert results[first]==str(target)
+    assert results[second]==str(target)
+    assert isinstance(results[loopA],Exception)
+    # a dangling shortcut still says where it points
+    assert results[missing]==str(tmp_path/'gone'/'nothing.txt')
+    assert not os.path.exists(results[missing])
+    assert memo[second]==str(target)
+    with pytest.raises(Exception):
+        ln.linkTargets([loopA])
@@ -0,0 +1,234 @@
+"""
+Tests for whoLockedFile (the parts that can run anywhere)
+"""
+import os
+import sys
+import pytest
+import whoLockedFile
+
+posixOnly=pytest.mark.skipif(sys.platform!='linux',reason='needs /proc')
+
+
+class _FakeClockWatcher(whoLockedFile.LockWatcher):
+    """
+    A LockWatcher on a fake clock, with canned /proc scans
+    """
+
+    def __init__(self,paths,interval,scans=(),**kwargs):
+        self.events=[]
+        whoLockedFile.LockWatcher.__init__(self,paths,interval,
+            onEvent=self.events.append,**kwargs)
+        self.now=100.0
+        self.scans=list(scans)
+        self.scannedAt=[]
+
+    def clock(self):
+        return self.now
+
+    def sleep(self,seconds):
+        self.now+=seconds
+        return False
+
+    def scanOpenFiles(self):
+        self.scannedAt.append(self.now-100.0)
+        return self.scans.pop(0) if self.scans else {}
+
+
+@posixOnly
+def test_watcherScansProcOncePerInterval(tmp_path):
+    root=os.path.realpath(str(tmp_path))
+    a,b=root+'/a',root+'/b'
+    me=os.getpid()
+    watcher=_FakeClockWatcher([a,b]+[f'{root}/{i}' for i in range(23)],1.0,
+        [{a:{me}},{a:{me},b:{me}},{}])
+    watcher.run(duration=2.5)
+    assert watcher.slots==1
+    assert watcher.scannedAt==[0.0,1.0,2.0]
+    assert [(e['event'],e['path']) for e in watcher.events]==[
+        ('acquired',a),('acquired',b),('released',a),('released',b)]
+    assert all(e['pid']==me for e in watcher.events)
+    assert watcher.holders=={}
+
+
+class _SizingRestartManager(whoLockedFile.WindowsRestartManager):
+    """
+    Pretends there are always `needed` processes
+    """
+
+    def __init__(self,needed:int):
+        whoLockedFile.WindowsRestartManager.__init__(self,initialSize=2)
+        self.needed=needed
+        self.calls=0
+
+    def rawGetList(self,session,buffer):
+        self.calls+=1
+        if len(buffer)<self.needed:
+            return whoLockedFile.ERROR_MORE_DATA,self.needed,0
+        return 0,self.needed,0
+
+
+def test_sharedRestartManagerKeepsItsBuffer():
+    previous=whoLockedFile.sharedRestartManager
+    try:
+        manager=_SizingRestartManager(5)
+        whoLockedFile.setRestartManager(manager)
+        assert whoLockedFile.getRestartManager() is manager
+        whoLockedFile.getRestartManager().getList(0)
+        assert manager.calls==2 # grown once
+        buffer=manager.buffer
+        whoLockedFile.getRestartManager().getList(0)
+        assert manager.calls==3 and manager.buffer is buffer
+        whoLockedFile.setRestartManager(None)
+        assert isinstance(whoLockedFile.getRestartManager(),
+            whoLockedFile.WindowsRestartManager)
+        assert whoLockedFile.getRestartManager() \
+            is whoLockedFile.getRestartManager()
+    finally:
+        whoLockedFile.setRestartManager(previous)
+
+
+@posixOnly
+def test_procIgnoresPathsAndWhatIsUnderThem(tmp_path):
+    root=os.path.realpath(str(tmp_path))
+    me,parent=os.getpid(),os.getppid()
+    openFiles={
+        root+'/keep/a':{me},
+        root+'/skip/b':{parent},
+        root+'/skip':{parent},
+        root+'/skipped':{me}}
+    found=whoLockedFile._processLockingFileProc(
+        root,True,True,openFiles,ignore=[root+'/skip'])
+    assert [p.pid for p in found]==[me]
+    found=whoLockedFile._processLockingFileProc(root,True,True,openFiles)
+    assert [p.pid for p in found]==sorted((me,parent))
+
+
+@posixOnly
+def test_reprLooksUpTheName():
+    info=whoLockedFile.ProcessInfo(pid=os.getpid())
+    record=whoLockedFile.getProcessTable().get(os.getpid())
+    assert record is not None and record.name
+    assert repr(info).split('\n')[0]=='0x%08X %s'%(os.getpid(),record.name)
+
+
+class _FakeRestartManager(whoLockedFile.RestartManager):
+    """
+    Answers from a fixed {path:[LockHolder]} and records every query
+    """
+
+    def __init__(self,locks):
+        self.locks=locks
+        self.sessions={}
+        self.queries=[]
+
+    def startSession(self):
+        session=len(self.queries)+len(self.sessions)+1
+        self.sessions[session]=[]
+        return session
+
+    def registerFiles(self,session,filenames):
+        self.sessions[session].extend(filenames)
+
+    def getList(self,session):
+        filenames=self.sessions[session]
+        self.queries.append(list(filenames))
+        ret=[]
+        for filename in filenames:
+            for holder in self.locks.get(filename,[]):
+                if holder not in ret:
+                    ret.append(holder)
+        return ret
+
+    def endSession(self,session):
+        del self.sessions[session]
+
+
+editor=whoLockedFile.LockHolder(10,1,'editor')
+indexer=whoLockedFile.LockHolder(20,2,'indexer')
+
+
+def test_findCulpritsBisectsALockedChunk():
+    filenames=[f'f{i}' for i in range(8)]
+    manager=_FakeRestartManager({'f2':[editor],'f5':[editor,indexer]})
+    found=list(whoLockedFile._findCulprits(
+        manager,filenames,manager.query(filenames)))
+    assert found==[('f2',[editor]),('f5',[editor,indexer])]
+    assert not manager.sessions # every session was ended
+    # an unlocked half is never split any further
+    assert ['f0'] not in manager.queries and ['f7'] not in manager.queries
+
+
+def test_findCulpritsIsLogarithmic():
+    filenames=[f'f{i}' for i in range(64)]
+    manager=_FakeRestartManager({'f37':[editor]})
+    found=list(whoLockedFile._findCulprits(
+        manager,filenames,manager.query(filenames)))
+    assert found==[('f37',[editor])]
+    # the first query, then at most two per level of splitting,
+    # rather than one per file
+    assert len(manager.queries)<=1+2*6
+
+
+def test_findCulpritsSkipsUnlockedChunks():
+    manager=_FakeRestartManager({})
+    assert list(whoLockedFile._findCulprits(manager,['a','b'],[]))==[]
+    assert manager.queries==[]
+
+
+def _tree(tmp_path):
+    paths=[]
+    for directory in ('a','b','skip'):
+        os.mkdir(str(tmp_path/directory))
+        for i in range(3):
+            path=tmp_path/directory/f'{i}.txt'
+            path.write_text('x')
+            paths.append(str(path))
+    return paths
+
+
+def test_rmChunksAndDedupes(tmp_path):
+    paths=_tree(tmp_path)
+    manager=_FakeRestartManager({
+        paths[0]:[editor],paths[4]:[editor,indexer],paths[8]:[indexer]})
+    found=list(whoLockedFile._processLockingFileRm(
+        str(tmp_path),True,restartManager=manager,chunkSize=4))
+    assert [p.pid for p in found]==[10,20] # each process only once
+    registered=[path for query in manager.queries for path in query]
+    assert len(registered)==len(set(registered))==1+3+len(paths)
+    assert all(len(query)<=4 for query in manager.queries)
+    assert len(manager.queries)==4 # 13 paths in chunks of 4
+
+
+def test_rmIgnore(tmp_path):
+    paths=_tree(tmp_path)
+    manager=_FakeRestartManager({paths[8]:[indexer]})
+    found=list(whoLockedFile._processLockingFileRm(
+        str(tmp_path),True,[str(tmp_path/'skip')],manager,chunkSize=4))
+    assert found==[]
+    registered=[path for query in manager.queries for path in query]
+    assert not any('skip' in path for path in registered)
+    located=list(whoLockedFile.lockedFiles(str(tmp_path),True,
+        [paths[4]],restartManager=manager,chunkSize=4))
+    assert located==[(paths[8],[indexer])]
+    manager.locks[paths[4]]=[editor]
+    located=list(whoLockedFile.lockedFiles(str(tmp_path),True,
+        [paths[4]],restartManager=manager,chunkSize=4))
+    assert located==[(paths[8],[indexer])]
+
+
+def test_watcherSpreadsRestartManagerQueriesOverSlots():
+    queried=[]
+    class TimedRestartManager(_FakeRestartManager):
+        def getList(self,session):
+            queried.append((watcher.now-100.0,
+                tuple(self.sessions[session])))
+            return _FakeRestartManager.getList(self,session)
+    paths=[os.path.abspath(f'p{i}') for i in range(4)]
+    watcher=_FakeClockWatcher(paths,1.0,slots=2,
+        restartManager=TimedRestartManager({paths[3]:[editor]}))
+    watcher.run(duration=1.9)
+    assert [when for when,_ in queried]==[0.0,0.0,0.5,0.5,1.0,1.0,1.5,1.5]
+    assert [path for _,(path,) in queried[:4]]==\
+        [paths[0],paths[2],paths[1],paths[3]]
+    assert [(e['event'],e['path'],e['name']) for e in watcher.events]==\
+        [('acquired',paths[3],'editor')]
@@ -0,0 +1,33 @@
+"""
+Tests for listing named pipes
+"""
+import os
+import pytest
+import windowsNamedPipes
+
+posixOnly=pytest.mark.skipif(not hasattr(os,'mkfifo'),reason='needs fifos')
+
+
+@posixOnly
+def test_patternMatchesBasename(tmp_path):
+    os.mkfifo(str(tmp_path/'app.fifo'))
+    os.mkfifo(str(tmp_path/'other'))
+    def find(pattern):
+        return sorted(windowsNamedPipes.listPipes(pattern,[str(tmp_path)],
+            includeSockets=False))
+    expected=[str(tmp_path/'app.fifo')]
+    assert find('*.fifo')==expected
+    assert find('app*')==expected
+    assert find(str(tmp_path/'app.*'))==expected
+    assert find('nothing*')==[]
+
+
+@pytest.mark.skipif(os.name=='nt',reason='posix names only')
+def test_patternMatchesAbstractSocketName(monkeypatch):
+    monkeypatch.setattr(windowsNamedPipes,'_listUnixSockets',
+        lambda:iter(['@/tmp/dbus-abc','/run/app.sock']))
+    def find(pattern):
+        return list(windowsNamedPipes.listPipes(pattern,[]))
+    assert find('/tmp/dbus*')==['@/tmp/dbus-abc']
+    assert find('dbus*')==['@/tmp/dbus-abc']
+    assert find('*.sock')==['/run/app.sock']
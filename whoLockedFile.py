@@ -8,26 +8,30 @@ see also:
 """ # noqa: E501 # pylint: disable=line-too-long
 import typing
 import os
-from dataclasses import dataclass
+import time
+import json
+import datetime
+import threading
+from dataclasses import dataclass,field
 
 try:
     import win32api # type: ignore
-    import win32con # type: ignore
-    import pywintypes # type: ignore
     hasWindowsTools=True
 except ImportError:
     hasWindowsTools=False
 import ctypes
-
-rstrtmgr=ctypes.windll.Rstrtmgr # restart manager dll
+try:
+    from .filetime import FILETIME,WINDOWS_TICKS,filetimeToPosix, \
+        posixToFiletime
+except ImportError:
+    from filetime import FILETIME,WINDOWS_TICKS,filetimeToPosix, \
+        posixToFiletime # type: ignore
 
 CCH_RM_MAX_APP_NAME=255
 CCH_RM_SESSION_KEY=512#255
 CCH_RM_MAX_SVC_NAME=63
-class FILETIME(ctypes.c_ulong):
-    """
-    Windows FILETIME structure
-    """
+ERROR_ACCESS_DENIED=5
+ERROR_MORE_DATA=234
 class RM_UNIQUE_PROCESS(ctypes.Structure):
     """
     https://docs.microsoft.com/en-us/windows/win32/api/restartmanager/ns-restartmanager-rm_unique_process
@@ -46,6 +50,14 @@ class RM_APP_TYPE(ctypes.c_uint):
     RmExplorer = 4
     RmConsole = 5
     RmCritical = 1000
+    names={
+        RmUnknownApp:'',
+        RmMainWindow:'main window',
+        RmOtherWindow:'other window',
+        RmService:'service',
+        RmExplorer:'explorer',
+        RmConsole:'console',
+        RmCritical:'critical'}
 
 class RM_PROCESS_INFO(ctypes.Structure):
     """
@@ -59,18 +71,32 @@ class RM_PROCESS_INFO(ctypes.Structure):
         ("AppStatus",ctypes.c_uint),
         ("TSSessionId",ctypes.c_uint),
         ("bRestartable",ctypes.c_bool)]
-    raise NotImplementedError()
-    # TODO: I don't know what this is, but it looks incomplete
-    # c_uint_p=ctypes.POINTER(ctypes.c_uint)
-    # RM_PROCESS_INFO_p=ctypes.POINTER(RM_PROCESS_INFO)
-    # rstrtmgr.RmStartSession.restype=ctypes.c_uint
-    # rstrtmgr.RmStartSession.argtypes=c_uint_p,ctypes.c_uint,ctypes.c_wchar_p
-    # rstrtmgr.RmRegisterResources.restype=ctypes.c_uint
-    # rstrtmgr.RmRegisterResources.argtypes=ctypes.c_uint,ctypes.c_uint,ctypes.POINTER(ctypes.c_wchar_p),ctypes.c_uint,ctypes.c_void_p,ctypes.c_uint,ctypes.c_void_p
-    # rstrtmgr.RmGetList.restype=ctypes.c_uint
-    # rstrtmgr.RmGetList.argtypes=ctypes.c_uint,c_uint_p,c_uint_p,RM_PROCESS_INFO_p,c_uint_p
-    # rstrtmgr.RmEndSession.restype=ctypes.c_uint
-    # rstrtmgr.RmEndSession.argtypes=[ctypes.c_uint]
+
+RM_PROCESS_INFO_p=ctypes.POINTER(RM_PROCESS_INFO)
+
+_rstrtmgr=None
+def getRstrtmgr():
+    """
+    Get the restart manager dll
+    (loaded on first use so this module can be imported on any os)
+    """
+    global _rstrtmgr
+    if _rstrtmgr is None:
+        dll=ctypes.windll.Rstrtmgr # type: ignore
+        c_uint_p=ctypes.POINTER(ctypes.c_uint)
+        dll.RmStartSession.restype=ctypes.c_uint
+        dll.RmStartSession.argtypes=c_uint_p,ctypes.c_uint,ctypes.c_wchar_p
+        dll.RmRegisterResources.restype=ctypes.c_uint
+        dll.RmRegisterResources.argtypes=ctypes.c_uint,ctypes.c_uint,\
+            ctypes.POINTER(ctypes.c_wchar_p),ctypes.c_uint,ctypes.c_void_p,\
+            ctypes.c_uint,ctypes.c_void_p
+        dll.RmGetList.restype=ctypes.c_uint
+        dll.RmGetList.argtypes=ctypes.c_uint,c_uint_p,c_uint_p,\
+            RM_PROCESS_INFO_p,c_uint_p
+        dll.RmEndSession.restype=ctypes.c_uint
+        dll.RmEndSession.argtypes=[ctypes.c_uint]
+        _rstrtmgr=dll
+    return _rstrtmgr
 
 @dataclass
 class ProcessInfo:
@@ -85,6 +111,7 @@ class ProcessInfo:
     _processExitTime:typing.Optional[int]=None
     _processKernelTime:typing.Optional[int]=None
     _processUserTime:typing.Optional[int]=None
+    _lookedUp:bool=field(default=False,repr=False,compare=False)
 
     @property
     def processExitTime(self)->int:
@@ -133,55 +160,39 @@ class ProcessInfo:
             return self.name
         return self._fullName
 
-    def _getProcessInfo(self):
+    def _getProcessInfo(self)->None:
         """
         Fetch the process info from the system
+        (from the shared process table, so this is usually free)
         """
-        ftCreate=FILETIME(0)
-        ftExit=FILETIME(0)
-        ftKernel=FILETIME(0)
-        ftUser=FILETIME(0)
-        if self.pid!=0:
-            hProcess=win32api.OpenProcess(
-                win32con.PROCESS_QUERY_LIMITED_INFORMATION,
-                pywintypes.FALSE,
-                self.pid)
-            hProcess=win32api.OpenProcess(
-                win32con.PROCESS_QUERY_LIMITED_INFORMATION,
-                False,
-                self.pid)
-            if hProcess:
-                processStartTime=ctypes.c_uint(self.processStartTime)
-                if win32api.GetProcessTimes(
-                    hProcess,
-                    ctypes.pointer(ftCreate),
-                    ctypes.pointer(ftExit),
-                    ctypes.pointer(ftKernel),
-                    ctypes.pointer(ftUser)) \
-                    and \
-                    win32api.CompareFileTime(
-                    ctypes.pointer(processStartTime),
-                    ctypes.pointer(ftCreate)) == 0:
-                    #
-                    imageName=ctypes.c_wchar*win32con.MAX_PATH
-                    imageNameLen=ctypes.c_uint(win32con.MAX_PATH)
-                    if win32api.QueryFullProcessImageNameW(
-                        hProcess,0,imageName,
-                        ctypes.pointer(imageNameLen)) \
-                        and imageNameLen<=win32con.MAX_PATH:
-                        #
-                        self._fullName=imageName
-                win32api.CloseHandle(hProcess)
-        return (ftCreate,ftExit,ftKernel,ftUser)
+        if self._lookedUp or self.pid==0:
+            return
+        self._lookedUp=True
+        record=getProcessTable().get(self.pid,self.processStartTime)
+        if record is None:
+            return
+        if not self.name:
+            self.name=record.name
+        if self._fullName is None:
+            self._fullName=record.fullName
+        if self._processExitTime is None:
+            self._processExitTime=record.processExitTime
+        if self._processKernelTime is None:
+            self._processKernelTime=record.processKernelTime
+        if self._processUserTime is None:
+            self._processUserTime=record.processUserTime
 
     def __repr__(self)->str:
+        # look up first so that the name is filled in too
+        self._getProcessInfo()
         ret=[]
         ret.append('0x%08X %s'%(self.pid,self.name))
         ret.append(self.fullName)
         if self.appType:
             ret.append(self.appType)
         if self.processStartTime!=0:
-            ret.append(f'start: {self.processStartTime}')
+            start=filetimeToPosix(self.processStartTime)
+            ret.append(f'start: {datetime.datetime.fromtimestamp(start)}')
         if self.processExitTime!=0:
             ret.append(f'exit: {self.processExitTime}')
         if self.processKernelTime!=0:
@@ -191,95 +202,904 @@ class ProcessInfo:
         return '\n   '.join(ret)
 
 
+@dataclass(frozen=True)
+class LockHolder:
+    """
+    Lightweight record of a process using a file
+
+    Unlike ProcessInfo, this is only what the lock query itself
+    returned, so looking at it (or printing it) never goes back
+    to the os for more.
+    """
+    pid:int
+    processStartTime:int=0
+    name:str=''
+    appType:str=''
+    serviceName:str=''
+    restartable:bool=False
+
+    def processInfo(self)->ProcessInfo:
+        """
+        Get the full (lazily looked up) ProcessInfo for this process
+        """
+        return ProcessInfo(self.name,self.pid,self.appType,
+            processStartTime=self.processStartTime)
+
+    def __str__(self)->str:
+        ret='0x%08X %s'%(self.pid,self.name)
+        if self.appType:
+            ret+=f' ({self.appType})'
+        return ret
+
+
+def _windowsError(dwError:int)->Exception:
+    """
+    Create an exception for a windows error code
+
+    See also:
+        https://docs.microsoft.com/en-us/windows/win32/debug/system-error-codes--0-499-
+    """ # noqa: E501 # pylint: disable=line-too-long
+    if hasWindowsTools:
+        msg=win32api.FormatMessage(dwError)
+    elif hasattr(ctypes,'FormatError'):
+        msg=ctypes.FormatError(dwError) # type: ignore
+    else:
+        msg=''
+    return Exception(('[Windows error 0x%02X] %s'%(dwError,msg)).strip())
+
+
+class RestartManager:
+    """
+    The parts of the windows "restart manager" we use,
+    one method per api call.
+
+    Implementation is to query the "restart manager" to get this information
+    (You know, how every time you try to shut down winda's says
+    "you can't because these apps are preventing it")
+
+    This is the interface, so that the batching logic can be
+    driven by a fake on other os's.
+
+    See also:
+        https://docs.microsoft.com/th-th/windows/win32/api/_rstmgr/
+    """
+
+    def startSession(self)->int:
+        """
+        Start a session
+
+        returns a session handle
+        """
+        raise NotImplementedError()
+
+    def registerFiles(self,session:int,filenames:typing.Sequence[str])->None:
+        """
+        Register a whole batch of files with a session
+        """
+        raise NotImplementedError()
+
+    def getList(self,session:int)->typing.List[LockHolder]:
+        """
+        Get all processes using any file registered with the session
+        """
+        raise NotImplementedError()
+
+    def endSession(self,session:int)->None:
+        """
+        End a session
+        """
+        raise NotImplementedError()
+
+    def query(self,filenames:typing.Sequence[str])->typing.List[LockHolder]:
+        """
+        All processes using any of the files, in a single session
+        """
+        session=self.startSession()
+        try:
+            self.registerFiles(session,filenames)
+            return self.getList(session)
+        finally:
+            self.endSession(session)
+
+
+class WindowsRestartManager(RestartManager):
+    """
+    The real restart manager, called through ctypes
+
+    The RM_PROCESS_INFO buffer is kept between calls and only
+    grows when the restart manager says it needs more room
+    (getRestartManager() shares one instance so that really happens).
+    rawGetList() is the only part that touches the dll,
+    so override it to fake the sizing behavior.
+    """
+
+    def __init__(self,initialSize:int=16,maxTries:int=8):
+        """
+        :initialSize: how many RM_PROCESS_INFO to start out with
+        :maxTries: give up if the list keeps growing faster than us
+        """
+        self.buffer=(RM_PROCESS_INFO*initialSize)()
+        self.maxTries=maxTries
+        self._lock=threading.Lock()
+
+    def startSession(self)->int:
+        dwSession=ctypes.c_uint()
+        szSessionKey=ctypes.create_unicode_buffer(CCH_RM_SESSION_KEY+1)
+        dwError=getRstrtmgr().RmStartSession(
+            ctypes.pointer(dwSession),0,szSessionKey)
+        if dwError!=0:
+            raise _windowsError(dwError)
+        return dwSession.value
+
+    def registerFiles(self,session:int,filenames:typing.Sequence[str])->None:
+        pszFiles=(ctypes.c_wchar_p*len(filenames))(*filenames)
+        dwError=getRstrtmgr().RmRegisterResources(
+            session,len(filenames),pszFiles,0,None,0,None)
+        if dwError!=0:
+            raise _windowsError(dwError)
+
+    def rawGetList(self,
+        session:int,
+        buffer:ctypes.Array
+        )->typing.Tuple[int,int,int]:
+        """
+        Call RmGetList once
+
+        returns (error code,number needed,number filled in)
+        """
+        dwReason=ctypes.c_uint()
+        nProcInfoNeeded=ctypes.c_uint()
+        nProcInfo=ctypes.c_uint(len(buffer))
+        dwError=getRstrtmgr().RmGetList(
+            session,
+            ctypes.byref(nProcInfoNeeded),
+            ctypes.byref(nProcInfo),
+            ctypes.cast(buffer,RM_PROCESS_INFO_p),
+            ctypes.byref(dwReason))
+        return dwError,nProcInfoNeeded.value,nProcInfo.value
+
+    def getList(self,session:int)->typing.List[LockHolder]:
+        # the buffer is shared, so only one call can use it at a time
+        with self._lock:
+            return self._getList(session)
+
+    def _getList(self,session:int)->typing.List[LockHolder]:
+        retriedAccessDenied=False
+        for _ in range(self.maxTries):
+            dwError,needed,count=self.rawGetList(session,self.buffer)
+            if dwError==0:
+                break
+            if dwError==ERROR_MORE_DATA:
+                # grow with some headroom, since processes can
+                # come along between the two calls
+                size=max(needed+needed//4+1,len(self.buffer)*2)
+                self.buffer=(RM_PROCESS_INFO*size)()
+                continue
+            if dwError==ERROR_ACCESS_DENIED and not retriedAccessDenied:
+                # sometimes trying again helps
+                retriedAccessDenied=True
+                continue
+            raise _windowsError(dwError)
+        else:
+            raise _windowsError(dwError)
+        ret=[]
+        for i in range(min(count,len(self.buffer))):
+            info=self.buffer[i]
+            appType=info.ApplicationType
+            appType=int(getattr(appType,'value',appType))
+            ret.append(LockHolder(
+                info.Process.dwProcessId,
+                info.Process.ProcessStartTime.value,
+                info.strAppName,
+                RM_APP_TYPE.names.get(appType,''),
+                info.strServiceShortName,
+                bool(info.bRestartable)))
+        return ret
+
+    def endSession(self,session:int)->None:
+        getRstrtmgr().RmEndSession(session)
+
+
+sharedRestartManager:typing.Optional[RestartManager]=None
+def getRestartManager()->RestartManager:
+    """
+    The shared restart manager
+    (created on first use, so its buffer is reused between calls)
+    """
+    global sharedRestartManager
+    if sharedRestartManager is None:
+        sharedRestartManager=WindowsRestartManager()
+    return sharedRestartManager
+
+
+def setRestartManager(manager:typing.Optional[RestartManager])->None:
+    """
+    Replace the shared restart manager
+    (eg with a different initialSize, or a fake)
+    """
+    global sharedRestartManager
+    sharedRestartManager=manager
+
+
+def _iterPaths(
+    filename:str,
+    recursive:bool,
+    ignore:typing.Collection[str]
+    )->typing.Generator[str,None,None]:
+    """
+    A path and, if recursive, everything under it
+    (each exactly once)
+    """
+    if filename in ignore:
+        return
+    yield filename
+    if recursive and os.path.isdir(filename):
+        for root,dirs,files in os.walk(filename):
+            dirs[:]=[d for d in dirs if os.path.join(root,d) not in ignore]
+            for name in dirs+files:
+                path=os.path.join(root,name)
+                if path not in ignore:
+                    yield path
+
+
+def _chunks(
+    items:typing.Iterable[str],
+    chunkSize:int
+    )->typing.Generator[typing.List[str],None,None]:
+    chunk=[]
+    for item in items:
+        chunk.append(item)
+        if len(chunk)>=chunkSize:
+            yield chunk
+            chunk=[]
+    if chunk:
+        yield chunk
+
+
+def _findCulprits(
+    restartManager:RestartManager,
+    filenames:typing.List[str],
+    processes:typing.List[LockHolder]
+    )->typing.Generator[typing.Tuple[str,typing.List[LockHolder]],None,None]:
+    """
+    Narrow down which of the files the processes are using
+    by splitting the list in half until we get to single files
+    """
+    if not processes:
+        return
+    if len(filenames)==1:
+        yield filenames[0],processes
+        return
+    middle=len(filenames)//2
+    first=filenames[:middle]
+    firstProcesses=restartManager.query(first)
+    yield from _findCulprits(restartManager,first,firstProcesses)
+    second=filenames[middle:]
+    if not firstProcesses:
+        # nothing in the first half, so it's all in the second half
+        # and there is no need to ask again
+        secondProcesses=processes
+    else:
+        secondProcesses=restartManager.query(second)
+    yield from _findCulprits(restartManager,second,secondProcesses)
+
+
+def _processLockingFileRm(
+    filename:str,
+    recursive:bool=False,
+    ignore:typing.Optional[typing.Iterable[str]]=None,
+    restartManager:typing.Optional[RestartManager]=None,
+    chunkSize:int=1000
+    )->typing.Generator[ProcessInfo,None,None]:
+    """
+    Restart manager implementation of processLockingFile()
+
+    Files are registered chunkSize at a time, so a recursive
+    scan takes one session per chunk rather than one per file,
+    and each process is only returned once.
+    """
+    if restartManager is None:
+        restartManager=getRestartManager()
+    ignore=set(ignore) if ignore is not None else set()
+    seen:typing.Set[typing.Tuple[int,int]]=set()
+    for chunk in _chunks(_iterPaths(filename,recursive,ignore),chunkSize):
+        for holder in restartManager.query(chunk):
+            key=(holder.pid,holder.processStartTime)
+            if key not in seen:
+                seen.add(key)
+                yield holder.processInfo()
+
+
+def procOpenFiles(
+    procDir:str='/proc'
+    )->typing.Dict[str,typing.Set[int]]:
+    """
+    Scan the whole linux process table once for every path that
+    is in use: open file descriptors, memory mapped files
+    (eg shared libraries) and current working directories
+
+    Processes we are not allowed to look at are skipped
+
+    returns {path:set(pids)}
+    """
+    ret:typing.Dict[str,typing.Set[int]]={}
+    def add(path:str,pid:int):
+        if not path.startswith('/'):
+            return # socket:[1234], pipe:[1234], anon_inode:..., etc
+        if path.endswith(' (deleted)'):
+            path=path[:-10]
+        pids=ret.get(path)
+        if pids is None:
+            ret[path]={pid}
+        else:
+            pids.add(pid)
+    try:
+        entries=os.listdir(procDir)
+    except FileNotFoundError:
+        return ret
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        pid=int(entry)
+        pidDir=os.path.join(procDir,entry)
+        try:
+            add(os.readlink(os.path.join(pidDir,'cwd')),pid)
+        except OSError:
+            pass
+        fdDir=os.path.join(pidDir,'fd')
+        try:
+            fds=os.listdir(fdDir)
+        except OSError:
+            fds=[]
+        for fd in fds:
+            try:
+                add(os.readlink(os.path.join(fdDir,fd)),pid)
+            except OSError:
+                pass
+        try:
+            with open(os.path.join(pidDir,'maps'),'r',
+                encoding='utf-8',errors='replace') as f:
+                for line in f:
+                    # address perms offset dev inode pathname
+                    parts=line.rstrip('\n').split(None,5)
+                    if len(parts)==6:
+                        add(parts[5],pid)
+        except OSError:
+            pass
+    return ret
+
+
+@dataclass(frozen=True)
+class ProcessRecord:
+    """
+    Everything a ProcessTable knows about one process
+
+    Times are in windows units on every os
+    (FILETIME for start/exit, 100ns ticks for cpu times)
+    """
+    pid:int
+    processStartTime:int
+    name:str=''
+    fullName:str=''
+    processExitTime:int=0
+    processKernelTime:int=0
+    processUserTime:int=0
+
+    def processInfo(self,appType:str='')->ProcessInfo:
+        """
+        A ProcessInfo with everything already filled in
+        """
+        return ProcessInfo(self.name,self.pid,appType,self.fullName,
+            self.processStartTime,self.processExitTime,
+            self.processKernelTime,self.processUserTime)
+
+
+class ProcessTable:
+    """
+    A snapshot of every process on the system, taken in one pass
+    and reused until it is ttl seconds old.
+
+    Entries are keyed by (pid,start time), so a pid that has been
+    reused by a new process is never mistaken for the old one.
+    """
+
+    def __init__(self,ttl:float=2.0,minRefresh:float=0.25):
+        """
+        :ttl: how long a snapshot is good for
+        :minRefresh: never take snapshots closer together than this
+            (even when asked about a process we have not seen)
+        """
+        self.ttl=ttl
+        self.minRefresh=minRefresh
+        self._records:typing.Dict[typing.Tuple[int,int],ProcessRecord]={}
+        self._byPid:typing.Dict[int,ProcessRecord]={}
+        self._taken:typing.Optional[float]=None
+        self._lock=threading.Lock()
+        self.snapshots=0
+
+    def takeSnapshot(self)->typing.Iterable[ProcessRecord]:
+        """
+        Collect a record for every process (override this)
+        """
+        raise NotImplementedError()
+
+    def refresh(self)->None:
+        """
+        Take a new snapshot now
+        """
+        records={}
+        byPid={}
+        for record in self.takeSnapshot():
+            records[(record.pid,record.processStartTime)]=record
+            byPid[record.pid]=record
+        with self._lock:
+            self._records=records
+            self._byPid=byPid
+            self._taken=time.monotonic()
+            self.snapshots+=1
+
+    def _age(self)->float:
+        if self._taken is None:
+            return float('inf')
+        return time.monotonic()-self._taken
+
+    def get(self,pid:int,processStartTime:int=0
+        )->typing.Optional[ProcessRecord]:
+        """
+        Look up a process
+
+        :processStartTime: the FILETIME the process started
+            (0=whatever process has that pid now)
+
+        returns None if there is no such process
+        """
+        if self._age()>self.ttl:
+            self.refresh()
+        for tries in range(2):
+            with self._lock:
+                if processStartTime==0:
+                    record=self._byPid.get(pid)
+                else:
+                    record=self._records.get((pid,processStartTime))
+            if record is not None or tries>0 \
+                or self._age()<self.minRefresh:
+                #
+                return record
+            # may have started since the snapshot
+            self.refresh()
+        return None
+
+    def __iter__(self)->typing.Iterator[ProcessRecord]:
+        if self._age()>self.ttl:
+            self.refresh()
+        with self._lock:
+            return iter(list(self._records.values()))
+
+
+class ProcProcessTable(ProcessTable):
+    """
+    Process table read from linux /proc
+    """
+
+    def __init__(self,ttl:float=2.0,minRefresh:float=0.25,
+        procDir:str='/proc'):
+        ProcessTable.__init__(self,ttl,minRefresh)
+        self.procDir=procDir
+        self._bootTime:typing.Optional[float]=None
+        self._clockTicks=os.sysconf('SC_CLK_TCK')
+
+    def bootTime(self)->float:
+        """
+        When the system booted, as a posix timestamp
+        """
+        if self._bootTime is None:
+            self._bootTime=0.0
+            with open(os.path.join(self.procDir,'stat'),'r',
+                encoding='utf-8') as f:
+                for line in f:
+                    if line.startswith('btime '):
+                        self._bootTime=float(line.split()[1])
+                        break
+        return self._bootTime
+
+    def readProcess(self,pid:int)->typing.Optional[ProcessRecord]:
+        """
+        Read /proc/<pid>/stat and cmdline
+
+        returns None if the process has gone away
+        """
+        pidDir=os.path.join(self.procDir,str(pid))
+        try:
+            with open(os.path.join(pidDir,'stat'),'r',
+                encoding='utf-8',errors='replace') as f:
+                stat=f.read()
+            with open(os.path.join(pidDir,'cmdline'),'rb') as fb:
+                cmdline=fb.read()
+        except OSError:
+            return None
+        # the name is in parentheses and can itself contain spaces or ")"
+        nameEnd=stat.rfind(')')
+        name=stat[stat.find('(')+1:nameEnd]
+        fields=stat[nameEnd+2:].split()
+        toWindowsTicks=WINDOWS_TICKS/self._clockTicks
+        startTime=self.bootTime()+int(fields[19])/self._clockTicks
+        args=[a.decode('utf-8',errors='replace')
+            for a in cmdline.rstrip(b'\0').split(b'\0') if a]
+        return ProcessRecord(pid,posixToFiletime(startTime),name,
+            ' '.join(args) if args else name,0,
+            int(int(fields[12])*toWindowsTicks),
+            int(int(fields[11])*toWindowsTicks))
+
+    def takeSnapshot(self)->typing.Iterable[ProcessRecord]:
+        for entry in os.listdir(self.procDir):
+            if entry.isdigit():
+                record=self.readProcess(int(entry))
+                if record is not None:
+                    yield record
+
+
+class WindowsProcessTable(ProcessTable):
+    """
+    Process table from EnumProcesses, opening each process once
+    """
+
+    PROCESS_QUERY_LIMITED_INFORMATION=0x1000
+
+    def takeSnapshot(self)->typing.Iterable[ProcessRecord]:
+        kernel32=ctypes.windll.kernel32 # type: ignore
+        kernel32.OpenProcess.restype=ctypes.c_void_p
+        kernel32.GetProcessTimes.argtypes=[ctypes.c_void_p]+\
+            [ctypes.POINTER(FILETIME)]*4
+        kernel32.QueryFullProcessImageNameW.argtypes=[ctypes.c_void_p,
+            ctypes.c_uint,ctypes.c_wchar_p,ctypes.POINTER(ctypes.c_uint)]
+        kernel32.CloseHandle.argtypes=[ctypes.c_void_p]
+        size=1024
+        while True:
+            pids=(ctypes.c_uint*size)()
+            needed=ctypes.c_uint()
+            if not kernel32.K32EnumProcesses(
+                pids,ctypes.sizeof(pids),ctypes.byref(needed)):
+                #
+                raise _windowsError(kernel32.GetLastError())
+            if needed.value<ctypes.sizeof(pids):
+                break
+            size*=2
+        ftCreate=FILETIME()
+        ftExit=FILETIME()
+        ftKernel=FILETIME()
+        ftUser=FILETIME()
+        imageName=ctypes.create_unicode_buffer(32768)
+        for pid in pids[:needed.value//ctypes.sizeof(ctypes.c_uint)]:
+            if pid==0:
+                continue
+            hProcess=kernel32.OpenProcess(
+                self.PROCESS_QUERY_LIMITED_INFORMATION,False,pid)
+            if not hProcess:
+                continue
+            try:
+                if not kernel32.GetProcessTimes(hProcess,
+                    ctypes.byref(ftCreate),ctypes.byref(ftExit),
+                    ctypes.byref(ftKernel),ctypes.byref(ftUser)):
+                    #
+                    continue
+                imageNameLen=ctypes.c_uint(len(imageName))
+                if kernel32.QueryFullProcessImageNameW(hProcess,0,
+                    imageName,ctypes.byref(imageNameLen)):
+                    #
+                    fullName=imageName.value
+                else:
+                    fullName=''
+            finally:
+                kernel32.CloseHandle(hProcess)
+            yield ProcessRecord(pid,ftCreate.value,
+                os.path.basename(fullName),fullName,
+                ftExit.value,ftKernel.value,ftUser.value)
+
+
+processTable:typing.Optional[ProcessTable]=None
+def getProcessTable()->ProcessTable:
+    """
+    The shared process table for this os
+    (created on first use)
+    """
+    global processTable
+    if processTable is None:
+        if os.name=='nt':
+            processTable=WindowsProcessTable()
+        else:
+            processTable=ProcProcessTable()
+    return processTable
+
+
+def setProcessTable(table:typing.Optional[ProcessTable])->None:
+    """
+    Replace the shared process table
+    (eg with a different ttl, or a fake)
+    """
+    global processTable
+    processTable=table
+
+
+def _processLockingFileProc(
+    filename:str,
+    recursive:bool=False,
+    noExpand:bool=False,
+    openFiles:typing.Optional[typing.Dict[str,typing.Set[int]]]=None,
+    ignore:typing.Optional[typing.Iterable[str]]=None
+    )->typing.Generator[ProcessInfo,None,None]:
+    """
+    Linux implementation of processLockingFile()
+
+    :openFiles: the result of procOpenFiles()
+        (pass it in to check many files against one scan)
+    :ignore: paths to skip (along with everything under them)
+    """
+    if not noExpand:
+        filename=os.path.expandvars(filename)
+    filename=os.path.realpath(filename)
+    if openFiles is None:
+        openFiles=procOpenFiles()
+    ignored={os.path.realpath(p) for p in (ignore or ())}
+    ignoredPrefixes=tuple(p.rstrip('/')+'/' for p in ignored)
+    pids:typing.Set[int]=set()
+    prefix=filename.rstrip('/')+'/'
+    for path,holders in openFiles.items():
+        if path!=filename and not (recursive and path.startswith(prefix)):
+            continue
+        if path in ignored or path.startswith(ignoredPrefixes):
+            continue
+        pids.update(holders)
+    table=getProcessTable()
+    for pid in sorted(pids):
+        record=table.get(pid)
+        if record is not None:
+            yield record.processInfo()
+
+
 def processLockingFile(
     filename:str,
     recursive:bool=False,
     ignore:typing.Optional[typing.Iterable[str]]=None,
-    noExpand:bool=False
+    noExpand:bool=False,
+    restartManager:typing.Optional[RestartManager]=None,
+    chunkSize:int=1000
     )->typing.Generator[ProcessInfo,None,None]:
     """
     Determine all processes that have locked a given file.
 
     :recursive: if filename is a directory, keep going
         with subdirectories and files
+        (eg to find out who is holding a mount busy)
+    :ignore: paths to skip
     :noExpand: do not try to expand shell variables in the filename
-        (main purpose is so this can be called recursively)
+    :restartManager: use this restart manager instead of the os default
+    :chunkSize: how many files to give the restart manager at a time
 
-    Implementation is to query the "restart manager" to get this information
-    (You know, how every time you try to shut down winda's says
-    "you can't because these apps are preventing it")
+    On windows this asks the restart manager.  Everywhere else
+    the /proc process table is scanned (once per call, no matter
+    how many files are under a recursive directory).
 
-    See also:
-        https://docs.microsoft.com/th-th/windows/win32/api/_rstmgr/
+    Each process is only returned once.
     """
+    if restartManager is None and os.name!='nt':
+        yield from _processLockingFileProc(
+            filename,recursive,noExpand,ignore=ignore)
+        return
     if not noExpand:
         filename=os.path.abspath(os.path.expandvars(filename))
-    if filename in ignore:
+    yield from _processLockingFileRm(
+        filename,recursive,ignore,restartManager,chunkSize)
+
+
+def lockedFiles(
+    filename:str,
+    recursive:bool=False,
+    ignore:typing.Optional[typing.Iterable[str]]=None,
+    noExpand:bool=False,
+    restartManager:typing.Optional[RestartManager]=None,
+    chunkSize:int=1000
+    )->typing.Generator[typing.Tuple[str,typing.List[LockHolder]],None,None]:
+    """
+    Like processLockingFile() but find exactly which files are locked
+
+    With the restart manager, a chunk of files that something is using
+    gets split in half, and so on, until we get down to single files.
+    So an unlocked tree costs one session per chunk, and only the
+    locked parts cost more.
+
+    yields (filename,[LockHolder])
+    """
+    if not noExpand:
+        filename=os.path.abspath(os.path.expandvars(filename))
+    if restartManager is None and os.name!='nt':
+        openFiles=procOpenFiles()
+        ignore=set(ignore) if ignore is not None else set()
+        for path in _iterPaths(os.path.realpath(filename),recursive,ignore):
+            if path in openFiles:
+                records=[getProcessTable().get(pid)
+                    for pid in sorted(openFiles[path])]
+                yield path,[
+                    LockHolder(r.pid,r.processStartTime,r.name)
+                    for r in records if r is not None]
         return
-    if ignore is None:
-        ignore=tuple()
-    print(f'Checking "{filename}"')
-    if not isinstance(ignore,list):
-        ignore=list(ignore)
-    ignore.append(filename)
-    dwSession=ctypes.c_uint()
-    szSessionKey=ctypes.create_unicode_buffer(CCH_RM_SESSION_KEY+1)
-    dwError=rstrtmgr.RmStartSession(ctypes.pointer(dwSession),0,szSessionKey)
-    #print(f'RmStartSession key={szSessionKey.value} session={dwSession.value}') # noqa: E501 # pylint: disable=line-too-long
-    if dwError!=0: # success
-        raise Exception('[Windows error 0x%02X] %s'%(
-            dwError,win32api.FormatMessage(dwError)))
-    pszFile=ctypes.c_wchar_p(filename)
-    numFiles=1
-    dwError=rstrtmgr.RmRegisterResources(
-        dwSession,numFiles,ctypes.byref(pszFile),0,None,0,None)
-    #print(f'RmRegisterResources({pszFile.value})')
-    if dwError!=0: # success
-        raise Exception('[Windows error 0x%02X] %s'%(
-            dwError,win32api.FormatMessage(dwError)))
-    dwReason=ctypes.c_uint()
-    nProcInfoNeeded=ctypes.c_uint()
-    numProcs=10
-    nProcInfo=ctypes.c_uint(numProcs)
-    rgpi=(RM_PROCESS_INFO*numProcs)()
-    pRgpi=ctypes.cast(rgpi,ctypes.POINTER(RM_PROCESS_INFO))
-    dwError=rstrtmgr.RmGetList(
-        dwSession,
-        ctypes.byref(nProcInfoNeeded),
-        ctypes.byref(nProcInfo),
-        pRgpi,
-        ctypes.byref(dwReason))
-    if dwError==5:
-        # ACCESS_DENIED - sometimes trying again helps
-        dwError=rstrtmgr.RmGetList(
-            dwSession,
-            ctypes.byref(nProcInfoNeeded),
-            ctypes.byref(nProcInfo),
-            pRgpi,
-            ctypes.byref(dwReason))
-    # See also:
-    # https://docs.microsoft.com/en-us/windows/win32/debug/system-error-codes--0-499-
-    if dwError!=0:
-        raise Exception('[Windows error 0x%02X] %s'%(
-            dwError,win32api.FormatMessage(dwError)))
-    #print(f'RmGetList returned {nProcInfo.value} infos ({nProcInfoNeeded} needed)') # noqa: E501 # pylint: disable=line-too-long
-    for i in range(nProcInfo.value):
-        pi=ProcessInfo(
-            rgpi[i].strAppName,
-            rgpi[i].Process.dwProcessId,
-            rgpi[i].ApplicationType)
-        pi.processStartTime=rgpi[i].Process.ProcessStartTime
-        yield pi
-    rstrtmgr.RmEndSession(dwSession)
-    if recursive and os.path.isdir(filename):
-        for f in os.listdir(filename):
-            yield from processLockingFile(
-                os.sep.join((filename,f)),recursive,ignore,True)
-            yield from processLockingFile(
-                os.sep.join((filename,f)),
-                recursive,
-                ignore,
-                True)
+    if restartManager is None:
+        restartManager=getRestartManager()
+    ignore=set(ignore) if ignore is not None else set()
+    for chunk in _chunks(_iterPaths(filename,recursive,ignore),chunkSize):
+        yield from _findCulprits(
+            restartManager,chunk,restartManager.query(chunk))
+
+
+LockEvent=typing.Dict[str,typing.Any]
+
+
+class LockWatcher:
+    """
+    Keep checking a set of paths and report whenever a process
+    starts or stops using one of them.
+
+    With /proc, one scan answers for every path, so all paths are
+    checked together once per interval.  With the restart manager,
+    which costs a query per path, the paths are spread over a number
+    of time slots across the interval so the queries are evenly spaced
+    rather than all at once.
+
+    Only the locks currently held are remembered, so memory stays
+    the same no matter how long it runs.
+
+    clock(), sleep() and scanOpenFiles() are the only parts that touch
+    the real clock or /proc, so override them to test the scheduling.
+    """
+
+    def __init__(self,
+        paths:typing.Iterable[str],
+        interval:float=5.0,
+        recursive:bool=False,
+        onEvent:typing.Optional[typing.Callable[[LockEvent],None]]=None,
+        slots:int=10,
+        restartManager:typing.Optional[RestartManager]=None):
+        """
+        :interval: seconds between checks of any given path
+        :recursive: also watch everything under directories
+        :onEvent: called with each event
+            (default=print it as a line of json)
+        :slots: the most checks to do per interval
+            (restart manager only, /proc always uses one)
+        :restartManager: use this restart manager instead of the os default
+        """
+        self.paths=[os.path.abspath(os.path.expandvars(p)) for p in paths]
+        self.interval=interval
+        self.recursive=recursive
+        if onEvent is None:
+            onEvent=self.printEvent
+        self.onEvent=onEvent
+        self.restartManager=restartManager
+        self.useProc=restartManager is None and os.name!='nt'
+        if self.useProc:
+            slots=1
+        self.slots=max(1,min(slots,len(self.paths)))
+        # {path:{(pid,start time):(ProcessInfo,when first seen)}}
+        self.holders:typing.Dict[str,typing.Dict[typing.Tuple[int,int],
+            typing.Tuple[ProcessInfo,float]]]={}
+        self.errors:typing.Dict[str,str]={}
+        self._stop=threading.Event()
+
+    @staticmethod
+    def printEvent(event:LockEvent)->None:
+        """
+        Print an event as a line of json
+        """
+        print(json.dumps(event),flush=True)
+
+    def stop(self)->None:
+        """
+        Stop watching (from another thread)
+        """
+        self._stop.set()
+
+    def clock(self)->float:
+        """
+        Seconds on a monotonic clock
+        """
+        return time.monotonic()
+
+    def sleep(self,seconds:float)->bool:
+        """
+        Wait for a number of seconds
+
+        returns True if stop() was called in the meantime
+        """
+        return self._stop.wait(seconds)
+
+    def scanOpenFiles(self)->typing.Dict[str,typing.Set[int]]:
+        """
+        Scan /proc for every open path (see procOpenFiles())
+        """
+        return procOpenFiles()
+
+    def _current(self,paths:typing.Sequence[str]
+        )->typing.Dict[str,typing.Union[typing.List[ProcessInfo],Exception]]:
+        """
+        Who is using each path right now
+        """
+        ret:typing.Dict[str,typing.Union[
+            typing.List[ProcessInfo],Exception]]={}
+        if self.useProc:
+            openFiles=self.scanOpenFiles()
+            for path in paths:
+                ret[path]=list(_processLockingFileProc(
+                    path,self.recursive,True,openFiles))
+            return ret
+        for path in paths:
+            try:
+                ret[path]=list(processLockingFile(path,self.recursive,
+                    noExpand=True,restartManager=self.restartManager))
+            except Exception as e: # pylint: disable=broad-except
+                ret[path]=e
+        return ret
+
+    def check(self,paths:typing.Sequence[str])->None:
+        """
+        Check some paths now and report any changes
+        """
+        now=time.time()
+        for path,processes in self._current(paths).items():
+            if isinstance(processes,Exception):
+                message=str(processes)
+                if self.errors.get(path)!=message:
+                    self.errors[path]=message
+                    self.onEvent({'event':'error','time':now,
+                        'path':path,'message':message})
+                continue
+            self.errors.pop(path,None)
+            held=self.holders.get(path,{})
+            current={(pi.pid,pi.processStartTime):pi for pi in processes}
+            for key,pi in current.items():
+                if key not in held:
+                    held[key]=(pi,now)
+                    self.onEvent(self._event('acquired',now,path,pi))
+            for key in [k for k in held if k not in current]:
+                pi,since=held.pop(key)
+                event=self._event('released',now,path,pi)
+                event['heldFor']=round(now-since,3)
+                self.onEvent(event)
+            if held:
+                self.holders[path]=held
+            else:
+                self.holders.pop(path,None)
+
+    def _event(self,name:str,now:float,path:str,pi:ProcessInfo)->LockEvent:
+        event:LockEvent={'event':name,'time':now,'path':path,
+            'pid':pi.pid,'name':pi.name}
+        if pi.processStartTime:
+            event['processStartTime']=filetimeToPosix(pi.processStartTime)
+        return event
+
+    def run(self,duration:typing.Optional[float]=None)->None:
+        """
+        Watch until stop() is called
+
+        :duration: stop after this many seconds
+        """
+        self._stop.clear()
+        start=self.clock()
+        end=None if duration is None else start+duration
+        schedule=[(start+self.interval*slot/self.slots,slot)
+            for slot in range(self.slots)]
+        while not self._stop.is_set():
+            due,slot=min(schedule)
+            if end is not None and due>end:
+                break
+            if self.sleep(max(0.0,due-self.clock())):
+                break
+            self.check(self.paths[slot::self.slots])
+            nextDue=due+self.interval
+            now=self.clock()
+            if nextDue<now:
+                # fell behind, so skip ahead rather than bunching up
+                nextDue=now+self.interval
+            schedule[slot]=(nextDue,slot)
+
 
 def cmdline(args:typing.Iterable[str])->int:
     """
@@ -290,16 +1110,26 @@ def cmdline(args:typing.Iterable[str])->int:
     didSomething=False
     printhelp=False
     recursive=False
+    watch=False
+    interval=5.0
+    watchPaths=[]
     for arg in args:
         if arg.startswith('-'):
             av=arg.split('=',1)
             av[0]=av[0].lower()
             if av[0] in ('-h','--help'):
                 printhelp=True
+            elif av[0] in ('-r',):
+                recursive=True
+            elif av[0] in ('--watch',):
+                watch=True
+                if len(av)>1:
+                    interval=float(av[1])
             else:
+                print(f'ERR: Unknown argument "{arg}"')
                 printhelp=True
-            if av[0] in ('-r',):
-                recursive=True
+        elif watch:
+            watchPaths.append(arg)
         else:
             procs=list(processLockingFile(arg,recursive))
             print(f'{len(procs)} process(es) locking "{arg}"')
@@ -307,11 +1137,18 @@ def cmdline(args:typing.Iterable[str])->int:
             for p in procs:
                 print(p)
             didSomething=True
+    if watchPaths and not printhelp:
+        try:
+            LockWatcher(watchPaths,interval,recursive).run()
+        except KeyboardInterrupt:
+            pass
+        didSomething=True
     if printhelp or not didSomething:
         print('USEAGE:')
         print('  whoLockedFile [options] [filename]')
         print('OPTIONS:')
         print('  -r ............................. recursive (keep going till you find one)') # noqa: E501 # pylint: disable=line-too-long
+        print('  --watch[=seconds] .............. keep checking the filenames that follow and print lock changes as json lines (default=5 seconds)') # noqa: E501 # pylint: disable=line-too-long
         print('  -h ............................. this help')
         return 1
     return 0
@@ -1,32 +1,119 @@
 """
 List named pipes in windows
+(and their nearest equivalents, fifos and unix sockets, elsewhere)
 """
 import typing
-import typing
+import os
+import stat
 import time
-import subprocess
-import win32pipe # type: ignore
-import win32file # type: ignore
-#import pywintypes # type: ignore
+import fnmatch
+import itertools
+
+
+WINDOWS_PIPE_DIR='\\\\.\\pipe\\'
+
+# where to look for fifos on posix systems
+fifoDirectories:typing.List[str]=['/tmp','/run','/var/run','/dev/shm']
+
+
+def _listFifos(
+    directories:typing.Iterable[str],
+    recursive:bool=False
+    )->typing.Generator[str,None,None]:
+    """
+    Find fifos in directories
+    (symlinks are not followed and unreadable directories are skipped)
+    """
+    stack=list(directories)
+    while stack:
+        directory=stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        st=entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if stat.S_ISFIFO(st.st_mode):
+                        yield entry.path
+                    elif recursive and stat.S_ISDIR(st.st_mode):
+                        stack.append(entry.path)
+        except OSError:
+            continue
+
+
+def _listUnixSockets(
+    procNetUnix:str='/proc/net/unix'
+    )->typing.Generator[str,None,None]:
+    """
+    Unix domain sockets that have a name
+    (abstract ones start with "@")
+    """
+    seen:typing.Set[str]=set()
+    try:
+        f=open(procNetUnix,'r',encoding='utf-8',errors='replace')
+    except OSError:
+        return
+    with f:
+        next(f,None) # Num RefCount Protocol Flags Type St Inode Path
+        for line in f:
+            parts=line.split(None,7)
+            if len(parts)<8:
+                continue # unnamed
+            name=parts[7].rstrip('\n')
+            if name not in seen:
+                seen.add(name)
+                yield name
 
 
-def listPipes()->typing.Iterable[str]:
+def listPipes(
+    pattern:str='*',
+    directories:typing.Optional[typing.Iterable[str]]=None,
+    recursive:bool=False,
+    includeSockets:bool=True
+    )->typing.Generator[str,None,None]:
     """
-    Generate a list of all windows named pipes
+    Generate the names of all named pipes
+
+    :pattern: only names matching this glob
+        (tried against the whole name, just the last part of the path,
+        and an abstract socket's name without its "@", so "*.sock" or
+        "dbus*" work without knowing where the pipe lives)
+    :directories: where to look for fifos on posix
+        (default=fifoDirectories)
+    :recursive: also look for fifos in subdirectories
+    :includeSockets: on posix, also include named unix sockets
+
+    On windows, names are as they appear under \\\\.\\pipe\\
+    Elsewhere they are the full path of a fifo or socket
+    (or "@name" for abstract sockets)
     """
-    cmd=['powershell','-c','get-childitem',r'\\.\pipe\\']
-    po=subprocess.Popen(cmd,stdout=subprocess.PIPE)
-    out:typing.Union[bytes,str]
-    out,_=po.communicate()
-    if not isinstance(out,str):
-        out=out.decode('utf-8',errors='ignore')
-    return [x.rstrip() for x in out.split('\n')]
+    if os.name=='nt':
+        names:typing.Iterable[str]=(
+            entry.name for entry in os.scandir(WINDOWS_PIPE_DIR))
+    else:
+        if directories is None:
+            directories=fifoDirectories
+        names=_listFifos(directories,recursive)
+        if includeSockets:
+            names=itertools.chain(names,_listUnixSockets())
+    if pattern=='*':
+        yield from names
+        return
+    for name in names:
+        if fnmatch.fnmatch(name,pattern) \
+            or fnmatch.fnmatch(os.path.basename(name),pattern) \
+            or (name.startswith('@') and fnmatch.fnmatch(name[1:],pattern)):
+            #
+            yield name
 
 
 def pipe_server():
     """
     Start a pipe server
     """
+    import win32pipe # type: ignore
+    import win32file # type: ignore
     print("pipe server")
     count=0
     pipe=win32pipe.CreateNamedPipe(
@@ -58,6 +145,8 @@ def pipe_client(name:str):
     """
     Start a pipe client
     """
+    import win32pipe # type: ignore
+    import win32file # type: ignore
     print("pipe client")
     quitLoop=False
     while not quitLoop:
@@ -88,6 +177,6 @@ def pipe_client(name:str):
 
 
 if __name__=='__main__':
-    #import sys
-    for line in listPipes():
-        print(line)
+    import sys
+    for name in listPipes(*sys.argv[1:2]):
+        print(name)